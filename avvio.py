@@ -0,0 +1,142 @@
+# avvio.py - CARICAMENTO PIGRO DEGLI ARTEFATTI E PROFILO DI AVVIO
+import builtins
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+
+class ArtefattoLazy:
+    """
+    Segnaposto per un file .pkl: il joblib.load (e quindi l'import di
+    sklearn/LightGBM/CatBoost) avviene solo al primo attributo richiesto,
+    cioè alla prima transform/predict dell'opzione di menu che lo usa.
+    caricatore: funzione path → oggetto al posto di joblib.load (formati nativi).
+    trasforma: funzione opzionale applicata all'oggetto appena caricato.
+    Il caricamento è protetto da un lock: due thread che lo chiedono insieme
+    (menu e produttore delle animazioni) ottengono lo stesso oggetto, letto una volta sola.
+    """
+
+    def __init__(self, path, descrizione="Artefatto", trasforma=None, caricatore=None):
+        self._path = path
+        self._descrizione = descrizione
+        self._trasforma = trasforma
+        self._caricatore = caricatore
+        self._oggetto = None
+        self._lock = threading.Lock()
+
+    @property
+    def caricato(self):
+        return self._oggetto is not None
+
+    def carica(self):
+        if self._oggetto is None:
+            with self._lock:
+                # Ricontrollato sotto il lock: un altro thread può averlo appena caricato
+                if self._oggetto is None:
+                    inizio = time.perf_counter()
+                    if self._caricatore is not None:
+                        oggetto = self._caricatore(self._path)
+                    else:
+                        import joblib
+                        oggetto = joblib.load(self._path)
+                    self._oggetto = self._trasforma(oggetto) if self._trasforma else oggetto
+                    print(f" {self._descrizione} caricato ({time.perf_counter() - inizio:.2f}s)")
+        return self._oggetto
+
+    def __getstate__(self):
+        # Il lock non si può serializzare (processi dei worker)
+        stato = self.__dict__.copy()
+        del stato['_lock']
+        return stato
+
+    def __setstate__(self, stato):
+        self.__dict__.update(stato)
+        self._lock = threading.Lock()
+
+    def __getattr__(self, nome):
+        # Chiamato solo per attributi non definiti sul segnaposto
+        if nome.startswith('_'):
+            raise AttributeError(nome)
+        return getattr(self.carica(), nome)
+
+    def __repr__(self):
+        stato = "caricato" if self.caricato else "non ancora caricato"
+        return f"ArtefattoLazy({self._path!r}, {stato})"
+
+
+class ProfiloAvvio:
+    """
+    Misura il tempo di import di ogni pacchetto di primo livello (inclusivo
+    e al netto dei sotto-import di altri pacchetti) e la durata delle fasi
+    di avvio. Attivato da --profile-startup.
+    """
+
+    def __init__(self):
+        self.inizio = time.perf_counter()
+        self.inclusivo = {}
+        self.proprio = {}
+        self.fasi = []
+        self._pila = []
+        self._import_originale = None
+
+    def _import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        radice = name.partition('.')[0]
+        if level != 0 or radice in sys.modules or radice in self.inclusivo:
+            return self._import_originale(name, globals, locals, fromlist, level)
+
+        self.inclusivo[radice] = 0.0
+        self._pila.append(0.0)
+        t0 = time.perf_counter()
+        try:
+            return self._import_originale(name, globals, locals, fromlist, level)
+        finally:
+            durata = time.perf_counter() - t0
+            figli = self._pila.pop()
+            self.inclusivo[radice] = durata
+            self.proprio[radice] = durata - figli
+            if self._pila:
+                self._pila[-1] += durata
+
+    def attiva(self):
+        self._import_originale = builtins.__import__
+        builtins.__import__ = self._import
+
+    def disattiva(self):
+        if self._import_originale is not None:
+            builtins.__import__ = self._import_originale
+            self._import_originale = None
+
+    @contextmanager
+    def fase(self, nome):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.fasi.append((nome, time.perf_counter() - t0))
+
+    def stampa(self, top=15):
+        totale = time.perf_counter() - self.inizio
+        print("\n" + "="*55)
+        print("⏱️  PROFILO DI AVVIO".center(55))
+        print("="*55)
+        print(f"  Tempo totale dall'avvio: {totale*1000:8.1f} ms\n")
+        print(f"  {'Pacchetto':25s} {'incl. ms':>10s} {'proprio ms':>11s}")
+        ordinati = sorted(self.inclusivo.items(), key=lambda kv: kv[1], reverse=True)
+        for nome, durata in ordinati[:top]:
+            print(f"  {nome:25s} {durata*1000:10.1f} {self.proprio.get(nome, 0)*1000:11.1f}")
+        if self.fasi:
+            print(f"\n  {'Fase':25s} {'ms':>10s}")
+            for nome, durata in self.fasi:
+                print(f"  {nome:25s} {durata*1000:10.1f}")
+        print("="*55)
+
+
+def profilo_da_argv(argv=None):
+    """Crea e attiva il profilo prima degli import pesanti se richiesto da riga di comando."""
+    argv = sys.argv if argv is None else argv
+    if "--profile-startup" not in argv:
+        return None
+    profilo = ProfiloAvvio()
+    profilo.attiva()
+    return profilo
@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+"""
+Benchmark dei percorsi principali su un dataset sintetico con la forma di spotify_clean.csv.
+
+Uso:
+    python benchmark.py --righe 100000 --output benchmark_baseline.json
+    python benchmark.py --righe 100000 --confronta benchmark_baseline.json
+
+Non servono dati Spotify reali: le categorie vengono dai vocabolari del
+preprocessor salvato, i valori numerici sono estratti a caso. Tutto gira in
+una cartella temporanea con i soli artefatti (.pkl) del progetto.
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("MPLBACKEND", "Agg")  # i grafici vengono creati ma non mostrati
+
+import numpy as np
+import pandas as pd
+import joblib
+
+CARTELLA_PROGETTO = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, CARTELLA_PROGETTO)
+
+ARTEFATTI = ["X_columns.pkl", "scaler_preprocessor.pkl", "rf_model.pkl",
+             "lgbm_model.pkl", "cat_model.pkl", "ensemble_pesi.json", "modello.bundle"]
+BLOCCO_GENERAZIONE = 500_000
+
+
+# --- DATASET SINTETICO ---
+
+def genera_dataset_sintetico(path, n, preprocessor, seed=0):
+    """
+    Scrive in path un CSV di n tracce con lo schema grezzo di spotify_clean.csv
+    (prima della rigenerazione delle feature), a blocchi per non tenere in
+    memoria 10M di righe.
+    """
+    rng = np.random.default_rng(seed)
+    cat = preprocessor.named_transformers_['cat']
+    vocabolari = dict(zip(cat.feature_names_in_, cat.categories_))
+    label = np.array([v for v in vocabolari['label_grouped'] if v != 'Other'], dtype=object)
+    inizio_date = np.datetime64('2015-01-01')
+
+    for offset in range(0, n, BLOCCO_GENERAZIONE):
+        m = min(BLOCCO_GENERAZIONE, n - offset)
+        date = inizio_date + rng.integers(0, 3800, m).astype('timedelta64[D]')
+        blocco = pd.DataFrame({
+            'track_id': [f"t{i}" for i in range(offset, offset + m)],
+            'track_name': 'track', 'artist_name': 'artist', 'album_name': 'album',
+            'release_date': np.datetime_as_string(date, unit='D'),
+            'genre': rng.choice(vocabolari['genre'], m),
+            'popularity': rng.integers(0, 101, m),
+            'danceability': rng.uniform(0.05, 0.99, m),
+            'energy': rng.uniform(0.02, 0.99, m),
+            'key': rng.integers(0, 12, m),
+            'loudness': rng.uniform(-40, 0, m),
+            'mode': rng.integers(0, 2, m),
+            'instrumentalness': rng.uniform(0, 1, m),
+            'tempo': rng.uniform(60, 200, m),
+            'stream_count': rng.integers(1_000, 100_000_000, m),
+            'country': rng.choice(vocabolari['country'], m),
+            'explicit': rng.random(m) < 0.3,
+            # Ogni label abbastanza frequente da non finire in 'Other' (sconosciuta al modello)
+            'label': label[(np.arange(offset, offset + m)) % len(label)],
+            'duration_s': rng.uniform(90, 420, m),
+        })
+        blocco.to_csv(path, mode='w' if offset == 0 else 'a', header=offset == 0, index=False)
+
+
+# --- MISURE ---
+
+def rss_picco_mb():
+    # ru_maxrss è in KB su Linux, in byte su macOS
+    picco = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return picco / (1024 * 1024) if sys.platform == 'darwin' else picco / 1024
+
+
+@contextlib.contextmanager
+def silenzioso():
+    with open(os.devnull, 'w') as nulla, contextlib.redirect_stdout(nulla):
+        yield
+
+
+def misura(nome, funzione, ripetizioni=1, elementi=1):
+    """
+    Esegue funzione() `ripetizioni` volte e riassume le latenze.
+    elementi: unità di lavoro per chiamata (righe, tracce) per il throughput.
+    """
+    latenze = np.empty(ripetizioni)
+    for i in range(ripetizioni):
+        t0 = time.perf_counter()
+        with silenzioso():
+            funzione()
+        latenze[i] = time.perf_counter() - t0
+    totale = float(latenze.sum())
+    risultato = {
+        'chiamate': ripetizioni,
+        'totale_s': totale,
+        'throughput_al_s': ripetizioni * elementi / totale if totale > 0 else None,
+        'p50_ms': float(np.percentile(latenze, 50) * 1000),
+        'p90_ms': float(np.percentile(latenze, 90) * 1000),
+        'p99_ms': float(np.percentile(latenze, 99) * 1000),
+        'rss_picco_mb': rss_picco_mb(),
+    }
+    print(f"  {nome:28s} p50 {risultato['p50_ms']:10.3f} ms  p99 {risultato['p99_ms']:10.3f} ms  "
+          f"{risultato['throughput_al_s'] or 0:14,.1f} /s  RSS {risultato['rss_picco_mb']:8.1f} MB")
+    return risultato
+
+
+# --- SUITE ---
+
+def esegui_benchmark(righe, ripetizioni, n_generazione, seed=0, artefatti=CARTELLA_PROGETTO):
+    import matplotlib.pyplot as plt
+
+    cartella = tempfile.mkdtemp(prefix="spotify_bench_")
+    origine = os.getcwd()
+    try:
+        for nome in ARTEFATTI:
+            path = os.path.abspath(os.path.join(artefatti, nome))
+            if os.path.exists(path):
+                os.symlink(path, os.path.join(cartella, nome))
+        os.chdir(cartella)
+
+        preprocessor = joblib.load("scaler_preprocessor.pkl")
+        t0 = time.perf_counter()
+        genera_dataset_sintetico("spotify_clean.csv", righe, preprocessor, seed=seed)
+        print(f"  Dataset sintetico: {righe:,} righe in {time.perf_counter() - t0:.1f}s\n")
+
+        import file as rigenerazione
+        from main import carica_risorse
+        from utils import (genera_traccia_casuale, generatore_hit, paesi_hit,
+                           predici_batch, predici_da_input, genera_tracce_batch)
+
+        risultati = {}
+        risultati['rigenerazione_feature'] = misura(
+            "rigenerazione_feature", rigenerazione.rigenerazione_completa, elementi=righe)
+
+        # Avvio a freddo (senza cache colonnare né profilo) misurato a parte; poi avvii
+        # a caldo ripetuti, che ripartono dalla cache su disco del CSV
+        from cache_dataset import CACHE_DIR
+        from profilo import PROFILO_PATH
+        shutil.rmtree(CACHE_DIR, ignore_errors=True)
+        if os.path.exists(PROFILO_PATH):
+            os.remove(PROFILO_PATH)
+        risorse = {}
+
+        def carica():
+            risorse['valori'] = carica_risorse()
+        risultati['carica_risorse_freddo'] = misura("carica_risorse_freddo", carica)
+        risultati['carica_risorse'] = misura("carica_risorse", carica, ripetizioni=min(ripetizioni, 20))
+        df, X_columns, preprocessor, final_system, profilo = risorse['valori']
+        with silenzioso():
+            preprocessor.carica()
+            for modello in getattr(final_system, 'modelli', {'modello': final_system}).values():
+                modello.carica()
+
+        rng = np.random.default_rng(seed)
+        risultati['genera_traccia_casuale'] = misura(
+            "genera_traccia_casuale", lambda: genera_traccia_casuale(df, X_columns, profilo, rng),
+            ripetizioni=ripetizioni)
+
+        input_casuali = iter([
+            {'danceability': d, 'energy': e, 'loudness': l}
+            for d, e, l in zip(rng.uniform(0, 1, ripetizioni + 1), rng.uniform(0, 1, ripetizioni + 1),
+                               rng.uniform(-60, 5, ripetizioni + 1))
+        ])
+        predici_da_input(df, X_columns, preprocessor, final_system, next(input_casuali), profilo, rng=rng)
+        risultati['predizione_singola'] = misura(
+            "predizione_singola",
+            lambda: predici_da_input(df, X_columns, preprocessor, final_system, next(input_casuali), profilo,
+                                     rng=rng),
+            ripetizioni=ripetizioni)
+
+        df_batch = genera_tracce_batch(df, X_columns, n_generazione, profilo=profilo, rng=rng)
+        risultati['predici_batch'] = misura(
+            "predici_batch", lambda: predici_batch(df_batch, preprocessor, final_system),
+            ripetizioni=5, elementi=n_generazione)
+
+        def generatore():
+            generatore_hit(df, X_columns, preprocessor, final_system, n=n_generazione, profilo=profilo, rng=rng)
+            plt.close('all')
+        risultati['generatore_hit'] = misura("generatore_hit", generatore, ripetizioni=3, elementi=n_generazione)
+
+        # Prima chiamata (costruzione dell'indice per paese) e chiamate successive separate
+        soglie = iter(np.random.default_rng(seed).integers(50, 100, ripetizioni + 1))
+
+        def paesi():
+            paesi_hit(df, soglia_hit=int(next(soglie)))
+            plt.close('all')
+        risultati['paesi_hit_prima'] = misura("paesi_hit_prima", paesi)
+        risultati['paesi_hit'] = misura("paesi_hit", paesi, ripetizioni=min(ripetizioni, 20))
+        return risultati
+    finally:
+        os.chdir(origine)
+        shutil.rmtree(cartella, ignore_errors=True)
+
+
+def confronta(risultati, baseline, soglia=0.2):
+    """Stampa le variazioni di p50 rispetto a una baseline; restituisce i benchmark peggiorati."""
+    peggiorati = []
+    print("\n" + "="*70)
+    print(f"📊 Confronto con la baseline (tolleranza {soglia:.0%})")
+    print("="*70)
+    for nome, attuale in risultati.items():
+        if nome not in baseline:
+            continue
+        prima, dopo = baseline[nome]['p50_ms'], attuale['p50_ms']
+        variazione = (dopo - prima) / prima if prima > 0 else 0.0
+        segno = "⚠️ " if variazione > soglia else "✅"
+        print(f"  {segno} {nome:28s} {prima:10.3f} → {dopo:10.3f} ms  ({variazione:+.1%})")
+        if variazione > soglia:
+            peggiorati.append(nome)
+    return peggiorati
+
+
+def versioni():
+    import sklearn
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'sklearn': sklearn.__version__,
+        'piattaforma': platform.platform(),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark dei percorsi principali su dati sintetici")
+    parser.add_argument("--righe", type=int, default=100_000,
+                        help="Righe del dataset sintetico (da 10k a 10M, default 100000)")
+    parser.add_argument("--ripetizioni", type=int, default=200,
+                        help="Chiamate per i benchmark di latenza (default 200)")
+    parser.add_argument("--generazione", type=int, default=10_000,
+                        help="Tracce per predici_batch e generatore_hit (default 10000)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--artefatti", default=CARTELLA_PROGETTO, metavar="CARTELLA",
+                        help="Cartella con X_columns.pkl, preprocessor e modelli (default: quella del progetto)")
+    parser.add_argument("--output", metavar="JSON", help="Salva i risultati (es. benchmark_baseline.json)")
+    parser.add_argument("--confronta", metavar="JSON", help="Baseline con cui confrontare i risultati")
+    parser.add_argument("--tolleranza", type=float, default=0.2,
+                        help="Peggioramento di p50 oltre cui segnalare una regressione (default 0.2 = 20%%)")
+    args = parser.parse_args()
+
+    print("="*70)
+    print(f"⏱️  BENCHMARK SPOTIFY AI - {args.righe:,} righe sintetiche")
+    print("="*70)
+
+    risultati = esegui_benchmark(args.righe, args.ripetizioni, args.generazione,
+                                 seed=args.seed, artefatti=args.artefatti)
+    report = {
+        'righe': args.righe,
+        'ripetizioni': args.ripetizioni,
+        'generazione': args.generazione,
+        'seed': args.seed,
+        'data': time.strftime("%Y-%m-%dT%H:%M:%S"),
+        'versioni': versioni(),
+        'risultati': risultati,
+    }
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\n💾 Risultati salvati in {args.output}")
+
+    if args.confronta:
+        with open(args.confronta) as f:
+            baseline = json.load(f)
+        if baseline.get('righe') != args.righe:
+            print(f"\n⚠️  La baseline usa {baseline.get('righe')} righe, questa esecuzione {args.righe}")
+        peggiorati = confronta(risultati, baseline['risultati'], args.tolleranza)
+        if peggiorati:
+            print(f"\n❌ Regressioni: {', '.join(peggiorati)}")
+            sys.exit(1)
+        print("\n✅ Nessuna regressione oltre la tolleranza")
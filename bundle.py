@@ -0,0 +1,334 @@
+# bundle.py - BUNDLE VERSIONATO DEGLI ARTEFATTI (PREPROCESSOR, FEATURE, PROFILO, MODELLI)
+"""
+Un bundle è una cartella (default modello.bundle/) con:
+- manifest.json: versione del formato, feature, pesi dell'ensemble,
+  sha256 e dimensione di ogni file, versioni delle librerie
+- preprocessore.npz: preprocessor compilato (solo array NumPy, niente pickle sklearn)
+- profilo.json: DatasetProfile del dataset di training
+- campionatore.npz (opzionale): copula delle tracce sintetiche (campionatore.py)
+- modelli nel formato nativo: LightGBM testo, CatBoost .cbm, Random Forest joblib
+  (o array NumPy se compattato con compatta.py)
+
+Uso:
+    python bundle.py crea                  # dagli artefatti .pkl della cartella corrente
+    python bundle.py verifica modello.bundle
+"""
+import hashlib
+import json
+import os
+import platform
+import shutil
+import time
+
+import numpy as np
+
+from avvio import ArtefattoLazy
+
+
+BUNDLE_PATH = "modello.bundle"
+FORMATO_BUNDLE = 1
+MANIFEST = "manifest.json"
+FILE_PREPROCESSORE = "preprocessore.npz"
+FILE_PROFILO = "profilo.json"
+FILE_CAMPIONATORE = "campionatore.npz"
+
+# nome modello → (file nel bundle, formato)
+FORMATI_MODELLO = {
+    'rf': ("rf_model.joblib", "joblib"),
+    'lgbm': ("lgbm_model.txt", "lightgbm-testo"),
+    'cat': ("cat_model.cbm", "catboost-cbm"),
+}
+# Random Forest compattato da compatta.py (array NumPy, niente pickle)
+FORMATO_FORESTA_COMPATTA = ("rf_model.npz", "foresta-compatta")
+# Solo il formato joblib dipende dalla versione della libreria che lo ha scritto
+LIBRERIA_FORMATO = {'joblib': 'sklearn'}
+
+
+def _sha256(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for blocco in iter(lambda: f.read(1 << 20), b''):
+            h.update(blocco)
+    return h.hexdigest()
+
+
+def _versione_minore(versione):
+    return tuple(str(versione).split('.')[:2])
+
+
+def versioni_librerie():
+    versioni = {'python': platform.python_version(), 'numpy': np.__version__}
+    for nome, modulo in (('sklearn', 'sklearn'), ('lightgbm', 'lightgbm'), ('catboost', 'catboost')):
+        try:
+            versioni[nome] = __import__(modulo).__version__
+        except ImportError:
+            pass
+    return versioni
+
+
+# --- CREAZIONE ---
+
+def _formato_modello(nome, modello):
+    if type(modello).__name__ == "ForestaCompatta":
+        return FORMATO_FORESTA_COMPATTA
+    return FORMATI_MODELLO[nome]
+
+
+def _salva_modello(formato, modello, path):
+    if formato == "foresta-compatta":
+        modello.salva(path)
+    elif formato == "lightgbm-testo":
+        getattr(modello, 'booster_', modello).save_model(path)
+    elif formato == "catboost-cbm":
+        modello.save_model(path)
+    else:
+        import joblib
+        # Non compresso: si carica senza decompressione
+        joblib.dump(modello, path)
+
+
+def crea_bundle(path, preprocessor, X_columns, modelli, profilo=None, pesi=None, versione=None,
+                campionatore=None):
+    """
+    Scrive il bundle in path (sostituendo quello esistente solo a scrittura completata).
+    modelli: dict nome → modello addestrato (sottoinsieme di rf/lgbm/cat)
+    pesi: contenuto di ensemble_pesi.json ({'pesi': ..., 'intercetta': ...}) o None
+    campionatore: CampionatoreCopula delle tracce sintetiche o None
+    """
+    from inferenza import compila
+
+    provvisorio = path.rstrip(os.sep) + ".tmp"
+    shutil.rmtree(provvisorio, ignore_errors=True)
+    os.makedirs(provvisorio)
+
+    compila(preprocessor).salva(os.path.join(provvisorio, FILE_PREPROCESSORE))
+    if profilo is not None:
+        profilo.salva_json(os.path.join(provvisorio, FILE_PROFILO))
+    if campionatore is not None:
+        campionatore.salva(os.path.join(provvisorio, FILE_CAMPIONATORE))
+    voci_modelli = {}
+    for nome, modello in modelli.items():
+        nome_file, formato = _formato_modello(nome, modello)
+        _salva_modello(formato, modello, os.path.join(provvisorio, nome_file))
+        voci_modelli[nome] = {'file': nome_file, 'formato': formato}
+
+    manifest = {
+        'formato': FORMATO_BUNDLE,
+        'versione': versione or time.strftime("%Y%m%d-%H%M%S"),
+        'creato': time.strftime("%Y-%m-%dT%H:%M:%S"),
+        'X_columns': list(X_columns),
+        'preprocessore': FILE_PREPROCESSORE,
+        'profilo': FILE_PROFILO if profilo is not None else None,
+        'campionatore': FILE_CAMPIONATORE if campionatore is not None else None,
+        'modelli': voci_modelli,
+        'ensemble': pesi,
+        'versioni': versioni_librerie(),
+        'file': {
+            nome_file: {'sha256': _sha256(os.path.join(provvisorio, nome_file)),
+                        'byte': os.path.getsize(os.path.join(provvisorio, nome_file))}
+            for nome_file in sorted(os.listdir(provvisorio))
+        },
+    }
+    with open(os.path.join(provvisorio, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    vecchio = path.rstrip(os.sep) + ".old"
+    if os.path.exists(path):
+        shutil.rmtree(vecchio, ignore_errors=True)
+        os.replace(path, vecchio)
+    os.replace(provvisorio, path)
+    shutil.rmtree(vecchio, ignore_errors=True)
+    return manifest
+
+
+# --- CARICAMENTO ---
+
+class Bundle:
+    """
+    Apre un bundle leggendo solo il manifest. Preprocessor e modelli sono
+    ArtefattoLazy: ogni file viene verificato (sha256) e caricato al primo uso.
+    """
+
+    def __init__(self, path=BUNDLE_PATH):
+        self.path = path
+        with open(os.path.join(path, MANIFEST)) as f:
+            self.manifest = json.load(f)
+        formato = self.manifest.get('formato')
+        if formato is None or formato > FORMATO_BUNDLE:
+            raise ValueError(f"Bundle {path}: formato {formato} non supportato "
+                             f"(questa versione legge fino al {FORMATO_BUNDLE}), aggiornare il codice")
+
+    @property
+    def versione(self):
+        return self.manifest['versione']
+
+    @property
+    def X_columns(self):
+        return list(self.manifest['X_columns'])
+
+    @property
+    def modelli(self):
+        return list(self.manifest['modelli'])
+
+    def _file(self, nome_file):
+        """Path del file dopo il controllo dello sha256 registrato nel manifest."""
+        path = os.path.join(self.path, nome_file)
+        atteso = self.manifest['file'][nome_file]['sha256']
+        if _sha256(path) != atteso:
+            raise ValueError(f"Bundle {self.path}: checksum di {nome_file} non valido (file modificato o corrotto)")
+        return path
+
+    def _controlla_versione(self, formato, descrizione):
+        libreria = LIBRERIA_FORMATO.get(formato)
+        if libreria is None:
+            return
+        salvata = self.manifest['versioni'].get(libreria)
+        installata = versioni_librerie().get(libreria)
+        if salvata and installata and _versione_minore(salvata) != _versione_minore(installata):
+            print(f"  ⚠️  {descrizione} salvato con {libreria} {salvata}, installato {installata}: "
+                  f"se la predizione fallisce rigenerare il bundle")
+
+    def _carica_preprocessore(self, path):
+        from inferenza import PreprocessorCompilato
+        return PreprocessorCompilato.carica(self._file(os.path.basename(path)))
+
+    def _carica_modello(self, nome, path):
+        voce = self.manifest['modelli'][nome]
+        path = self._file(voce['file'])
+        formato = voce['formato']
+        if formato == "lightgbm-testo":
+            import lightgbm as lgb
+            return lgb.Booster(model_file=path)
+        if formato == "catboost-cbm":
+            from catboost import CatBoostRegressor
+            return CatBoostRegressor().load_model(path)
+        if formato == "foresta-compatta":
+            from compatta import ForestaCompatta
+            return ForestaCompatta.carica(path)
+        if formato == "joblib":
+            import joblib
+            self._controlla_versione(formato, f"Modello {nome}")
+            return joblib.load(path)
+        raise ValueError(f"Bundle {self.path}: formato del modello {nome} sconosciuto ({formato})")
+
+    def preprocessore(self, sparse=False):
+        trasforma = None
+        if sparse:
+            from inferenza import preprocessore_sparse
+            trasforma = preprocessore_sparse
+        return ArtefattoLazy(os.path.join(self.path, self.manifest['preprocessore']),
+                             "Preprocessor (CSR)" if sparse else "Preprocessor",
+                             trasforma=trasforma, caricatore=self._carica_preprocessore)
+
+    def modello(self, nome):
+        if nome not in self.manifest['modelli']:
+            raise ValueError(f"Modello {nome} non presente nel bundle (disponibili: {', '.join(self.modelli)})")
+        return ArtefattoLazy(os.path.join(self.path, self.manifest['modelli'][nome]['file']),
+                             f"Modello {nome}", caricatore=lambda path: self._carica_modello(nome, path))
+
+    def profilo(self):
+        if not self.manifest.get('profilo'):
+            return None
+        from profilo import DatasetProfile
+        return DatasetProfile.carica_json(self._file(self.manifest['profilo']))
+
+    def campionatore(self):
+        """ArtefattoLazy del campionatore delle tracce sintetiche, None se il bundle non lo contiene."""
+        if not self.manifest.get('campionatore'):
+            return None
+        from campionatore import CampionatoreCopula
+        return ArtefattoLazy(os.path.join(self.path, self.manifest['campionatore']), "Campionatore",
+                             caricatore=lambda path: CampionatoreCopula.carica(self._file(os.path.basename(path))))
+
+    def predittore(self, modelli=None, pesi=None):
+        """
+        Come carica_risorse: il Random Forest se presente e non è chiesto altro,
+        altrimenti l'ensemble dei modelli richiesti (tutti se None).
+        """
+        if modelli is None and 'rf' in self.manifest['modelli']:
+            return self.modello('rf')
+        from ensemble import EnsemblePredittore
+        nomi = [nome for nome in (modelli or self.modelli) if nome in self.manifest['modelli']]
+        mancanti = [nome for nome in (modelli or []) if nome not in self.manifest['modelli']]
+        for nome in mancanti:
+            print(f"  Modello {nome} non presente nel bundle: escluso dall'ensemble")
+        if not nomi:
+            raise FileNotFoundError(f"Nessun modello disponibile nel bundle {self.path}")
+
+        intercetta = None
+        salvati = self.manifest.get('ensemble')
+        if pesi is None and salvati:
+            pesi = salvati['pesi']
+            # Lo stacking vale solo con gli stessi modelli, altrimenti resta una media pesata
+            if set(pesi) == set(nomi):
+                intercetta = salvati.get('intercetta')
+        return EnsemblePredittore({nome: self.modello(nome) for nome in nomi},
+                                  pesi=pesi, intercetta=intercetta)
+
+
+def apri_bundle(path=BUNDLE_PATH):
+    """Bundle in path se esiste, altrimenti None (si usano i singoli file .pkl)."""
+    if path and os.path.exists(os.path.join(path, MANIFEST)):
+        return Bundle(path)
+    return None
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Crea o verifica il bundle degli artefatti")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    crea = sub.add_parser("crea", help="Bundle dagli artefatti .pkl della cartella corrente")
+    crea.add_argument("--output", default=BUNDLE_PATH)
+    crea.add_argument("--versione", help="Etichetta della versione (default: data e ora)")
+    verifica = sub.add_parser("verifica", help="Controlla checksum e caricamento di ogni file")
+    verifica.add_argument("path", nargs="?", default=BUNDLE_PATH)
+    args = parser.parse_args()
+
+    if args.comando == "crea":
+        import joblib
+        from ensemble import MODELLI_FILE, PESI_PATH
+        from profilo import DatasetProfile, carica_o_costruisci_profilo, PROFILO_PATH
+
+        print("="*70)
+        print(f"📦 CREAZIONE BUNDLE: {args.output}")
+        print("="*70)
+        modelli = {nome: joblib.load(file) for nome, file in MODELLI_FILE.items() if os.path.exists(file)}
+        pesi = None
+        if os.path.exists(PESI_PATH):
+            with open(PESI_PATH) as f:
+                pesi = json.load(f)
+        if os.path.exists("spotify_clean.csv"):
+            from cache_dataset import carica_dataset
+            profilo = carica_o_costruisci_profilo(carica_dataset("spotify_clean.csv", verbose=False),
+                                                  "spotify_clean.csv", PROFILO_PATH)
+        elif os.path.exists(PROFILO_PATH):
+            profilo = DatasetProfile.carica(PROFILO_PATH)
+        else:
+            profilo = None
+        from campionatore import CampionatoreCopula, CAMPIONATORE_PATH
+        campionatore = CampionatoreCopula.carica(CAMPIONATORE_PATH) if os.path.exists(CAMPIONATORE_PATH) else None
+        manifest = crea_bundle(args.output, joblib.load("scaler_preprocessor.pkl"), joblib.load("X_columns.pkl"),
+                               modelli, profilo=profilo, pesi=pesi, versione=args.versione,
+                               campionatore=campionatore)
+        for nome_file, info in manifest['file'].items():
+            print(f"   • {nome_file:24s} {info['byte'] / 1024:10.1f} KB")
+        print(f"💾 Bundle {manifest['versione']} salvato in {args.output}")
+    else:
+        bundle = Bundle(args.path)
+        print("="*70)
+        print(f"🔎 BUNDLE {args.path} - versione {bundle.versione} (formato {bundle.manifest['formato']})")
+        print("="*70)
+        print(f"   Creato il {bundle.manifest['creato']} con {bundle.manifest['versioni']}")
+        print(f"   {len(bundle.X_columns)} feature, modelli: {', '.join(bundle.modelli)}")
+        for nome_file in bundle.manifest['file']:
+            bundle._file(nome_file)
+        print("✅ Checksum verificati")
+        bundle.preprocessore().carica()
+        for nome in bundle.modelli:
+            bundle.modello(nome).carica()
+        if bundle.profilo() is not None:
+            print(" Profilo caricato")
+        if bundle.campionatore() is not None:
+            bundle.campionatore().carica()
+        print("✅ Tutti i file si caricano correttamente")
@@ -0,0 +1,145 @@
+# cache_dataset.py - CACHE COLONNARE DEL DATASET (memory-mapped)
+import hashlib
+import json
+import os
+import shutil
+import numpy as np
+import pandas as pd
+
+
+CACHE_DIR = ".cache_spotify"
+META_FILE = "meta.json"
+
+
+def _hash_file(path, blocco=1 << 20):
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(blocco), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _dir_cache(csv_path, cache_dir):
+    nome = os.path.splitext(os.path.basename(csv_path))[0]
+    return os.path.join(os.path.dirname(os.path.abspath(csv_path)), cache_dir, nome)
+
+
+def _leggi_meta(dir_cache):
+    try:
+        with open(os.path.join(dir_cache, META_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _cache_valida(csv_path, dir_cache):
+    """
+    La cache è valida se mtime e dimensione del CSV coincidono; se solo mtime
+    è cambiato (es. copia del file) si confronta l'hash del contenuto.
+    """
+    meta = _leggi_meta(dir_cache)
+    if meta is None:
+        return False
+    stat = os.stat(csv_path)
+    sorgente = meta['sorgente']
+    if sorgente['size'] != stat.st_size:
+        return False
+    if sorgente['mtime_ns'] == stat.st_mtime_ns:
+        return True
+    if _hash_file(csv_path) != sorgente['sha1']:
+        return False
+    # Stesso contenuto: aggiorna solo l'mtime per i prossimi avvii
+    sorgente['mtime_ns'] = stat.st_mtime_ns
+    with open(os.path.join(dir_cache, META_FILE), 'w') as f:
+        json.dump(meta, f)
+    return True
+
+
+def salva_cache(df, csv_path, cache_dir=CACHE_DIR):
+    """
+    Scrive df in formato colonnare: un .npy per colonna numerica/bool e,
+    per le colonne testuali, codici interi + vocabolario (dictionary encoding).
+    """
+    dir_cache = _dir_cache(csv_path, cache_dir)
+    tmp = dir_cache + ".tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+
+    colonne = []
+    for i, col in enumerate(df.columns):
+        serie = df[col]
+        file_base = f"c{i:03d}"
+        if pd.api.types.is_numeric_dtype(serie.dtype) or pd.api.types.is_bool_dtype(serie.dtype):
+            np.save(os.path.join(tmp, file_base + ".npy"), serie.to_numpy())
+            colonne.append({'nome': col, 'tipo': 'numerica', 'file': file_base})
+        else:
+            if isinstance(serie.dtype, pd.CategoricalDtype):
+                codici = serie.cat.codes.to_numpy()
+                categorie = serie.cat.categories.astype(str).to_numpy()
+            else:
+                codici, categorie = pd.factorize(serie.astype(object), sort=True)
+                categorie = np.asarray(categorie, dtype=str)
+            np.save(os.path.join(tmp, file_base + ".codes.npy"), codici.astype(np.int32))
+            np.save(os.path.join(tmp, file_base + ".cats.npy"), categorie)
+            colonne.append({'nome': col, 'tipo': 'categorica', 'file': file_base})
+
+    stat = os.stat(csv_path)
+    meta = {
+        'sorgente': {
+            'mtime_ns': stat.st_mtime_ns,
+            'size': stat.st_size,
+            'sha1': _hash_file(csv_path),
+        },
+        'n_righe': len(df),
+        'colonne': colonne,
+    }
+    with open(os.path.join(tmp, META_FILE), 'w') as f:
+        json.dump(meta, f)
+
+    shutil.rmtree(dir_cache, ignore_errors=True)
+    os.replace(tmp, dir_cache)
+
+
+def _leggi_cache(dir_cache):
+    """Ricostruisce il DataFrame: colonne numeriche memory-mapped, testuali come category."""
+    meta = _leggi_meta(dir_cache)
+    dati = {}
+    for info in meta['colonne']:
+        base = os.path.join(dir_cache, info['file'])
+        if info['tipo'] == 'numerica':
+            dati[info['nome']] = np.load(base + ".npy", mmap_mode='r')
+        else:
+            codici = np.load(base + ".codes.npy", mmap_mode='r')
+            categorie = np.load(base + ".cats.npy")
+            dati[info['nome']] = pd.Categorical.from_codes(codici, categories=categorie)
+    # copy=False: le colonne restano viste sui file, niente consolidamento in blocchi
+    return pd.DataFrame(dati, copy=False)
+
+
+def carica_dataset(csv_path="spotify_clean.csv", cache_dir=CACHE_DIR, verbose=True):
+    """
+    Carica il dataset dalla cache colonnare se aggiornata, altrimenti
+    esegue il parsing del CSV una volta e ricostruisce la cache.
+    """
+    dir_cache = _dir_cache(csv_path, cache_dir)
+    if _cache_valida(csv_path, dir_cache):
+        try:
+            df = _leggi_cache(dir_cache)
+            if verbose:
+                print(" Dataset letto dalla cache colonnare")
+            return df
+        except Exception as e:
+            if verbose:
+                print(f"  Cache non leggibile ({e}), rilettura del CSV...")
+
+    df = pd.read_csv(csv_path)
+    try:
+        salva_cache(df, csv_path, cache_dir)
+        if verbose:
+            print(" Cache colonnare aggiornata")
+    except OSError as e:
+        if verbose:
+            print(f"  Impossibile scrivere la cache: {e}")
+        return df
+    # Stessa rappresentazione dei caricamenti successivi (category + memmap)
+    return _leggi_cache(dir_cache)
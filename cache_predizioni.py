@@ -0,0 +1,141 @@
+# cache_predizioni.py - CACHE LRU/TTL DELLE PREDIZIONI SUL VETTORE DI FEATURE FINALE
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+class PredittoreConCache:
+    """
+    Avvolge final_system (modello o ensemble) ed espone lo stesso predict(X).
+    La chiave è la riga di X già preprocessata, quantizzata a `decimali` cifre:
+    due richieste con le stesse feature finali condividono la predizione.
+    - memoria: LRU di al più max_voci elementi, con scadenza opzionale (ttl, secondi)
+    - disco (opzionale): tabella SQLite consultata dopo un miss in memoria
+    I batch più grandi di max_righe_batch (generazione, scoring di cataloghi)
+    vanno direttamente al modello: sono quasi sempre righe nuove.
+    """
+
+    def __init__(self, modello, max_voci=10_000, ttl=None, decimali=6,
+                 path_disco=None, max_righe_batch=1024):
+        self.modello = modello
+        self.max_voci = max_voci
+        self.ttl = ttl
+        self.decimali = decimali
+        self.max_righe_batch = max_righe_batch
+        self._voci = OrderedDict()  # chiave → (predizione, istante di inserimento)
+        self._lock = threading.Lock()
+        self.hit = 0
+        self.hit_disco = 0
+        self.miss = 0
+        self.espulse = 0
+
+        self._disco = None
+        if path_disco:
+            self._disco = sqlite3.connect(path_disco, check_same_thread=False)
+            self._disco.execute(
+                "CREATE TABLE IF NOT EXISTS predizioni (chiave BLOB PRIMARY KEY, valore REAL, istante REAL)"
+            )
+
+    def __getattr__(self, nome):
+        # Tutto il resto (carica, modelli, pesi, ...) è quello del modello avvolto
+        if nome.startswith('_'):
+            raise AttributeError(nome)
+        return getattr(self.modello, nome)
+
+    def _chiavi(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        # +0.0 unifica -0.0 e 0.0, che hanno byte diversi
+        quantizzato = np.round(X, self.decimali) + 0.0
+        return [riga.tobytes() for riga in quantizzato]
+
+    def _scaduta(self, istante, adesso):
+        return self.ttl is not None and adesso - istante > self.ttl
+
+    def _cerca(self, chiave, adesso):
+        voce = self._voci.get(chiave)
+        if voce is not None:
+            if not self._scaduta(voce[1], adesso):
+                self._voci.move_to_end(chiave)
+                self.hit += 1
+                return voce[0]
+            del self._voci[chiave]
+
+        if self._disco is not None:
+            riga = self._disco.execute(
+                "SELECT valore, istante FROM predizioni WHERE chiave = ?", (chiave,)
+            ).fetchone()
+            if riga is not None and not self._scaduta(riga[1], adesso):
+                self._inserisci(chiave, riga[0], riga[1])
+                self.hit_disco += 1
+                return riga[0]
+
+        self.miss += 1
+        return None
+
+    def _inserisci(self, chiave, valore, istante):
+        self._voci[chiave] = (valore, istante)
+        self._voci.move_to_end(chiave)
+        while len(self._voci) > self.max_voci:
+            self._voci.popitem(last=False)
+            self.espulse += 1
+
+    def predict(self, X):
+        if X.shape[0] > self.max_righe_batch:
+            return self.modello.predict(X)
+
+        # Batch piccoli: la versione densa di un CSR costa poco e serve per le chiavi
+        X = np.asarray(X.toarray() if hasattr(X, 'toarray') else X)
+        chiavi = self._chiavi(X)
+        adesso = time.time()
+        preds = np.empty(len(chiavi), dtype=np.float64)
+        mancanti = []
+        with self._lock:
+            for i, chiave in enumerate(chiavi):
+                valore = self._cerca(chiave, adesso)
+                if valore is None:
+                    mancanti.append(i)
+                else:
+                    preds[i] = valore
+        if not mancanti:
+            return preds
+
+        # Un'unica predict per tutte le righe non in cache
+        nuove = np.asarray(self.modello.predict(X[mancanti]), dtype=np.float64).ravel()
+        preds[mancanti] = nuove
+        with self._lock:
+            for i, valore in zip(mancanti, nuove.tolist()):
+                self._inserisci(chiavi[i], valore, adesso)
+            if self._disco is not None:
+                self._disco.executemany(
+                    "INSERT OR REPLACE INTO predizioni VALUES (?, ?, ?)",
+                    [(chiavi[i], valore, adesso) for i, valore in zip(mancanti, nuove.tolist())],
+                )
+                self._disco.commit()
+        return preds
+
+    def statistiche_cache(self):
+        with self._lock:
+            richieste = self.hit + self.hit_disco + self.miss
+            return {
+                'voci': len(self._voci),
+                'hit': self.hit,
+                'hit_disco': self.hit_disco,
+                'miss': self.miss,
+                'espulse': self.espulse,
+                'hit_rate': (self.hit + self.hit_disco) / richieste if richieste else 0.0,
+            }
+
+    def svuota(self):
+        with self._lock:
+            self._voci.clear()
+            if self._disco is not None:
+                self._disco.execute("DELETE FROM predizioni")
+                self._disco.commit()
+
+
+def senza_cache(final_system):
+    """Il modello (o ensemble) avvolto, per chi genera solo righe nuove o usa altro oltre a predict."""
+    return final_system.modello if isinstance(final_system, PredittoreConCache) else final_system
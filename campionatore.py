@@ -0,0 +1,228 @@
+# campionatore.py - CAMPIONATORE CONGIUNTO DI TRACCE SINTETICHE (COPULA GAUSSIANA)
+import os
+
+import numpy as np
+import pandas as pd
+
+from avvio import ArtefattoLazy
+from profilo import firma_file
+from feature_pipeline import FEATURE_DERIVATE, STIME, dipendenze_base
+
+
+CAMPIONATORE_PATH = "campionatore.npz"
+N_QUANTILI = 1001
+
+
+class CampionatoreCopula:
+    """
+    Copula gaussiana sulle colonne di base (quelle non derivate) del dataset:
+    - marginali empiriche come N_QUANTILI quantili per colonna (date come giorni)
+    - dipendenza come matrice di correlazione dei punteggi normali dei ranghi
+    - categoriche estratte insieme, con le frequenze delle combinazioni osservate
+    Il campionamento è tutto NumPy e lineare nel numero di righe: normali
+    correlate (Cholesky), Φ, interpolazione sui quantili. Le feature derivate
+    non vengono campionate ma ricalcolate dopo (prepara_tracce), quindi sono
+    sempre coerenti con le colonne di base.
+    """
+
+    def __init__(self, colonne, tipi, quantili, correlazione, colonne_cat, combinazioni, frequenze,
+                 sorgente=None):
+        self.colonne = list(colonne)          # numeriche e date, nell'ordine della copula
+        self.tipi = list(tipi)                # dtype originale ('datetime' per le date)
+        self.quantili = np.asarray(quantili, dtype=np.float64)
+        self.correlazione = np.asarray(correlazione, dtype=np.float64)
+        self.colonne_cat = list(colonne_cat)
+        self.combinazioni = np.asarray(combinazioni, dtype=object).reshape(-1, len(self.colonne_cat))
+        self.frequenze = np.asarray(frequenze, dtype=np.float64)
+        self.sorgente = sorgente
+        self._cholesky = np.linalg.cholesky(self.correlazione) if len(self.colonne) else None
+
+    @classmethod
+    def adatta(cls, df, X_columns, sorgente=None):
+        """Stima marginali, correlazione e combinazioni categoriche (una sola passata sulle colonne)."""
+        from scipy.special import ndtri
+
+        richieste = set(X_columns) | dipendenze_base(X_columns)
+        base = [c for c in df.columns if c in richieste and (c not in FEATURE_DERIVATE or c in STIME)]
+
+        colonne, tipi, valori, colonne_cat = [], [], [], []
+        for col in base:
+            serie = df[col]
+            if pd.api.types.is_bool_dtype(serie) or pd.api.types.is_numeric_dtype(serie):
+                colonne.append(col)
+                tipi.append(str(serie.dtype))
+                valori.append(serie.to_numpy(dtype=np.float64))
+                continue
+            date = pd.to_datetime(serie, errors='coerce')
+            if date.notna().mean() > 0.99:
+                colonne.append(col)
+                tipi.append('datetime')
+                valori.append(date.to_numpy(dtype='datetime64[D]').astype(np.float64))
+            else:
+                colonne_cat.append(col)
+
+        valori = np.column_stack(valori) if valori else np.empty((len(df), 0))
+        valori = valori[~np.isnan(valori).any(axis=1)]
+        quantili = np.quantile(valori, np.linspace(0, 1, N_QUANTILI), axis=0).T
+
+        # Punteggi normali dei ranghi (ranghi medi per i valori ripetuti)
+        ranghi = pd.DataFrame(valori).rank(method='average').to_numpy()
+        z = ndtri(ranghi / (len(valori) + 1))
+        correlazione = np.corrcoef(z, rowvar=False) if len(colonne) > 1 else np.ones((len(colonne),) * 2)
+        correlazione = np.nan_to_num(np.atleast_2d(correlazione))  # colonne costanti → indipendenti
+        np.fill_diagonal(correlazione, 1.0)
+        # Piccolo ridge: la matrice stimata deve restare definita positiva per Cholesky
+        correlazione = (correlazione + 1e-6 * np.eye(len(colonne))) / (1 + 1e-6)
+
+        if colonne_cat:
+            conteggi = df[colonne_cat].astype(str).value_counts()
+            combinazioni = np.array(conteggi.index.tolist(), dtype=object).reshape(-1, len(colonne_cat))
+            frequenze = conteggi.to_numpy(dtype=np.float64) / conteggi.sum()
+        else:
+            combinazioni, frequenze = np.empty((1, 0), dtype=object), np.ones(1)
+        return cls(colonne, tipi, quantili, correlazione, colonne_cat, combinazioni, frequenze, sorgente)
+
+    def campiona(self, n, rng=None):
+        """n tracce di base (DataFrame con i dtype del dataset), senza feature derivate."""
+        from scipy.special import ndtr
+
+        rng = np.random.default_rng() if rng is None else rng
+        out = {}
+        if self.colonne:
+            u = ndtr(rng.standard_normal((n, len(self.colonne))) @ self._cholesky.T)
+            # Quantili su una griglia uniforme di probabilità: l'intervallo si trova
+            # per moltiplicazione, senza ricerca binaria
+            posizione = u * (self.quantili.shape[1] - 1)
+            indice = np.minimum(posizione.astype(np.int64), self.quantili.shape[1] - 2)
+            frazione = posizione - indice
+            for j, (col, tipo) in enumerate(zip(self.colonne, self.tipi)):
+                q = self.quantili[j]
+                valori = q[indice[:, j]] + frazione[:, j] * (q[indice[:, j] + 1] - q[indice[:, j]])
+                if tipo == 'datetime':
+                    # datetime64 e non stringhe: feature_pipeline accetta entrambi
+                    out[col] = np.round(valori).astype(np.int64).astype('datetime64[D]')
+                elif tipo == 'bool':
+                    out[col] = valori >= 0.5
+                elif tipo.startswith(('int', 'uint')):
+                    out[col] = np.round(valori).astype(tipo)
+                else:
+                    out[col] = valori.astype(tipo)
+        if self.colonne_cat:
+            scelte = self.combinazioni[rng.choice(len(self.frequenze), size=n, p=self.frequenze)]
+            for k, col in enumerate(self.colonne_cat):
+                out[col] = scelte[:, k]
+        return pd.DataFrame(out)
+
+    # --- SALVATAGGIO (solo array, niente pickle) ---
+
+    def salva(self, path=CAMPIONATORE_PATH):
+        with open(path, 'wb') as f:
+            np.savez(f, colonne=np.asarray(self.colonne, dtype=str), tipi=np.asarray(self.tipi, dtype=str),
+                     quantili=self.quantili, correlazione=self.correlazione,
+                     colonne_cat=np.asarray(self.colonne_cat, dtype=str),
+                     combinazioni=self.combinazioni.astype(str), frequenze=self.frequenze,
+                     sorgente=np.asarray(self.sorgente if self.sorgente is not None else [], dtype=np.int64))
+
+    @classmethod
+    def carica(cls, path=CAMPIONATORE_PATH):
+        with np.load(path) as dati:
+            sorgente = tuple(int(v) for v in dati['sorgente']) or None
+            return cls(dati['colonne'].tolist(), dati['tipi'].tolist(), dati['quantili'], dati['correlazione'],
+                       dati['colonne_cat'].tolist(), dati['combinazioni'].astype(object), dati['frequenze'],
+                       sorgente)
+
+
+def carica_o_adatta_campionatore(df, X_columns, csv_path, path=CAMPIONATORE_PATH):
+    """Come carica_o_costruisci_profilo: riusa il file se corrisponde al CSV, altrimenti lo riadatta."""
+    firma = firma_file(csv_path) if os.path.exists(csv_path) else None
+    if os.path.exists(path):
+        try:
+            campionatore = CampionatoreCopula.carica(path)
+            if firma is not None and campionatore.sorgente == firma:
+                return campionatore
+        except Exception:
+            pass
+
+    campionatore = CampionatoreCopula.adatta(df, X_columns, sorgente=firma)
+    try:
+        campionatore.salva(path)
+    except OSError as e:
+        print(f"  Impossibile salvare il campionatore: {e}")
+    return campionatore
+
+
+# --- CAMPIONATORE ATTIVO (usato da utils.genera_tracce_batch) ---
+
+_ATTIVO = None
+
+
+def imposta_campionatore(campionatore):
+    """Campionatore (o ArtefattoLazy) usato per le tracce sintetiche; None = colonne uniformi indipendenti."""
+    global _ATTIVO
+    _ATTIVO = campionatore
+
+
+def campionatore_attivo():
+    return _ATTIVO
+
+
+def campionatore_pigro(df, X_columns, bundle=None, csv_path="spotify_clean.csv"):
+    """Quello del bundle se presente, altrimenti campionatore.npz (adattato al primo utilizzo se manca o è vecchio)."""
+    if bundle is not None and bundle.manifest.get('campionatore'):
+        return bundle.campionatore()
+    return ArtefattoLazy(CAMPIONATORE_PATH, "Campionatore",
+                         caricatore=lambda path: carica_o_adatta_campionatore(df, X_columns, csv_path, path))
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+    import joblib
+
+    parser = argparse.ArgumentParser(description="Adatta il campionatore di tracce e ne misura il realismo")
+    parser.add_argument("--dataset", default="spotify_clean.csv")
+    parser.add_argument("--righe", type=int, default=20_000, help="Tracce sintetiche per il confronto (default 20000)")
+    args = parser.parse_args()
+
+    from sklearn.ensemble import HistGradientBoostingClassifier
+    from sklearn.model_selection import cross_val_score
+    from cache_dataset import carica_dataset
+    from profilo import carica_o_costruisci_profilo, PROFILO_PATH
+    from utils import prepara_tracce, genera_tracce_batch
+
+    print("="*70)
+    print("🎲 CAMPIONATORE DI TRACCE (COPULA GAUSSIANA)")
+    print("="*70)
+    df = carica_dataset(args.dataset)
+    X_columns = joblib.load("X_columns.pkl")
+    profilo = carica_o_costruisci_profilo(df, args.dataset, PROFILO_PATH)
+
+    inizio = time.perf_counter()
+    campionatore = CampionatoreCopula.adatta(df, X_columns, sorgente=firma_file(args.dataset))
+    campionatore.salva()
+    print(f"✅ Adattato in {time.perf_counter() - inizio:.2f}s: {len(campionatore.colonne)} colonne nella copula, "
+          f"{len(campionatore.frequenze)} combinazioni di {', '.join(campionatore.colonne_cat) or '-'}")
+    print(f"💾 Salvato in {CAMPIONATORE_PATH}")
+
+    inizio = time.perf_counter()
+    campionatore.campiona(1_000_000, np.random.default_rng(0))
+    print(f"⏱️  1.000.000 tracce di base in {time.perf_counter() - inizio:.2f}s")
+
+    # Realismo: quanto bene un classificatore distingue le tracce reali da quelle sintetiche
+    rng = np.random.default_rng(0)
+    reali = df.sample(min(args.righe, len(df)), random_state=0)
+    reali = prepara_tracce(reali.copy(), X_columns, profilo)
+    numeriche = [c for c in X_columns if pd.api.types.is_numeric_dtype(reali[c])]
+    varianti = {
+        'uniforme (indipendente)': genera_tracce_batch(df, X_columns, len(reali), profilo, rng, campionatore=False),
+        'copula gaussiana': genera_tracce_batch(df, X_columns, len(reali), profilo, rng, campionatore=campionatore),
+    }
+    print(f"\n{'Campionatore':<26}{'AUC reale/sintetico':>22}{'errore corr. Spearman':>24}")
+    corr_reale = reali[numeriche].astype(float).corr(method='spearman').fillna(0).to_numpy()
+    for nome, sintetiche in varianti.items():
+        X = pd.concat([reali[numeriche], sintetiche[numeriche]]).astype(float)
+        y = np.r_[np.zeros(len(reali)), np.ones(len(sintetiche))]
+        auc = cross_val_score(HistGradientBoostingClassifier(max_iter=100), X, y, cv=3, scoring='roc_auc').mean()
+        corr = sintetiche[numeriche].astype(float).corr(method='spearman').fillna(0).to_numpy()
+        print(f"{nome:<26}{auc:>22.3f}{np.abs(corr - corr_reale).max():>24.3f}")
+    print("\n(AUC 0.5 = indistinguibili dalle tracce reali)")
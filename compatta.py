@@ -0,0 +1,573 @@
+#!/usr/bin/env python3
+"""
+Compattazione offline dei modelli salvati: meno alberi, foglie fuse e soglie
+quantizzate, con un report del compromesso accuratezza/latenza sull'hold-out.
+
+Uso:
+    python compatta.py                                   # dal bundle (o dai .pkl) della cartella
+    python compatta.py --alberi 100 --tolleranza-foglie 0.5 --soglie quantizzate
+    python compatta.py --output modello_compatto.bundle --report compattazione.json
+
+Random Forest: selezione greedy degli alberi, fusione delle foglie sorelle con
+valori vicini e conversione in ForestaCompatta (array NumPy piatti, predizione
+vettorizzata su tutti gli alberi insieme).
+LightGBM / CatBoost: troncamento alle prime iterazioni (gli alberi del boosting
+sono sequenziali, non si possono scegliere liberamente).
+Il risultato è un nuovo bundle, da usare con `python main.py --bundle ...`.
+"""
+import argparse
+import json
+import os
+import pickle
+import sys
+import time
+
+import numpy as np
+
+
+FOGLIA = -1
+RIGHE_PER_BLOCCO = 2_000_000  # righe × alberi per blocco di predizione
+
+
+# --- FORESTA COMPATTA ---
+
+def alberi_da_sklearn(foresta):
+    """Array per albero (sinistro, destro, feature, soglia, valore, campioni) di un RandomForest."""
+    alberi = []
+    for stimatore in foresta.estimators_:
+        t = stimatore.tree_
+        alberi.append({
+            'sinistro': t.children_left.astype(np.int64),
+            'destro': t.children_right.astype(np.int64),
+            'feature': t.feature.astype(np.int64),
+            'soglia': t.threshold.astype(np.float64),
+            'valore': t.value[:, 0, 0].astype(np.float64),
+            'campioni': t.weighted_n_node_samples.astype(np.float64),
+        })
+    return alberi
+
+
+def _compatta_nodi(albero):
+    """Rinumera i soli nodi raggiungibili dalla radice (in ordine di visita)."""
+    sinistro, destro = albero['sinistro'], albero['destro']
+    ordine, pila = [], [0]
+    while pila:
+        nodo = pila.pop()
+        ordine.append(nodo)
+        if sinistro[nodo] != FOGLIA:
+            pila.append(destro[nodo])
+            pila.append(sinistro[nodo])
+    ordine = np.asarray(ordine, dtype=np.int64)
+    nuovo_indice = np.full(len(sinistro), FOGLIA, dtype=np.int64)
+    nuovo_indice[ordine] = np.arange(len(ordine))
+
+    compatto = {chiave: valori[ordine] for chiave, valori in albero.items()}
+    foglie = compatto['sinistro'] == FOGLIA
+    compatto['sinistro'] = np.where(foglie, FOGLIA, nuovo_indice[np.maximum(compatto['sinistro'], 0)])
+    compatto['destro'] = np.where(foglie, FOGLIA, nuovo_indice[np.maximum(compatto['destro'], 0)])
+    return compatto
+
+
+def fondi_foglie(albero, tolleranza):
+    """
+    Un nodo le cui due figlie sono foglie con valori distanti al più
+    `tolleranza` diventa una foglia (media pesata sui campioni). Ripetuto dal
+    basso verso l'alto: in sklearn i figli hanno sempre indice maggiore del padre.
+    """
+    albero = {chiave: valori.copy() for chiave, valori in albero.items()}
+    sinistro, destro = albero['sinistro'], albero['destro']
+    valore, campioni = albero['valore'], albero['campioni']
+    for nodo in range(len(sinistro) - 1, -1, -1):
+        s, d = sinistro[nodo], destro[nodo]
+        if s == FOGLIA or sinistro[s] != FOGLIA or sinistro[d] != FOGLIA:
+            continue
+        if abs(valore[s] - valore[d]) <= tolleranza:
+            peso = campioni[s] + campioni[d]
+            valore[nodo] = (campioni[s] * valore[s] + campioni[d] * valore[d]) / peso if peso else valore[s]
+            sinistro[nodo] = destro[nodo] = FOGLIA
+    return _compatta_nodi(albero)
+
+
+class ForestaCompatta:
+    """
+    Random Forest in array piatti: tutti i nodi di tutti gli alberi in un
+    unico vettore, in ordine di visita (il figlio sinistro di un nodo interno
+    è sempre il nodo successivo, quindi si salva solo il destro). Le foglie
+    mandano sempre a destra su se stesse: la discesa è un ciclo di
+    `profondita` passi identici per tutti gli alberi e tutte le righe.
+    soglie='float64' riproduce sklearn esattamente; 'float32' dimezza soglie e
+    valori (differenze dell'ordine di 1e-6); 'quantizzate' salva per ogni nodo
+    l'indice (int16) della soglia nella tabella ordinata della sua feature e
+    confronta gli indici: stesso risultato di float64 con 2 byte per soglia,
+    al costo di una searchsorted per feature a ogni predizione.
+    """
+
+    def __init__(self, destro, feature, soglia, valore, radici, profondita, n_feature,
+                 tabella_soglie=None, offset_tabella=None):
+        self.destro = destro
+        self.feature = feature
+        self.soglia = soglia
+        self.valore = valore
+        self.radici = radici
+        self.profondita = int(profondita)
+        self.n_feature = int(n_feature)
+        self.tabella_soglie = tabella_soglie
+        self.offset_tabella = offset_tabella
+
+    @property
+    def n_alberi(self):
+        return len(self.radici)
+
+    @property
+    def n_nodi(self):
+        return len(self.destro)
+
+    @property
+    def quantizzata(self):
+        return self.tabella_soglie is not None
+
+    @property
+    def foglie(self):
+        return self.destro == np.arange(self.n_nodi)
+
+    @classmethod
+    def da_alberi(cls, alberi, n_feature, soglie='float64'):
+        alberi = [a if cls._sinistro_consecutivo(a) else _compatta_nodi(a) for a in alberi]
+        offset = np.cumsum([0] + [len(a['sinistro']) for a in alberi])
+        n = int(offset[-1])
+        foglie = np.concatenate([a['sinistro'] == FOGLIA for a in alberi])
+        destro = np.concatenate([a['destro'] + o for a, o in zip(alberi, offset)])
+        destro = np.where(foglie, np.arange(n), destro).astype(np.int32)
+        feature = np.where(foglie, 0, np.concatenate([a['feature'] for a in alberi]))
+        feature = feature.astype(np.int16 if n_feature < np.iinfo(np.int16).max else np.int32)
+        soglia = np.where(foglie, -np.inf, np.concatenate([a['soglia'] for a in alberi]))
+        valore = np.concatenate([a['valore'] for a in alberi])
+        profondita = max(cls._profondita(a) for a in alberi)
+
+        tabella = offset_tabella = None
+        if soglie == 'quantizzate':
+            tabelle = [np.unique(soglia[~foglie & (feature == f)]) for f in range(n_feature)]
+            offset_tabella = np.cumsum([0] + [len(t) for t in tabelle]).astype(np.int64)
+            tabella = np.concatenate(tabelle)
+            dtype = np.int16 if max(len(t) for t in tabelle) < np.iinfo(np.int16).max else np.int32
+            # -1 nelle foglie: gli indici delle righe sono >= 0, quindi si va sempre a destra
+            codici = np.full(n, -1, dtype=dtype)
+            for f, t in enumerate(tabelle):
+                nodi = np.flatnonzero(~foglie & (feature == f))
+                codici[nodi] = np.searchsorted(t, soglia[nodi])
+            soglia = codici
+        elif soglie == 'float32':
+            soglia = soglia.astype(np.float32)
+            valore = valore.astype(np.float32)
+        elif soglie != 'float64':
+            raise ValueError(f"Soglie sconosciute: {soglie} (valide: float64, float32, quantizzate)")
+
+        return cls(destro, feature, soglia, valore, offset[:-1].astype(np.int32),
+                   profondita, n_feature, tabella, offset_tabella)
+
+    @staticmethod
+    def _sinistro_consecutivo(albero):
+        interni = np.flatnonzero(albero['sinistro'] != FOGLIA)
+        return bool(np.all(albero['sinistro'][interni] == interni + 1))
+
+    @staticmethod
+    def _profondita(albero):
+        sinistro, destro = albero['sinistro'], albero['destro']
+        livello, profondita = np.array([0]), 0
+        while True:
+            interni = livello[sinistro[livello] != FOGLIA]
+            if not len(interni):
+                return profondita
+            livello = np.concatenate([sinistro[interni], destro[interni]])
+            profondita += 1
+
+    def _prepara(self, X):
+        X = X.toarray() if hasattr(X, 'toarray') else np.asarray(X)
+        # sklearn confronta le feature in float32 con soglie float64
+        X = X.astype(np.float32).astype(np.float64)
+        if not self.quantizzata:
+            return X.astype(self.soglia.dtype, copy=False)
+        # Ogni valore diventa l'indice della prima soglia >= valore: x > t_k ⇔ indice > k
+        codici = np.zeros(X.shape, dtype=self.soglia.dtype)
+        for f in range(self.n_feature):
+            tabella = self.tabella_soglie[self.offset_tabella[f]:self.offset_tabella[f + 1]]
+            if len(tabella):
+                codici[:, f] = np.searchsorted(tabella, X[:, f], side='left')
+        return codici
+
+    def predici_alberi(self, X):
+        """Valore della foglia raggiunta in ogni albero: matrice righe × alberi."""
+        X = self._prepara(X)
+        out = np.empty((len(X), self.n_alberi), dtype=self.valore.dtype)
+        passo = max(1, RIGHE_PER_BLOCCO // max(self.n_alberi, 1))
+        for inizio in range(0, len(X), passo):
+            blocco = X[inizio:inizio + passo]
+            piatto = blocco.ravel()
+            basi = (np.arange(len(blocco)) * self.n_feature)[:, None]
+            nodi = np.broadcast_to(self.radici, (len(blocco), self.n_alberi)).copy()
+            for _ in range(self.profondita):
+                a_destra = piatto[basi + self.feature[nodi]] > self.soglia[nodi]
+                nodi = np.where(a_destra, self.destro[nodi], nodi + 1)
+            out[inizio:inizio + passo] = self.valore[nodi]
+        return out
+
+    def predict(self, X):
+        return self.predici_alberi(X).mean(axis=1, dtype=np.float64)
+
+    def contributi(self, X):
+        """
+        Attribuzione per percorso (Saabas): ogni nodo attraversato assegna alla
+        sua feature la variazione di valore verso il figlio scelto, in media
+        sugli alberi. Restituisce (contributi righe × feature, valore base):
+        contributi.sum(axis=1) + base == predict(X).
+        """
+        X = self._prepara(X)
+        n = len(X)
+        out = np.zeros((n, self.n_feature))
+        passo = max(1, RIGHE_PER_BLOCCO // max(self.n_alberi, 1))
+        for inizio in range(0, n, passo):
+            blocco = X[inizio:inizio + passo]
+            m = len(blocco)
+            piatto = blocco.ravel()
+            righe = np.arange(m)[:, None]
+            basi = righe * self.n_feature
+            nodi = np.broadcast_to(self.radici, (m, self.n_alberi)).copy()
+            somma = np.zeros(m * self.n_feature)
+            for _ in range(self.profondita):
+                feature = self.feature[nodi]
+                a_destra = piatto[basi + feature] > self.soglia[nodi]
+                figli = np.where(a_destra, self.destro[nodi], nodi + 1)
+                # Nelle foglie figli == nodi: variazione nulla
+                variazione = self.valore[figli].astype(np.float64) - self.valore[nodi]
+                somma += np.bincount((basi + feature).ravel(), weights=variazione.ravel(),
+                                     minlength=m * self.n_feature)
+                nodi = figli
+            out[inizio:inizio + passo] = somma.reshape(m, self.n_feature) / self.n_alberi
+        base = float(np.mean(self.valore[self.radici], dtype=np.float64))
+        return out, np.full(n, base)
+
+    def alberi(self):
+        """Ricostruisce gli array per albero (stesso formato di alberi_da_sklearn)."""
+        foglie = self.foglie
+        if self.quantizzata:
+            soglia = np.full(self.n_nodi, np.inf)
+            basi = self.offset_tabella[self.feature[~foglie]]
+            soglia[~foglie] = self.tabella_soglie[basi + self.soglia[~foglie].astype(np.int64)]
+        else:
+            soglia = self.soglia.astype(np.float64)
+        fine = np.append(self.radici[1:], self.n_nodi)
+        alberi = []
+        for inizio, stop in zip(self.radici, fine):
+            locale = np.arange(stop - inizio)
+            foglie_albero = foglie[inizio:stop]
+            alberi.append({
+                'sinistro': np.where(foglie_albero, FOGLIA, locale + 1),
+                'destro': np.where(foglie_albero, FOGLIA, self.destro[inizio:stop] - inizio).astype(np.int64),
+                'feature': self.feature[inizio:stop].astype(np.int64),
+                'soglia': soglia[inizio:stop],
+                'valore': self.valore[inizio:stop].astype(np.float64),
+                'campioni': np.ones(stop - inizio),
+            })
+        return alberi
+
+    def seleziona(self, indici):
+        """Nuova foresta con i soli alberi indicati."""
+        alberi = self.alberi()
+        return ForestaCompatta.da_alberi([alberi[i] for i in indici], self.n_feature, self._modo_soglie())
+
+    def _modo_soglie(self):
+        if self.quantizzata:
+            return 'quantizzate'
+        return 'float32' if self.soglia.dtype == np.float32 else 'float64'
+
+    @property
+    def nbytes(self):
+        array = [self.destro, self.feature, self.soglia, self.valore, self.radici]
+        if self.quantizzata:
+            array += [self.tabella_soglie, self.offset_tabella]
+        return int(sum(a.nbytes for a in array))
+
+    # --- SALVATAGGIO (stesso stile di PreprocessorCompilato: solo array, niente pickle) ---
+
+    def salva(self, path):
+        dati = {'destro': self.destro, 'feature': self.feature, 'soglia': self.soglia,
+                'valore': self.valore, 'radici': self.radici,
+                'profondita': np.asarray(self.profondita), 'n_feature': np.asarray(self.n_feature)}
+        if self.quantizzata:
+            dati['tabella_soglie'] = self.tabella_soglie
+            dati['offset_tabella'] = self.offset_tabella
+        with open(path, 'wb') as f:
+            np.savez(f, **dati)
+
+    @classmethod
+    def carica(cls, path):
+        with np.load(path) as dati:
+            return cls(dati['destro'], dati['feature'], dati['soglia'], dati['valore'],
+                       dati['radici'], int(dati['profondita']), int(dati['n_feature']),
+                       dati['tabella_soglie'] if 'tabella_soglie' in dati.files else None,
+                       dati['offset_tabella'] if 'offset_tabella' in dati.files else None)
+
+
+# --- SELEZIONE ---
+
+def _rmse(y, pred):
+    return float(np.sqrt(np.mean((np.asarray(pred, dtype=np.float64) - y) ** 2)))
+
+
+def selezione_greedy(predizioni_alberi, y, n_alberi=None):
+    """
+    Aggiunge a ogni passo l'albero che riduce di più l'RMSE della media.
+    predizioni_alberi: righe × alberi. Restituisce gli indici in ordine di
+    selezione (i primi n_alberi, o tutti se None).
+    """
+    P = np.asarray(predizioni_alberi, dtype=np.float64).T  # alberi × righe
+    limite = min(n_alberi or len(P), len(P))
+    somma = np.zeros(P.shape[1])
+    disponibili = np.ones(len(P), dtype=bool)
+    scelti = []
+    for k in range(1, limite + 1):
+        errori = np.sqrt(np.mean(((somma + P) / k - y) ** 2, axis=1))
+        errori[~disponibili] = np.inf
+        migliore = int(np.argmin(errori))
+        scelti.append(migliore)
+        disponibili[migliore] = False
+        somma += P[migliore]
+    return scelti
+
+
+def prefisso_minimo(predizioni_alberi, ordine, y, tolleranza=0.005):
+    """
+    Numero minimo di alberi (nell'ordine dato) con RMSE entro `tolleranza`
+    (relativa) da quello della foresta intera. Va calcolato su righe diverse
+    da quelle della selezione greedy, che su quelle è ottimista.
+    """
+    P = np.asarray(predizioni_alberi, dtype=np.float64)
+    obiettivo = _rmse(y, P.mean(axis=1)) * (1 + tolleranza)
+    medie = np.cumsum(P[:, ordine], axis=1) / np.arange(1, len(ordine) + 1)
+    errori = np.sqrt(np.mean((medie - y[:, None]) ** 2, axis=0))
+    entro = np.flatnonzero(errori <= obiettivo)
+    return int(entro[0]) + 1 if len(entro) else len(ordine)
+
+
+def troncamento_boosting(predici_fino_a, n_totale, y, tolleranza=0.005, iterazioni=None):
+    """
+    Numero minimo di iterazioni (su una griglia geometrica) con RMSE entro
+    `tolleranza` da quello del modello completo.
+    predici_fino_a(k) → predizioni usando le prime k iterazioni.
+    """
+    if iterazioni:
+        return min(int(iterazioni), n_totale)
+    obiettivo = _rmse(y, predici_fino_a(n_totale)) * (1 + tolleranza)
+    griglia = np.unique(np.geomspace(1, n_totale, num=min(n_totale, 24)).astype(int))
+    for k in griglia:
+        if _rmse(y, predici_fino_a(int(k))) <= obiettivo:
+            return int(k)
+    return n_totale
+
+
+# --- COMPATTAZIONE DEI MODELLI ---
+
+def ordine_alberi(foresta, X_sel, y_sel, n_alberi=None, tolleranza=0.005):
+    """
+    Alberi da tenere, in ordine di selezione greedy su metà di X_sel; con
+    n_alberi=None il loro numero viene scelto sull'altra metà.
+    """
+    completa = ForestaCompatta.da_alberi(alberi_da_sklearn(foresta), foresta.n_features_in_)
+    P = completa.predici_alberi(X_sel)
+    meta = len(y_sel) // 2
+    ordine = selezione_greedy(P[:meta], y_sel[:meta], n_alberi)
+    if n_alberi is None:
+        ordine = ordine[:prefisso_minimo(P[meta:], ordine, y_sel[meta:], tolleranza)]
+    return ordine
+
+
+def compatta_rf(foresta, X_sel, y_sel, n_alberi=None, tolleranza=0.005, tolleranza_foglie=0.0,
+                soglie='float32', ordine=None):
+    """Selezione degli alberi, fusione delle foglie e conversione delle soglie."""
+    if ordine is None:
+        ordine = ordine_alberi(foresta, X_sel, y_sel, n_alberi, tolleranza)
+    originali = alberi_da_sklearn(foresta)
+    alberi = [fondi_foglie(originali[i], tolleranza_foglie) if tolleranza_foglie > 0 else originali[i]
+              for i in ordine]
+    return ForestaCompatta.da_alberi(alberi, foresta.n_features_in_, soglie)
+
+
+def compatta_lgbm(modello, X_sel, y_sel, tolleranza=0.005, iterazioni=None):
+    import lightgbm as lgb
+    booster = getattr(modello, 'booster_', modello)
+    n_totale = booster.current_iteration()
+    k = troncamento_boosting(lambda k: booster.predict(X_sel, num_iteration=k), n_totale, y_sel,
+                             tolleranza, iterazioni)
+    return lgb.Booster(model_str=booster.model_to_string(num_iteration=k))
+
+
+def compatta_cat(modello, X_sel, y_sel, tolleranza=0.005, iterazioni=None):
+    n_totale = modello.tree_count_
+    k = troncamento_boosting(lambda k: modello.predict(X_sel, ntree_end=k), n_totale, y_sel,
+                             tolleranza, iterazioni)
+    compatto = modello.copy()
+    compatto.shrink(ntree_end=k)
+    return compatto
+
+
+def n_alberi_modello(modello):
+    if isinstance(modello, ForestaCompatta):
+        return modello.n_alberi
+    if hasattr(modello, 'estimators_'):
+        return len(modello.estimators_)
+    if hasattr(modello, 'tree_count_'):
+        return modello.tree_count_
+    return getattr(modello, 'booster_', modello).current_iteration()
+
+
+def memoria_modello(modello):
+    if isinstance(modello, ForestaCompatta):
+        return modello.nbytes
+    booster = getattr(modello, 'booster_', None)
+    if booster is not None or hasattr(modello, 'model_to_string'):
+        return len((booster or modello).model_to_string().encode())
+    return len(pickle.dumps(modello, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+def misura_variante(nome, modello, X_val, y_val, ripetizioni=200):
+    """RMSE sull'hold-out di valutazione, latenza di una riga (p50/p99) e throughput a batch."""
+    riga = X_val[:1]
+    modello.predict(riga)
+    latenze = np.empty(ripetizioni)
+    for i in range(ripetizioni):
+        t0 = time.perf_counter()
+        modello.predict(riga)
+        latenze[i] = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    pred = modello.predict(X_val)
+    durata = time.perf_counter() - t0
+    risultato = {
+        'variante': nome,
+        'alberi': int(n_alberi_modello(modello)),
+        'rmse': _rmse(y_val, pred),
+        'p50_us': float(np.percentile(latenze, 50) * 1e6),
+        'p99_us': float(np.percentile(latenze, 99) * 1e6),
+        'righe_al_s': len(y_val) / durata if durata > 0 else None,
+        'memoria_kb': memoria_modello(modello) / 1024,
+    }
+    print(f"  {nome:28s} {risultato['alberi']:6d} {risultato['rmse']:9.4f} {risultato['p50_us']:10.1f} "
+          f"{risultato['p99_us']:10.1f} {risultato['righe_al_s'] or 0:12,.0f} {risultato['memoria_kb']:10.1f}")
+    return risultato
+
+
+# --- DATI E ARTEFATTI ---
+
+def carica_sorgente(bundle_path):
+    """Preprocessor, X_columns, modelli, profilo e pesi dal bundle o dai file .pkl."""
+    from bundle import apri_bundle
+    artefatti = apri_bundle(bundle_path)
+    if artefatti is not None:
+        print(f" Sorgente: bundle {artefatti.path} versione {artefatti.versione}")
+        modelli = {nome: artefatti.modello(nome).carica() for nome in artefatti.modelli}
+        return (artefatti.preprocessore().carica(), artefatti.X_columns, modelli,
+                artefatti.profilo(), artefatti.manifest.get('ensemble'), artefatti.versione)
+
+    import joblib
+    from ensemble import MODELLI_FILE, PESI_PATH
+    from profilo import DatasetProfile, PROFILO_PATH
+    print(" Sorgente: file .pkl della cartella corrente")
+    modelli = {nome: joblib.load(file) for nome, file in MODELLI_FILE.items() if os.path.exists(file)}
+    pesi = None
+    if os.path.exists(PESI_PATH):
+        with open(PESI_PATH) as f:
+            pesi = json.load(f)
+    profilo = DatasetProfile.carica(PROFILO_PATH) if os.path.exists(PROFILO_PATH) else None
+    return (joblib.load("scaler_preprocessor.pkl"), joblib.load("X_columns.pkl"), modelli,
+            profilo, pesi, None)
+
+
+def hold_out(dataset, X_columns, preprocessor):
+    """
+    Stesso hold-out di ensemble.py e del notebook (20%, random_state=42),
+    diviso a metà: una parte per scegliere alberi/iterazioni, l'altra per il report.
+    """
+    import pandas as pd
+    from sklearn.model_selection import train_test_split
+    from feature_pipeline import aggiungi_feature, statistiche_globali
+
+    df = pd.read_csv(dataset)
+    aggiungi_feature(df, X_columns, statistiche_globali(df))
+    _, X_test, _, y_test = train_test_split(df[X_columns], df['popularity'].to_numpy(dtype=np.float64),
+                                            test_size=0.2, random_state=42)
+    X_sel, X_val, y_sel, y_val = train_test_split(X_test, y_test, test_size=0.5, random_state=42)
+    trasforma = lambda X: np.asarray(preprocessor.transform(X), dtype=np.float64)
+    return trasforma(X_sel), y_sel, trasforma(X_val), y_val
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compatta i modelli salvati e riporta il compromesso accuratezza/latenza")
+    parser.add_argument("--bundle", default="modello.bundle", metavar="CARTELLA",
+                        help="Bundle sorgente (se non esiste si usano i file .pkl)")
+    parser.add_argument("--dataset", default="spotify_clean.csv")
+    parser.add_argument("--modelli", help="Sottoinsieme di rf,lgbm,cat (default: tutti quelli presenti)")
+    parser.add_argument("--alberi", type=int, help="Alberi da tenere nel Random Forest (default: minimo entro la tolleranza)")
+    parser.add_argument("--iterazioni", type=int, help="Iterazioni da tenere per LightGBM/CatBoost (default: minimo entro la tolleranza)")
+    parser.add_argument("--tolleranza", type=float, default=0.005,
+                        help="Peggioramento relativo dell'RMSE accettato (default 0.005 = 0.5%%)")
+    parser.add_argument("--tolleranza-foglie", type=float, default=0.0,
+                        help="Fonde foglie sorelle con valori distanti al più questo (punti di popolarità)")
+    parser.add_argument("--soglie", choices=["float64", "float32", "quantizzate"], default="float32",
+                        help="Soglie del Random Forest compattato (default float32)")
+    parser.add_argument("--output", default="modello_compatto.bundle", metavar="CARTELLA")
+    parser.add_argument("--report", default="compattazione_report.json", metavar="JSON")
+    args = parser.parse_args()
+
+    print("="*70)
+    print("🗜️  COMPATTAZIONE DEI MODELLI")
+    print("="*70)
+    if not os.path.exists(args.dataset):
+        print(f"❌ Dataset non trovato: {args.dataset} (serve per l'hold-out)")
+        sys.exit(1)
+
+    preprocessor, X_columns, modelli, profilo, pesi, versione = carica_sorgente(args.bundle)
+    if args.modelli:
+        modelli = {nome: m for nome, m in modelli.items() if nome in args.modelli.split(',')}
+    if not modelli:
+        print("❌ Nessun modello da compattare")
+        sys.exit(1)
+    X_sel, y_sel, X_val, y_val = hold_out(args.dataset, X_columns, preprocessor)
+    print(f" Hold-out: {len(y_sel):,} righe per la selezione, {len(y_val):,} per il report\n")
+
+    print(f"  {'Variante':28s} {'alberi':>6s} {'RMSE':>9s} {'p50 µs':>10s} {'p99 µs':>10s} "
+          f"{'righe/s':>12s} {'KB':>10s}")
+    report, compattati = {}, {}
+    for nome, modello in modelli.items():
+        varianti = [misura_variante(f"{nome} originale", modello, X_val, y_val)]
+        if nome == 'rf' and isinstance(modello, ForestaCompatta):
+            print(f"  {nome}: già compatto, lasciato com'è")
+            compattati[nome] = modello
+        elif nome == 'rf':
+            esatta = ForestaCompatta.da_alberi(alberi_da_sklearn(modello), modello.n_features_in_)
+            varianti.append(misura_variante(f"{nome} compatta (stessi alberi)", esatta, X_val, y_val))
+            ordine = ordine_alberi(modello, X_sel, y_sel, args.alberi, args.tolleranza)
+            selezionata = compatta_rf(modello, X_sel, y_sel, soglie='float64', ordine=ordine)
+            varianti.append(misura_variante(f"{nome} + selezione alberi", selezionata, X_val, y_val))
+            compattati[nome] = compatta_rf(modello, X_sel, y_sel, tolleranza_foglie=args.tolleranza_foglie,
+                                           soglie=args.soglie, ordine=ordine)
+            varianti.append(misura_variante(f"{nome} + foglie/soglie {args.soglie}", compattati[nome], X_val, y_val))
+        elif nome == 'lgbm':
+            compattati[nome] = compatta_lgbm(modello, X_sel, y_sel, args.tolleranza, args.iterazioni)
+            varianti.append(misura_variante(f"{nome} troncato", compattati[nome], X_val, y_val))
+        elif nome == 'cat':
+            compattati[nome] = compatta_cat(modello, X_sel, y_sel, args.tolleranza, args.iterazioni)
+            varianti.append(misura_variante(f"{nome} troncato", compattati[nome], X_val, y_val))
+        report[nome] = varianti
+
+    from bundle import crea_bundle, apri_bundle
+    sorgente = apri_bundle(args.bundle)
+    campionatore = sorgente.campionatore() if sorgente is not None else None
+    manifest = crea_bundle(args.output, preprocessor, X_columns, compattati, profilo=profilo, pesi=pesi,
+                           versione=f"{versione or time.strftime('%Y%m%d-%H%M%S')}-compatto",
+                           campionatore=campionatore.carica() if campionatore is not None else None)
+    with open(args.report, 'w') as f:
+        json.dump({'data': time.strftime("%Y-%m-%dT%H:%M:%S"), 'tolleranza': args.tolleranza,
+                   'tolleranza_foglie': args.tolleranza_foglie, 'soglie': args.soglie,
+                   'righe_valutazione': len(y_val), 'modelli': report}, f, indent=2)
+    print(f"\n💾 Bundle {manifest['versione']} salvato in {args.output}")
+    print(f"💾 Report salvato in {args.report}")
+    print(f"   Per usarlo: python main.py --bundle {args.output}")
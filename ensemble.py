@@ -0,0 +1,179 @@
+# ensemble.py - ENSEMBLE RF / LightGBM / CatBoost CON PREDIZIONE PARALLELA
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from avvio import ArtefattoLazy
+
+
+MODELLI_FILE = {
+    'rf': "rf_model.pkl",
+    'lgbm': "lgbm_model.pkl",
+    'cat': "cat_model.pkl",
+}
+PESI_PATH = "ensemble_pesi.json"
+
+
+class EnsemblePredittore:
+    """
+    Combina le predizioni di un sottoinsieme dei modelli salvati.
+    Ogni modello predice lo stesso batch in un thread separato (le predict
+    native di sklearn/LightGBM/CatBoost rilasciano il GIL), poi le predizioni
+    vengono unite con media pesata o con i coefficienti di stacking
+    (intercetta diversa da None).
+    Espone predict(X) come un singolo modello: può sostituire final_system.
+    """
+
+    def __init__(self, modelli, pesi=None, intercetta=None, n_thread=None):
+        if not modelli:
+            raise ValueError("Serve almeno un modello per l'ensemble")
+        self.modelli = dict(modelli)
+        self.intercetta = intercetta
+        self.pesi = self._normalizza_pesi(pesi)
+        self._pool = ThreadPoolExecutor(max_workers=n_thread or len(self.modelli),
+                                        thread_name_prefix="ensemble")
+
+    def _normalizza_pesi(self, pesi):
+        if pesi is None:
+            return {nome: 1.0 / len(self.modelli) for nome in self.modelli}
+        pesi = {nome: float(pesi.get(nome, 0.0)) for nome in self.modelli}
+        if self.intercetta is None:
+            # Media pesata: i pesi dei modelli disponibili vengono riportati a somma 1
+            totale = sum(pesi.values())
+            if totale <= 0:
+                return {nome: 1.0 / len(self.modelli) for nome in self.modelli}
+            pesi = {nome: p / totale for nome, p in pesi.items()}
+        return pesi
+
+    @classmethod
+    def da_file(cls, nomi=None, pesi=None, cartella=".", pesi_path=None):
+        """
+        Prepara (in modo pigro) i modelli richiesti tra rf/lgbm/cat.
+        Gli artefatti mancanti vengono saltati con un avviso.
+        """
+        nomi = list(nomi) if nomi else list(MODELLI_FILE)
+        modelli = {}
+        for nome in nomi:
+            if nome not in MODELLI_FILE:
+                raise ValueError(f"Modello sconosciuto: {nome} (validi: {', '.join(MODELLI_FILE)})")
+            path = os.path.join(cartella, MODELLI_FILE[nome])
+            if os.path.exists(path):
+                modelli[nome] = ArtefattoLazy(path, f"Modello {nome}")
+            else:
+                print(f"  File '{MODELLI_FILE[nome]}' non trovato: {nome} escluso dall'ensemble")
+        if not modelli:
+            raise FileNotFoundError("Nessun modello disponibile per l'ensemble")
+
+        intercetta = None
+        pesi_path = pesi_path or os.path.join(cartella, PESI_PATH)
+        if pesi is None and os.path.exists(pesi_path):
+            with open(pesi_path) as f:
+                salvati = json.load(f)
+            pesi = salvati['pesi']
+            # Lo stacking vale solo con gli stessi modelli, altrimenti resta una media pesata
+            if set(pesi) == set(modelli):
+                intercetta = salvati.get('intercetta')
+        return cls(modelli, pesi=pesi, intercetta=intercetta)
+
+    def predici_tutti(self, X):
+        """Predizioni di ogni modello sullo stesso batch, in parallelo."""
+        futuri = {nome: self._pool.submit(modello.predict, X) for nome, modello in self.modelli.items()}
+        risultati = {}
+        for nome, futuro in futuri.items():
+            try:
+                risultati[nome] = np.asarray(futuro.result(), dtype=np.float64).ravel()
+            except Exception as e:
+                print(f"  Modello {nome} non disponibile ({e}): escluso da questa predizione")
+        if not risultati:
+            raise RuntimeError("Tutti i modelli dell'ensemble hanno fallito la predizione")
+        return risultati
+
+    def predict(self, X):
+        risultati = self.predici_tutti(X)
+        if self.intercetta is None:
+            # Se un modello è fallito, i pesi dei rimanenti vengono rinormalizzati
+            totale = sum(self.pesi[nome] for nome in risultati) or 1.0
+            return sum(self.pesi[nome] / totale * pred for nome, pred in risultati.items())
+        if set(risultati) != set(self.modelli):
+            # Lo stacking non è definito senza tutti i modelli: media semplice
+            return np.mean(list(risultati.values()), axis=0)
+        return self.intercetta + sum(self.pesi[nome] * pred for nome, pred in risultati.items())
+
+    def adatta_pesi(self, X, y, metodo="media"):
+        """
+        Stima i pesi su un insieme di validazione.
+        metodo='media': pesi ∝ 1/MSE di ciascun modello.
+        metodo='stacking': regressione lineare con coefficienti non negativi.
+        """
+        risultati = self.predici_tutti(X)
+        nomi = list(risultati)
+        y = np.asarray(y, dtype=np.float64)
+
+        if metodo == "stacking":
+            from sklearn.linear_model import LinearRegression
+            P = np.column_stack([risultati[nome] for nome in nomi])
+            reg = LinearRegression(positive=True).fit(P, y)
+            self.intercetta = float(reg.intercept_)
+            self.pesi = {nome: float(c) for nome, c in zip(nomi, reg.coef_)}
+        elif metodo == "media":
+            inv_mse = {nome: 1.0 / max(np.mean((risultati[nome] - y) ** 2), 1e-12) for nome in nomi}
+            self.intercetta = None
+            self.pesi = self._normalizza_pesi(inv_mse)
+        else:
+            raise ValueError(f"Metodo sconosciuto: {metodo}")
+        return self.pesi
+
+    def salva_pesi(self, path=PESI_PATH):
+        with open(path, 'w') as f:
+            json.dump({'pesi': self.pesi, 'intercetta': self.intercetta}, f, indent=2)
+
+
+def parse_pesi(testo):
+    """'rf=0.5,lgbm=0.3,cat=0.2' → dict."""
+    pesi = {}
+    for parte in testo.split(','):
+        nome, _, valore = parte.partition('=')
+        pesi[nome.strip()] = float(valore)
+    return pesi
+
+
+if __name__ == "__main__":
+    import argparse
+    import joblib
+    from sklearn.metrics import mean_squared_error
+    from sklearn.model_selection import train_test_split
+    from cache_dataset import carica_dataset
+
+    parser = argparse.ArgumentParser(description="Stima i pesi dell'ensemble su un hold-out")
+    parser.add_argument("--modelli", default="rf,lgbm,cat", help="Sottoinsieme di rf,lgbm,cat")
+    parser.add_argument("--metodo", choices=["media", "stacking"], default="stacking")
+    args = parser.parse_args()
+
+    print("="*70)
+    print("🧩 STIMA PESI ENSEMBLE")
+    print("="*70)
+
+    df = carica_dataset("spotify_clean.csv")
+    X_columns = joblib.load("X_columns.pkl")
+    preprocessor = joblib.load("scaler_preprocessor.pkl")
+
+    # Stesso hold-out del notebook spotify_ml.ipynb, diviso a metà:
+    # una parte per stimare i pesi, l'altra per valutarli
+    _, X_test, _, y_test = train_test_split(df[X_columns], df['popularity'], test_size=0.2, random_state=42)
+    X_val, X_eval, y_val, y_eval = train_test_split(X_test, y_test, test_size=0.5, random_state=42)
+    X_val_pre = preprocessor.transform(X_val)
+    X_eval_pre = preprocessor.transform(X_eval)
+
+    ensemble = EnsemblePredittore.da_file(args.modelli.split(','), pesi={})
+    for nome, pred in ensemble.predici_tutti(X_eval_pre).items():
+        print(f"   • {nome:5s} RMSE: {np.sqrt(mean_squared_error(y_eval, pred)):.3f}")
+
+    pesi = ensemble.adatta_pesi(X_val_pre, y_val, metodo=args.metodo)
+    rmse = np.sqrt(mean_squared_error(y_eval, ensemble.predict(X_eval_pre)))
+    print(f"\n✅ Pesi ({args.metodo}): {pesi}  intercetta: {ensemble.intercetta}")
+    print(f"   • Ensemble RMSE: {rmse:.3f}")
+
+    ensemble.salva_pesi(PESI_PATH)
+    print(f"💾 Salvato: {PESI_PATH}")
@@ -0,0 +1,237 @@
+# feature_pipeline.py - FEATURE DERIVATE CONDIVISE (training, rigenerazione, inferenza)
+import numpy as np
+import pandas as pd
+
+
+ANNO_RIFERIMENTO = 2025
+SOGLIA_LABEL_RARE = 50
+TEMPO_BINS = np.array([0, 80, 140, 250])
+TEMPO_LABELS = np.array(['slow', 'medium', 'fast'], dtype=object)
+
+
+# --- FORMULE (stesse del notebook spotify_ml.ipynb, su cui è addestrato il modello) ---
+
+def _date(c):
+    return np.asarray(c['release_date'], dtype='datetime64[D]')
+
+
+def _release_year(c, s):
+    return _date(c).astype('datetime64[Y]').astype(np.int64) + 1970
+
+
+def _release_month(c, s):
+    return _date(c).astype('datetime64[M]').astype(np.int64) % 12 + 1
+
+
+def _release_weekday(c, s):
+    # 1970-01-01 era giovedì (lunedì = 0, come pandas .dt.weekday)
+    return (_date(c).astype(np.int64) + 3) % 7
+
+
+def _release_quarter(c, s):
+    return (np.asarray(c['release_month'], dtype=np.int64) - 1) // 3 + 1
+
+
+def _tempo_stimato(c, s):
+    # Solo se il dataset non ha tempo: energy alta = tempo alto
+    return np.asarray(c['energy'], dtype=np.float64) * 150
+
+
+def _tempo_cat(c, s):
+    tempo = np.asarray(c['tempo'], dtype=np.float64)
+    # Intervalli chiusi a destra come pd.cut: (0, 80], (80, 140], (140, 250]
+    idx = np.searchsorted(TEMPO_BINS, tempo, side='left') - 1
+    valido = (tempo > TEMPO_BINS[0]) & (tempo <= TEMPO_BINS[-1])
+    out = np.full(len(tempo), 'nan', dtype=object)
+    out[valido] = TEMPO_LABELS[idx[valido]]
+    return out
+
+
+def _label_grouped(c, s):
+    label = np.asarray(c['label']).astype(str).astype(object)
+    frequenti = s.get('label_frequenti')
+    if frequenti is None:
+        valori, conteggi = np.unique(label, return_counts=True)
+        frequenti = set(valori[conteggi >= SOGLIA_LABEL_RARE])
+    return np.where(pd.Series(label).isin(frequenti).to_numpy(), label, 'Other')
+
+
+def _high_stream(c, s):
+    stream = np.asarray(c['stream_count'], dtype=np.float64)
+    mediana = s.get('stream_count_mediana')
+    if mediana is None:
+        mediana = np.median(stream)
+    return (stream > mediana).astype(np.int64)
+
+
+def _f(c, nome):
+    return np.asarray(c[nome], dtype=np.float64)
+
+
+# nome → (dipendenze, funzione(colonne, statistiche))
+FEATURE_DERIVATE = {
+    'release_year': (('release_date',), _release_year),
+    'release_month': (('release_date',), _release_month),
+    'release_weekday': (('release_date',), _release_weekday),
+    'release_quarter': (('release_month',), _release_quarter),
+    'release_age': (('release_year',), lambda c, s: ANNO_RIFERIMENTO - np.asarray(c['release_year'], dtype=np.int64)),
+    'tempo': (('energy',), _tempo_stimato),
+    'dance_energy_product': (('danceability', 'energy'), lambda c, s: _f(c, 'danceability') * _f(c, 'energy')),
+    'dance_energy_ratio': (('danceability', 'energy'), lambda c, s: _f(c, 'danceability') / (_f(c, 'energy') + 1e-5)),
+    'tempo_loudness_ratio': (('tempo', 'loudness'), lambda c, s: _f(c, 'tempo') / (_f(c, 'loudness') + 1e-5)),
+    'high_stream': (('stream_count',), _high_stream),
+    'high_energy_fast': (('tempo', 'energy'),
+                         lambda c, s: ((_f(c, 'tempo') > 140) & (_f(c, 'energy') > 0.7)).astype(np.int64)),
+    'loudness_per_sec': (('loudness', 'duration_s'), lambda c, s: _f(c, 'loudness') / _f(c, 'duration_s')),
+    'dance_x_loud': (('danceability', 'loudness_per_sec'), lambda c, s: _f(c, 'danceability') * _f(c, 'loudness_per_sec')),
+    'energy_x_tempo': (('energy', 'tempo'), lambda c, s: _f(c, 'energy') * _f(c, 'tempo')),
+    'tempo_cat': (('tempo',), _tempo_cat),
+    'label_grouped': (('label',), _label_grouped),
+}
+
+# Stime usate solo quando la colonna manca del tutto: mai ricalcolate né salvate come colonne
+STIME = {'tempo'}
+
+
+# --- PIANIFICAZIONE SUL GRAFO DELLE DIPENDENZE ---
+
+def piano_calcolo(richieste, disponibili, modificate=()):
+    """
+    Ordine topologico delle sole feature da calcolare per ottenere `richieste`.
+    Una colonna già disponibile non si ricalcola, a meno che dipenda
+    (anche indirettamente) da una colonna in `modificate`.
+    Le feature non calcolabili per mancanza di dati vengono semplicemente saltate.
+    """
+    disponibili = set(disponibili)
+    modificate = set(modificate)
+    piano = []
+    stato = {}  # nome → True (ottenibile) / False (non ottenibile)
+
+    def dipende_da_modificate(nome, visti=()):
+        if nome in modificate:
+            return True
+        if nome not in FEATURE_DERIVATE or nome in visti:
+            return False
+        if nome in STIME and nome in disponibili:
+            return False
+        return any(dipende_da_modificate(d, visti + (nome,)) for d in FEATURE_DERIVATE[nome][0])
+
+    def visita(nome, pila=()):
+        if nome in stato:
+            return stato[nome]
+        presente = nome in disponibili
+        if presente and not (nome not in modificate and dipende_da_modificate(nome)):
+            stato[nome] = True
+            return True
+        if nome not in FEATURE_DERIVATE or nome in pila:
+            stato[nome] = presente
+            return presente
+        dipendenze, _ = FEATURE_DERIVATE[nome]
+        if all(visita(d, pila + (nome,)) for d in dipendenze):
+            piano.append(nome)
+            stato[nome] = True
+            return True
+        stato[nome] = presente
+        return presente
+
+    for nome in richieste:
+        visita(nome)
+    return piano
+
+
+def dipendenze_base(richieste):
+    """Colonne non derivate da cui dipendono (transitivamente) le feature richieste."""
+    basi = set()
+    pila = list(richieste)
+    visti = set()
+    while pila:
+        nome = pila.pop()
+        if nome in visti:
+            continue
+        visti.add(nome)
+        if nome in FEATURE_DERIVATE and nome not in STIME:
+            pila.extend(FEATURE_DERIVATE[nome][0])
+        else:
+            basi.add(nome)
+    return basi
+
+
+def calcola_feature(colonne, richieste, statistiche=None, modificate=()):
+    """
+    Calcola in una sola passata sul grafo le feature richieste mancanti.
+    colonne: mapping nome → array (dict, DataFrame, record array)
+    Restituisce un dict con le sole colonne calcolate.
+    """
+    statistiche = statistiche or {}
+    disponibili = list(colonne.keys()) if hasattr(colonne, 'keys') else list(colonne.dtype.names)
+    piano = piano_calcolo(richieste, disponibili, modificate)
+
+    vista = _VistaColonne(colonne)
+    calcolate = {}
+    for nome in piano:
+        _, funzione = FEATURE_DERIVATE[nome]
+        valori = funzione(vista, statistiche)
+        calcolate[nome] = valori
+        vista.nuove[nome] = valori
+    return calcolate
+
+
+class _VistaColonne:
+    """Colonne originali + quelle appena calcolate, senza copiare l'input."""
+
+    def __init__(self, colonne):
+        self.colonne = colonne
+        self.nuove = {}
+
+    def __getitem__(self, nome):
+        if nome in self.nuove:
+            return self.nuove[nome]
+        valori = self.colonne[nome]
+        return valori.to_numpy() if hasattr(valori, 'to_numpy') else valori
+
+
+def statistiche_globali(df):
+    """Statistiche sull'intero dataset usate da high_stream e label_grouped."""
+    statistiche = {}
+    if 'stream_count' in df.columns:
+        statistiche['stream_count_mediana'] = float(np.median(df['stream_count'].to_numpy()))
+    if 'label' in df.columns:
+        conteggi = df['label'].astype(str).value_counts()
+        statistiche['label_frequenti'] = set(conteggi[conteggi >= SOGLIA_LABEL_RARE].index)
+    return statistiche
+
+
+def statistiche_da_profilo(profilo):
+    """Le stesse statistiche ricavate dal DatasetProfile, senza riscansionare il dataset."""
+    statistiche = {}
+    if profilo is None:
+        return statistiche
+    salvate = getattr(profilo, 'statistiche', None) or {}
+    # Mediana vera come nel training: centrali ha la media per le colonne float
+    if 'stream_count_mediana' in salvate:
+        statistiche['stream_count_mediana'] = salvate['stream_count_mediana']
+    elif 'stream_count' in profilo.centrali:
+        statistiche['stream_count_mediana'] = profilo.centrali['stream_count']
+    if 'label_frequenti' in salvate:
+        statistiche['label_frequenti'] = set(salvate['label_frequenti'])
+    elif 'label_grouped' in profilo.vocabolari:
+        # Profili senza statistiche salvate (es. bundle vecchi)
+        statistiche['label_frequenti'] = set(profilo.vocabolari['label_grouped']) - {'Other'}
+    return statistiche
+
+
+def aggiungi_feature(df, richieste=None, statistiche=None, modificate=(), verbose=False):
+    """
+    Aggiunge a df (in place) le feature richieste che mancano (o che dipendono
+    da colonne in `modificate`). richieste=None → tutte le feature derivate calcolabili.
+    """
+    if richieste is None:
+        richieste = [nome for nome in FEATURE_DERIVATE if nome not in STIME]
+    calcolate = calcola_feature(df, richieste, statistiche, modificate)
+    for nome, valori in calcolate.items():
+        if nome in STIME and nome not in richieste:
+            continue
+        df[nome] = valori
+        if verbose:
+            print(f"✅ Creato: {nome}")
+    return df
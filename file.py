@@ -1,146 +1,261 @@
 #!/usr/bin/env python3
 """
 Script per aggiungere le feature mancanti a spotify_clean.csv
+
+Uso:
+    python file.py                                  → rigenerazione completa
+    python file.py --incrementale nuove_tracce.csv  → solo le tracce nuove, in append
 """
+import argparse
+import json
+import os
+import shutil
+import sys
 import pandas as pd
 import numpy as np
 import joblib
 
-print("="*70)
-print("🔧 RIGENERAZIONE FEATURE - Aggiungi Feature Mancanti")
-print("="*70)
-
-# 1. Carica dataset esistente
-print("\n📂 Caricamento spotify_clean.csv...")
-df = pd.read_csv('spotify_clean.csv')
-print(f"✅ Dataset caricato: {df.shape[0]} righe × {df.shape[1]} colonne")
-print(f"\n📋 Colonne presenti: {list(df.columns)}")
-
-# 2. Carica X_columns per sapere cosa serve
-print("\n📂 Caricamento X_columns.pkl...")
-X_columns = joblib.load('X_columns.pkl')
-print(f"✅ X_columns caricato: {len(X_columns)} features richieste")
-
-# 3. Identifica feature mancanti
-missing = [col for col in X_columns if col not in df.columns]
-print(f"\n⚠️  Feature mancanti: {len(missing)}")
-for col in missing:
-    print(f"   - {col}")
-
-# 4. Crea feature mancanti
-print("\n🔨 Creazione feature mancanti...")
-
-# Feature numeriche derivate
-if 'release_year' in df.columns and 'release_age' not in df.columns:
-    df['release_age'] = 2025 - df['release_year']
-    print("✅ Creato: release_age")
-
-if 'danceability' in df.columns and 'energy' in df.columns:
-    if 'dance_energy_product' not in df.columns:
-        df['dance_energy_product'] = df['danceability'] * df['energy']
-        print("✅ Creato: dance_energy_product")
-    
-    if 'dance_energy_ratio' not in df.columns:
-        df['dance_energy_ratio'] = df['danceability'] / (df['energy'] + 1e-5)
-        print("✅ Creato: dance_energy_ratio")
-
-if 'energy' in df.columns and 'energy_x_tempo' not in df.columns:
-    # Se non c'è tempo, stimiamo da energy
-    if 'tempo' in df.columns:
-        df['energy_x_tempo'] = df['energy'] * df['tempo']
-    else:
-        # Stima: energy alta = tempo alto
-        estimated_tempo = df['energy'] * 150
-        df['energy_x_tempo'] = df['energy'] * estimated_tempo
-    print("✅ Creato: energy_x_tempo")
-
-if 'energy' in df.columns and 'high_energy_fast' not in df.columns:
-    if 'tempo' in df.columns:
-        df['high_energy_fast'] = ((df['tempo'] > 140) & (df['energy'] > 0.7)).astype(int)
-    else:
-        df['high_energy_fast'] = (df['energy'] > 0.7).astype(int)
-    print("✅ Creato: high_energy_fast")
+from cache_dataset import carica_dataset
+from feature_pipeline import aggiungi_feature, SOGLIA_LABEL_RARE
 
-if 'loudness' in df.columns and 'duration_s' in df.columns and 'loudness_per_sec' not in df.columns:
-    df['loudness_per_sec'] = df['loudness'] / (df['duration_s'] + 1e-5)
-    print("✅ Creato: loudness_per_sec")
 
-if 'danceability' in df.columns and 'loudness_per_sec' in df.columns and 'dance_x_loud' not in df.columns:
-    df['dance_x_loud'] = df['danceability'] * df['loudness_per_sec']
-    print("✅ Creato: dance_x_loud")
+DATASET_PATH = 'spotify_clean.csv'
+STATO_DIR = '.feature_state'
+# Istogramma di stream_count su log1p: bin larghi ~0.14% in valore relativo fino a 1e12
+N_BIN_STREAM = 20_000
+MAX_LOG_STREAM = float(np.log1p(1e12))
 
-if 'tempo_loudness_ratio' not in df.columns and 'loudness' in df.columns:
-    if 'tempo' in df.columns:
-        df['tempo_loudness_ratio'] = df['tempo'] / (abs(df['loudness']) + 1e-5)
-    else:
-        estimated_tempo = df['energy'] * 150 if 'energy' in df.columns else 120
-        df['tempo_loudness_ratio'] = estimated_tempo / (abs(df['loudness']) + 1e-5)
-    print("✅ Creato: tempo_loudness_ratio")
-
-# Feature categoriche
-if 'tempo_cat' not in df.columns:
-    if 'tempo' in df.columns:
-        df['tempo_cat'] = pd.cut(df['tempo'], bins=[0, 80, 140, 250], labels=['slow', 'medium', 'fast'])
-    elif 'energy' in df.columns:
-        # Stima da energy
-        df['tempo_cat'] = pd.cut(df['energy'], bins=[0, 0.4, 0.7, 1.0], labels=['slow', 'medium', 'fast'])
+
+# --- STATO PER LA MODALITÀ INCREMENTALE ---
+
+def _hash_track_id(serie):
+    return pd.util.hash_array(np.asarray(serie.astype(str), dtype=object))
+
+
+def istogramma_stream(valori, istogramma=None):
+    """
+    Aggiunge i valori all'istogramma di stream_count (bin uniformi su log1p):
+    il costo dipende solo dalle righe nuove, non dallo storico.
+    """
+    if istogramma is None:
+        istogramma = np.zeros(N_BIN_STREAM, dtype=np.int64)
+    valori = np.asarray(valori, dtype=np.float64)
+    valori = valori[~np.isnan(valori)]
+    bin_ = (np.log1p(np.maximum(valori, 0)) / MAX_LOG_STREAM * N_BIN_STREAM).astype(np.int64)
+    return istogramma + np.bincount(np.clip(bin_, 0, N_BIN_STREAM - 1), minlength=N_BIN_STREAM)
+
+
+def mediana_da_istogramma(istogramma):
+    """Mediana stimata (interpolata nel bin centrale): errore relativo entro la larghezza di un bin."""
+    totale = int(istogramma.sum())
+    if totale == 0:
+        return None
+    cumulata = np.cumsum(istogramma)
+    i = int(np.searchsorted(cumulata, totale / 2))
+    frazione = (totale / 2 - (cumulata[i] - istogramma[i])) / istogramma[i]
+    return float(np.expm1((i + frazione) / N_BIN_STREAM * MAX_LOG_STREAM))
+
+
+def salva_stato(stato, stream_hist, track_hash, stato_dir=STATO_DIR):
+    """
+    Aggregati correnti: conteggi per label (JSON), istogramma di stream_count
+    per la mediana e hash dei track_id già presenti (array .npy).
+    """
+    os.makedirs(stato_dir, exist_ok=True)
+    np.save(os.path.join(stato_dir, 'stream_hist.npy'), stream_hist)
+    np.save(os.path.join(stato_dir, 'track_hash.npy'), track_hash)
+    with open(os.path.join(stato_dir, 'stato.json'), 'w') as f:
+        json.dump(stato, f, indent=2)
+
+
+def carica_stato(stato_dir=STATO_DIR):
+    path = os.path.join(stato_dir, 'stato.json')
+    if not os.path.exists(path):
+        return None, None, None
+    with open(path) as f:
+        stato = json.load(f)
+    path_hist = os.path.join(stato_dir, 'stream_hist.npy')
+    if os.path.exists(path_hist):
+        stream_hist = np.load(path_hist)
     else:
-        df['tempo_cat'] = 'medium'
-    df['tempo_cat'] = df['tempo_cat'].astype(str)
-    print("✅ Creato: tempo_cat")
+        # Stato salvato con tutti i valori di stream_count: convertito una volta sola
+        stream_hist = istogramma_stream(np.load(os.path.join(stato_dir, 'stream_count.npy')))
+    track_hash = np.load(os.path.join(stato_dir, 'track_hash.npy'))
+    return stato, stream_hist, track_hash
+
 
-if 'label_grouped' not in df.columns:
+def stato_da_dataframe(df):
+    """Inizializza gli aggregati a partire dal dataset completo."""
+    stato = {
+        'n_righe': int(len(df)),
+        'label_counts': {},
+        'watermark': {},
+    }
     if 'label' in df.columns:
-        label_counts = df['label'].value_counts()
-        rare_labels = label_counts[label_counts < 50].index
-        df['label_grouped'] = df['label'].replace(rare_labels, 'Other')
+        stato['label_counts'] = {str(k): int(v) for k, v in df['label'].value_counts().items() if v > 0}
+    stream_hist = istogramma_stream(df['stream_count'].to_numpy() if 'stream_count' in df.columns else [])
+    track_hash = _hash_track_id(df['track_id']) if 'track_id' in df.columns else np.array([], dtype=np.uint64)
+    return stato, stream_hist, track_hash
+
+
+# --- MODALITÀ ---
+
+def rigenerazione_completa():
+    print("="*70)
+    print("🔧 RIGENERAZIONE FEATURE - Aggiungi Feature Mancanti")
+    print("="*70)
+
+    # 1. Carica dataset esistente
+    print(f"\n📂 Caricamento {DATASET_PATH}...")
+    df = carica_dataset(DATASET_PATH)
+    print(f"✅ Dataset caricato: {df.shape[0]} righe × {df.shape[1]} colonne")
+    print(f"\n📋 Colonne presenti: {list(df.columns)}")
+
+    # 2. Carica X_columns per sapere cosa serve
+    print("\n📂 Caricamento X_columns.pkl...")
+    X_columns = joblib.load('X_columns.pkl')
+    print(f"✅ X_columns caricato: {len(X_columns)} features richieste")
+
+    # 3. Identifica feature mancanti
+    missing = [col for col in X_columns if col not in df.columns]
+    print(f"\n⚠️  Feature mancanti: {len(missing)}")
+    for col in missing:
+        print(f"   - {col}")
+
+    # 4. Crea feature mancanti
+    # Stesse formule del training (feature_pipeline.py); mediana di stream_count
+    # e label rare calcolate sull'intero dataset
+    print("\n🔨 Creazione feature mancanti...")
+    df = aggiungi_feature(df, verbose=True)
+
+    # 5. Verifica che ora abbiamo tutte le colonne
+    print(f"\n🔍 Verifica finale...")
+    still_missing = [col for col in X_columns if col not in df.columns]
+
+    if still_missing:
+        print(f"⚠️  Ancora mancanti ({len(still_missing)}):")
+        for col in still_missing:
+            print(f"   - {col}")
+            # Aggiungi con valore di default
+            df[col] = 0
+            print(f"      → Aggiunto con valore 0")
     else:
-        df['label_grouped'] = 'Unknown'
-    df['label_grouped'] = df['label_grouped'].astype(str)
-    print("✅ Creato: label_grouped")
+        print("✅ Tutte le colonne richieste sono ora presenti!")
+
+    # 6. Salva nuovo dataset
+    print(f"\n💾 Salvataggio...")
+    # Il backup è una copia del file originale: niente seconda serializzazione del DataFrame
+    shutil.copyfile(DATASET_PATH, 'spotify_clean_BACKUP.csv')
+    print("✅ Backup salvato: spotify_clean_BACKUP.csv")
+
+    df.to_csv(DATASET_PATH, index=False)
+    print(f"✅ Nuovo dataset salvato: {DATASET_PATH}")
+    print(f"   Dimensioni finali: {df.shape[0]} righe × {df.shape[1]} colonne")
+
+    # Aggregati per i successivi aggiornamenti incrementali
+    salva_stato(*stato_da_dataframe(df))
+    print(f"✅ Stato incrementale salvato in {STATO_DIR}/")
+
+    # 7. Test finale
+    print(f"\n🧪 Test finale...")
+    try:
+        preprocessor = joblib.load('scaler_preprocessor.pkl')
+        test_row = df.iloc[0:1][X_columns].copy()
+        transformed = preprocessor.transform(test_row)
+        print(f"✅ Test riuscito! Il preprocessor funziona correttamente")
+        print(f"   Input: {len(X_columns)} features → Output: {transformed.shape[1]} features")
+    except Exception as e:
+        print(f"❌ Test fallito: {e}")
+
+    print("\n" + "="*70)
+    print("🏁 Rigenerazione completata!")
+    print("="*70)
+    print("\n💡 Ora puoi eseguire: python main.py")
+
+
+def aggiornamento_incrementale(delta_path):
+    """
+    Aggiunge in coda a spotify_clean.csv solo le tracce nuove di delta_path.
+    Le tracce già viste si riconoscono dal track_id; le righe di delta_path
+    già lette si saltano grazie al watermark salvato nello stato.
+    Mediana di stream_count (stimata da un istogramma persistente) e label
+    rare vengono dagli aggregati correnti, aggiornati con le sole righe nuove
+    (le righe già scritte non vengono ricalcolate: per riallinearle serve una
+    rigenerazione completa).
+    """
+    print("="*70)
+    print("🔧 AGGIORNAMENTO INCREMENTALE FEATURE")
+    print("="*70)
+
+    stato, stream_hist, track_hash = carica_stato()
+    if stato is None:
+        print(f"❌ Nessuno stato in {STATO_DIR}/: esegui prima la rigenerazione completa (python file.py)")
+        sys.exit(1)
+
+    X_columns = joblib.load('X_columns.pkl')
+    header = pd.read_csv(DATASET_PATH, nrows=0).columns.tolist()
 
-if 'high_stream' not in df.columns:
-    if 'stream_count' in df.columns:
-        df['high_stream'] = (df['stream_count'] > df['stream_count'].median()).astype(int)
+    # 1. Solo le righe di delta_path oltre il watermark
+    chiave = os.path.abspath(delta_path)
+    watermark = stato['watermark'].get(chiave, 0)
+    delta = pd.read_csv(delta_path, skiprows=range(1, watermark + 1))
+    print(f"\n📂 {delta_path}: {len(delta)} righe nuove dopo il watermark ({watermark})")
+    n_lette = len(delta)
+
+    # 2. Scarta i track_id già presenti (e i duplicati interni al delta)
+    if 'track_id' in delta.columns and len(delta):
+        hash_delta = _hash_track_id(delta['track_id'])
+        nuovi = ~np.isin(hash_delta, track_hash) & ~pd.Series(hash_delta).duplicated().to_numpy()
+        delta = delta[nuovi].reset_index(drop=True)
+        hash_delta = hash_delta[nuovi]
+        print(f"🔍 Tracce non ancora presenti: {len(delta)}")
     else:
-        df['high_stream'] = 0
-    print("✅ Creato: high_stream")
+        hash_delta = np.array([], dtype=np.uint64)
 
-# 5. Verifica che ora abbiamo tutte le colonne
-print(f"\n🔍 Verifica finale...")
-still_missing = [col for col in X_columns if col not in df.columns]
+    if len(delta) == 0:
+        stato['watermark'][chiave] = watermark + n_lette
+        salva_stato(stato, stream_hist, track_hash)
+        print("✅ Nessuna traccia nuova da aggiungere")
+        return
 
-if still_missing:
-    print(f"⚠️  Ancora mancanti ({len(still_missing)}):")
-    for col in still_missing:
-        print(f"   - {col}")
-        # Aggiungi con valore di default
-        df[col] = 0
-        print(f"      → Aggiunto con valore 0")
-else:
-    print("✅ Tutte le colonne richieste sono ora presenti!")
-
-# 6. Salva nuovo dataset
-print(f"\n💾 Salvataggio...")
-df.to_csv('spotify_clean_BACKUP.csv', index=False)
-print("✅ Backup salvato: spotify_clean_BACKUP.csv")
-
-df.to_csv('spotify_clean.csv', index=False)
-print("✅ Nuovo dataset salvato: spotify_clean.csv")
-print(f"   Dimensioni finali: {df.shape[0]} righe × {df.shape[1]} colonne")
-
-# 7. Test finale
-print(f"\n🧪 Test finale...")
-try:
-    preprocessor = joblib.load('scaler_preprocessor.pkl')
-    test_row = df.iloc[0:1][X_columns].copy()
-    transformed = preprocessor.transform(test_row)
-    print(f"✅ Test riuscito! Il preprocessor funziona correttamente")
-    print(f"   Input: {len(X_columns)} features → Output: {transformed.shape[1]} features")
-except Exception as e:
-    print(f"❌ Test fallito: {e}")
-
-print("\n" + "="*70)
-print("🏁 Rigenerazione completata!")
-print("="*70)
-print("\n💡 Ora puoi eseguire: python main.py")
\ No newline at end of file
+    # 3. Aggiorna gli aggregati globali con le sole righe nuove
+    statistiche = {}
+    if 'label' in delta.columns:
+        for label, count in delta['label'].astype(str).value_counts().items():
+            stato['label_counts'][label] = stato['label_counts'].get(label, 0) + int(count)
+    statistiche['label_frequenti'] = {l for l, c in stato['label_counts'].items() if c >= SOGLIA_LABEL_RARE}
+
+    if 'stream_count' in delta.columns:
+        stream_hist = istogramma_stream(delta['stream_count'].to_numpy(), stream_hist)
+    mediana = mediana_da_istogramma(stream_hist)
+    if mediana is not None:
+        statistiche['stream_count_mediana'] = mediana
+
+    # 4. Feature solo per il delta
+    delta = aggiungi_feature(delta, statistiche=statistiche)
+
+    # 5. Allinea allo schema del file esistente e accoda
+    for col in header:
+        if col not in delta.columns:
+            delta[col] = 0 if col in X_columns else np.nan
+    delta[header].to_csv(DATASET_PATH, mode='a', header=False, index=False)
+
+    stato['n_righe'] += len(delta)
+    stato['watermark'][chiave] = watermark + n_lette
+    salva_stato(stato, stream_hist, np.concatenate([track_hash, hash_delta]))
+
+    print(f"✅ Aggiunte {len(delta)} tracce a {DATASET_PATH} (totale {stato['n_righe']} righe)")
+    n_rare = len(stato['label_counts']) - len(statistiche['label_frequenti'])
+    print(f"   Mediana stream_count: {statistiche.get('stream_count_mediana')} | Label rare: {n_rare}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rigenerazione delle feature derivate di spotify_clean.csv")
+    parser.add_argument("--incrementale", metavar="CSV",
+                        help="Aggiunge solo le tracce nuove di questo CSV invece di riscrivere tutto")
+    args = parser.parse_args()
+
+    if args.incrementale:
+        aggiornamento_incrementale(args.incrementale)
+    else:
+        rigenerazione_completa()
@@ -0,0 +1,97 @@
+# indice_hit.py - INDICE DELLA POPOLARITÀ PER GRUPPO (paese, genere, ...) PER LE QUERY SULLE HIT
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+
+class IndiceHit:
+    """
+    Popolarità ordinata per gruppo (es. country, oppure country+genre).
+    Le righe sono ordinate per (gruppo, popolarità) in un unico array:
+    il numero di tracce con popolarità >= soglia di ogni gruppo si ottiene
+    con una sola searchsorted vettoriale, O(gruppi × log n), senza
+    riscandire il dataset a ogni soglia.
+    """
+
+    def __init__(self, chiavi, gruppi, inizi, popolarita, minimo, passo):
+        self.chiavi = tuple(chiavi)
+        self.gruppi = gruppi          # Index (o MultiIndex) delle etichette dei gruppi
+        self.inizi = inizi            # offset di inizio di ogni gruppo (+ totale in fondo)
+        self.popolarita = popolarita  # popolarità spostata per gruppo: gid*passo + (pop - minimo)
+        self.minimo = minimo
+        self.passo = passo
+
+    @classmethod
+    def da_dataframe(cls, df, chiavi=('country',), colonna='popularity'):
+        chiavi = tuple(chiavi)
+        pop = df[colonna].to_numpy(dtype=np.float64)
+        codici, gruppi = pd.MultiIndex.from_arrays([df[c] for c in chiavi]).factorize() \
+            if len(chiavi) > 1 else pd.factorize(df[chiavi[0]], sort=True)
+
+        # Righe senza gruppo o senza popolarità non contano
+        valide = (codici >= 0) & ~np.isnan(pop)
+        codici, pop = codici[valide], pop[valide]
+
+        ordine = np.lexsort((pop, codici))
+        codici, pop = codici[ordine], pop[ordine]
+        inizi = np.searchsorted(codici, np.arange(len(gruppi) + 1))
+
+        # Un solo array monotono: i gruppi occupano intervalli disgiunti di ampiezza passo
+        minimo = float(pop.min()) if len(pop) else 0.0
+        passo = (float(pop.max()) - minimo + 1.0) if len(pop) else 1.0
+        spostata = codici * passo + (pop - minimo)
+
+        if len(chiavi) > 1:
+            gruppi = pd.MultiIndex.from_tuples(list(gruppi), names=chiavi)
+        else:
+            # Etichette semplici anche da colonne category (niente categorie vuote nei grafici)
+            gruppi = pd.Index(np.asarray(gruppi, dtype=object), name=chiavi[0])
+        return cls(chiavi, gruppi, inizi, spostata, minimo, passo)
+
+    def conteggi(self, soglia):
+        """Tracce con popolarità >= soglia per ogni gruppo (Series indicizzata per gruppo)."""
+        return pd.Series(self._conteggi(np.array([soglia], dtype=np.float64))[:, 0], index=self.gruppi)
+
+    def conteggi_per_soglie(self, soglie):
+        """Matrice gruppi × soglie in un'unica searchsorted (per sweep di soglie)."""
+        soglie = np.asarray(soglie, dtype=np.float64)
+        return pd.DataFrame(self._conteggi(soglie), index=self.gruppi, columns=soglie)
+
+    def _conteggi(self, soglie):
+        n_gruppi = len(self.gruppi)
+        # Soglie fuori dal range dei dati vengono riportate ai bordi del gruppo
+        relative = np.clip(soglie - self.minimo, 0.0, self.passo - 1.0)
+        cerca = np.arange(n_gruppi)[:, None] * self.passo + relative[None, :]
+        posizioni = np.searchsorted(self.popolarita, cerca.ravel(), side='left').reshape(n_gruppi, len(soglie))
+        posizioni[:, soglie > self.minimo + self.passo - 1.0] = self.inizi[1:, None]
+        return self.inizi[1:, None] - posizioni
+
+    def top_k(self, soglia, k=10):
+        """I k gruppi con più hit (conteggi > 0), in ordine decrescente."""
+        conteggi = self._conteggi(np.array([soglia], dtype=np.float64))[:, 0]
+        k = min(k, len(conteggi))
+        if k == 0:
+            return pd.Series(dtype=np.int64)
+        migliori = np.argpartition(-conteggi, k - 1)[:k]
+        migliori = migliori[np.argsort(-conteggi[migliori], kind='stable')]
+        migliori = migliori[conteggi[migliori] > 0]
+        return pd.Series(conteggi[migliori], index=self.gruppi[migliori])
+
+
+# LRU piccola: tiene in vita i DataFrame (per la validità dell'id), quindi pochi
+MAX_INDICI = 2
+_INDICI = OrderedDict()
+
+
+def indice_hit(df, chiavi=('country',), colonna='popularity'):
+    """IndiceHit memoizzato per DataFrame e chiavi: costruito alla prima query, poi riusato."""
+    chiave = (id(df), tuple(chiavi), colonna)
+    if chiave in _INDICI:
+        _INDICI.move_to_end(chiave)
+        return _INDICI[chiave][1]
+    # Si tiene anche il riferimento al DataFrame: l'id resta valido
+    _INDICI[chiave] = (df, IndiceHit.da_dataframe(df, chiavi, colonna))
+    if len(_INDICI) > MAX_INDICI:
+        _INDICI.popitem(last=False)
+    return _INDICI[chiave][1]
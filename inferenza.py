@@ -0,0 +1,300 @@
+# inferenza.py - PERCORSO DI INFERENZA COMPILATO (senza pandas per richiesta)
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+
+from avvio import ArtefattoLazy
+
+
+COMPILATO_PATH = "preprocessor_compilato.npz"
+
+
+class PreprocessorCompilato:
+    """
+    Versione "appiattita" del ColumnTransformer salvato in scaler_preprocessor.pkl:
+    medie/scale dello StandardScaler e vocabolari del OneHotEncoder come array
+    NumPy. Trasforma un dict (una traccia) o un batch di colonne direttamente
+    nella matrice di input del modello, senza DataFrame né reindex.
+    Con sparse=True i batch escono in CSR: solo le numeriche non nulle e
+    un 1 per ogni categorica, invece di una colonna densa per categoria.
+    """
+
+    def __init__(self, colonne_num, media, scala, colonne_cat, vocabolari,
+                 drop_idx, ignora_sconosciute=False, sparse=False):
+        self.colonne_num = list(colonne_num)
+        self.media = np.asarray(media, dtype=np.float64)
+        self.scala = np.asarray(scala, dtype=np.float64)
+        self.colonne_cat = list(colonne_cat)
+        self.vocabolari = [np.asarray(v, dtype=str) for v in vocabolari]
+        self.drop_idx = np.asarray(drop_idx, dtype=np.int64)
+        self.ignora_sconosciute = ignora_sconosciute
+        self.sparse = sparse
+
+        # Per ogni categoria: colonna di output relativa (-1 = categoria eliminata da drop)
+        self.posizioni = []
+        self.indici_cat = []
+        # Vocabolari come stringhe in ordine lessicografico, con le posizioni al seguito:
+        # l'ordine di categories_ non è quello delle stringhe (es. [2, 10] → ['2', '10'])
+        self.ordinati = []
+        offset = len(self.colonne_num)
+        self.offset_cat = []
+        for voc, drop in zip(self.vocabolari, self.drop_idx):
+            pos = np.arange(len(voc), dtype=np.int64)
+            if drop >= 0:
+                pos[pos > drop] -= 1
+                pos[drop] = -1
+            self.posizioni.append(pos)
+            self.indici_cat.append({v: int(p) for v, p in zip(voc.tolist(), pos)})
+            ordine = np.argsort(voc, kind='stable')
+            self.ordinati.append((voc[ordine], pos[ordine]))
+            self.offset_cat.append(offset)
+            offset += len(voc) - (1 if drop >= 0 else 0)
+        self.n_output = offset
+
+    @classmethod
+    def da_sklearn(cls, preprocessor):
+        """Estrae i parametri da un ColumnTransformer (StandardScaler + OneHotEncoder) già addestrato."""
+        colonne_num, media, scala = [], None, None
+        colonne_cat, vocabolari, drop_idx = [], [], []
+        ignora = False
+        sparse = False
+
+        for name, transformer, columns in preprocessor.transformers_:
+            if transformer == 'drop' or name == 'remainder':
+                continue
+            if hasattr(transformer, 'categories_'):
+                colonne_cat = list(columns)
+                vocabolari = [list(c) for c in transformer.categories_]
+                if transformer.drop_idx_ is None:
+                    drop_idx = [-1] * len(colonne_cat)
+                else:
+                    drop_idx = [-1 if d is None else int(d) for d in transformer.drop_idx_]
+                ignora = transformer.handle_unknown != 'error'
+                sparse = bool(getattr(preprocessor, 'sparse_output_', False))
+            elif hasattr(transformer, 'scale_') or hasattr(transformer, 'mean_'):
+                colonne_num = list(columns)
+                n = len(colonne_num)
+                media = transformer.mean_ if transformer.mean_ is not None else np.zeros(n)
+                scala = transformer.scale_ if transformer.scale_ is not None else np.ones(n)
+            else:
+                raise ValueError(f"Transformer non supportato: {name} ({type(transformer).__name__})")
+
+        if media is None:
+            media, scala = np.zeros(0), np.ones(0)
+        return cls(colonne_num, media, scala, colonne_cat, vocabolari, drop_idx, ignora, sparse)
+
+    # --- TRASFORMAZIONE ---
+
+    def _errore_sconosciuta(self, col, valore):
+        return ValueError(f"Found unknown categories [{valore!r}] in column '{col}' during transform")
+
+    def trasforma_record(self, record):
+        """Un dict colonna → valore diventa una riga (1, n_output) pronta per predict."""
+        out = np.zeros((1, self.n_output))
+        n_num = len(self.colonne_num)
+        valori = np.fromiter((float(record[c]) for c in self.colonne_num), dtype=np.float64, count=n_num)
+        out[0, :n_num] = (valori - self.media) / self.scala
+
+        for col, indice, offset in zip(self.colonne_cat, self.indici_cat, self.offset_cat):
+            valore = str(record[col])
+            pos = indice.get(valore)
+            if pos is None:
+                if self.ignora_sconosciute:
+                    continue
+                raise self._errore_sconosciuta(col, valore)
+            if pos >= 0:
+                out[0, offset + pos] = 1.0
+        return out
+
+    def _colonne_output_cat(self, colonne, col, voc, pos):
+        """
+        Colonna di output relativa di ogni riga per una categorica (-1 = nessun 1 da scrivere).
+        voc/pos: vocabolario ordinato e posizioni corrispondenti (self.ordinati).
+        """
+        valori = np.asarray(colonne[col]).astype(str)
+        codici = np.searchsorted(voc, valori)
+        codici_validi = np.minimum(codici, len(voc) - 1)
+        trovati = voc[codici_validi] == valori
+        if not trovati.all() and not self.ignora_sconosciute:
+            raise self._errore_sconosciuta(col, valori[~trovati][0])
+        return np.where(trovati, pos[codici_validi], -1)
+
+    def trasforma_colonne(self, colonne, sparse=None):
+        """
+        Batch in forma colonnare: qualsiasi mapping colonna → array
+        (dict di array NumPy, record array, DataFrame).
+        sparse=None → secondo l'artefatto (self.sparse).
+        """
+        n = len(colonne[self.colonne_num[0] if self.colonne_num else self.colonne_cat[0]])
+        if self.sparse if sparse is None else sparse:
+            return self._trasforma_sparse(colonne, n)
+        out = np.zeros((n, self.n_output))
+        for j, col in enumerate(self.colonne_num):
+            out[:, j] = np.asarray(colonne[col], dtype=np.float64)
+        n_num = len(self.colonne_num)
+        out[:, :n_num] -= self.media
+        out[:, :n_num] /= self.scala
+
+        righe = np.arange(n)
+        for col, (voc, pos), offset in zip(self.colonne_cat, self.ordinati, self.offset_cat):
+            colonna_out = self._colonne_output_cat(colonne, col, voc, pos)
+            attivi = colonna_out >= 0
+            out[righe[attivi], offset + colonna_out[attivi]] = 1.0
+        return out
+
+    def _trasforma_sparse(self, colonne, n):
+        """
+        CSR costruita direttamente: per ogni riga al più n_num + n_cat valori,
+        già in ordine di colonna (numeriche, poi un blocco per categorica).
+        """
+        import scipy.sparse as sp
+        n_num, n_cat = len(self.colonne_num), len(self.colonne_cat)
+        valori = np.ones((n, n_num + n_cat))
+        indici = np.empty((n, n_num + n_cat), dtype=np.int32)
+        presenti = np.empty((n, n_num + n_cat), dtype=bool)
+
+        for j, col in enumerate(self.colonne_num):
+            valori[:, j] = (np.asarray(colonne[col], dtype=np.float64) - self.media[j]) / self.scala[j]
+            indici[:, j] = j
+        presenti[:, :n_num] = valori[:, :n_num] != 0
+
+        for k, (col, (voc, pos), offset) in enumerate(zip(self.colonne_cat, self.ordinati,
+                                                           self.offset_cat)):
+            colonna_out = self._colonne_output_cat(colonne, col, voc, pos)
+            indici[:, n_num + k] = offset + colonna_out
+            presenti[:, n_num + k] = colonna_out >= 0
+
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(presenti.sum(axis=1), out=indptr[1:])
+        return sp.csr_matrix((valori[presenti], indici[presenti], indptr), shape=(n, self.n_output))
+
+    def transform(self, X):
+        """Stessa interfaccia di ColumnTransformer.transform (DataFrame in ingresso)."""
+        if isinstance(X, dict):
+            return self.trasforma_record(X)
+        return self.trasforma_colonne(X)
+
+    # --- SALVATAGGIO ---
+
+    def salva(self, path=COMPILATO_PATH):
+        """Solo array NumPy piatti: nessun pickle, caricamento immediato."""
+        dati = {
+            'colonne_num': np.asarray(self.colonne_num, dtype=str),
+            'media': self.media,
+            'scala': self.scala,
+            'colonne_cat': np.asarray(self.colonne_cat, dtype=str),
+            'drop_idx': self.drop_idx,
+            'ignora_sconosciute': np.asarray(self.ignora_sconosciute),
+            'sparse': np.asarray(self.sparse),
+        }
+        for i, voc in enumerate(self.vocabolari):
+            dati[f'vocabolario_{i}'] = voc
+        np.savez(path, **dati)
+
+    @classmethod
+    def carica(cls, path=COMPILATO_PATH):
+        with np.load(path) as dati:
+            colonne_cat = dati['colonne_cat'].tolist()
+            vocabolari = [dati[f'vocabolario_{i}'] for i in range(len(colonne_cat))]
+            return cls(
+                dati['colonne_num'].tolist(), dati['media'], dati['scala'],
+                colonne_cat, vocabolari, dati['drop_idx'],
+                bool(dati['ignora_sconosciute']),
+                bool(dati['sparse']) if 'sparse' in dati.files else False,
+            )
+
+
+# LRU piccola: tiene in vita i preprocessor (per la validità dell'id), quindi pochi
+MAX_COMPILATI = 2
+_COMPILATI = OrderedDict()
+# compila è chiamata anche dai thread del server (validazione delle richieste)
+_LOCK_COMPILATI = threading.Lock()
+
+
+def preprocessore_sparse(preprocessor):
+    """
+    Copia del ColumnTransformer addestrato che restituisce CSR invece di una
+    matrice densa: stessi parametri (nessun riaddestramento), stesse colonne.
+    RandomForest, LightGBM e CatBoost accettano CSR così com'è.
+    """
+    import copy
+    if isinstance(preprocessor, PreprocessorCompilato):
+        sparse = copy.copy(preprocessor)
+        sparse.sparse = True
+        return sparse
+    sparse = copy.deepcopy(preprocessor)
+    for _, transformer, _ in sparse.transformers_:
+        if hasattr(transformer, 'sparse_output'):
+            transformer.sparse_output = True
+    sparse.sparse_output_ = True
+    return sparse
+
+
+def compila(preprocessor):
+    """
+    Restituisce la versione compilata del preprocessor (memorizzata per oggetto).
+    Se è già compilato lo restituisce così com'è.
+    """
+    if isinstance(preprocessor, ArtefattoLazy):
+        preprocessor = preprocessor.carica()
+    if isinstance(preprocessor, PreprocessorCompilato):
+        return preprocessor
+    chiave = id(preprocessor)
+    with _LOCK_COMPILATI:
+        if chiave in _COMPILATI:
+            _COMPILATI.move_to_end(chiave)
+            return _COMPILATI[chiave][1]
+        # Si tiene anche il riferimento al preprocessor: l'id resta valido
+        compilato = PreprocessorCompilato.da_sklearn(preprocessor)
+        _COMPILATI[chiave] = (preprocessor, compilato)
+        if len(_COMPILATI) > MAX_COMPILATI:
+            _COMPILATI.popitem(last=False)
+        return compilato
+
+
+def verifica_parita(preprocessor, compilato, df_campione, tolleranza=1e-9):
+    """
+    Confronta il percorso sklearn con quello compilato, sia in batch sia per
+    singola traccia. Restituisce la massima differenza assoluta.
+    """
+    atteso = preprocessor.transform(df_campione)
+    atteso = np.asarray(atteso.toarray() if hasattr(atteso, 'toarray') else atteso, dtype=np.float64)
+    batch = compilato.trasforma_colonne(df_campione)
+    batch = batch.toarray() if hasattr(batch, 'toarray') else batch
+    diff = float(np.max(np.abs(atteso - batch))) if atteso.size else 0.0
+
+    for i in range(min(len(df_campione), 50)):
+        record = df_campione.iloc[i].to_dict()
+        riga = compilato.trasforma_record(record)
+        diff = max(diff, float(np.max(np.abs(atteso[i] - riga[0]))))
+
+    if diff > tolleranza:
+        raise AssertionError(f"Percorso compilato diverso da sklearn: diff massima {diff:.3e}")
+    return diff
+
+
+if __name__ == "__main__":
+    import joblib
+    import pandas as pd
+
+    print("="*70)
+    print("⚙️  ESPORTAZIONE PREPROCESSOR COMPILATO")
+    print("="*70)
+
+    preprocessor = joblib.load("scaler_preprocessor.pkl")
+    X_columns = joblib.load("X_columns.pkl")
+    compilato = PreprocessorCompilato.da_sklearn(preprocessor)
+    print(f"✅ {len(compilato.colonne_num)} numeriche + {len(compilato.colonne_cat)} categoriche "
+          f"→ {compilato.n_output} colonne di output")
+
+    if os.path.exists("spotify_clean.csv"):
+        df = pd.read_csv("spotify_clean.csv")
+        campione = df[X_columns].sample(min(len(df), 2000), random_state=42)
+        diff = verifica_parita(preprocessor, compilato, campione)
+        print(f"✅ Parità con sklearn verificata su {len(campione)} righe (diff max {diff:.2e})")
+    else:
+        print("⚠️  spotify_clean.csv non trovato: verifica di parità saltata")
+
+    compilato.salva(COMPILATO_PATH)
+    print(f"💾 Salvato: {COMPILATO_PATH}")
@@ -1,4 +1,10 @@
+import sys
+from contextlib import nullcontext
+
+from avvio import profilo_da_argv, ArtefattoLazy
 
+# Attivato prima degli import pesanti, altrimenti non li misura
+PROFILO_AVVIO = profilo_da_argv()
 
 from utils import (
     predici_popolarita_interattiva, 
@@ -7,14 +13,28 @@ from utils import (
     visualizza_predizioni_animate, 
     visualizza_onda_sonora_da_predizione
 )
+from sensibilita import sensibilita_interattiva
+from ricerca_hit import ricerca_hit_interattiva
+from profilo import carica_o_costruisci_profilo, PROFILO_PATH
+from cache_dataset import carica_dataset
+from ensemble import EnsemblePredittore, MODELLI_FILE, parse_pesi
+from bundle import BUNDLE_PATH, apri_bundle
+from campionatore import imposta_campionatore, campionatore_pigro
+from strumentazione import STRUMENTAZIONE, chiamata
+from rendering import RENDERER
+import argparse
 import joblib
-import pandas as pd
-import sys
+import numpy as np
 import os
 
 
-def carica_risorse():
-    """Carica tutti i file necessari per il funzionamento."""
+def carica_risorse(modelli=None, pesi=None, sparse=False, bundle=BUNDLE_PATH):
+    """
+    Carica tutti i file necessari per il funzionamento.
+    modelli: sottoinsieme di rf/lgbm/cat da combinare in ensemble (None = solo Random Forest)
+    sparse: il preprocessor restituisce CSR invece di una matrice densa
+    bundle: cartella del bundle versionato; se non esiste si usano i singoli file .pkl
+    """
     try:
         print(" Caricamento risorse...")
         
@@ -22,34 +42,52 @@ def carica_risorse():
         if not os.path.exists("spotify_clean.csv"):
             print(" File 'spotify_clean.csv' non trovato!")
             print(" Esegui prima: python regenerate_features.py")
-            return None, None, None, None
+            return None, None, None, None, None
         
-        df = pd.read_csv("spotify_clean.csv")
+        df = carica_dataset("spotify_clean.csv")
         print(f" Dataset caricato: {len(df)} righe × {df.shape[1]} colonne")
         
+        artefatti = apri_bundle(bundle)
+        if artefatti is not None:
+            return (df,) + carica_da_bundle(artefatti, df, modelli, pesi, sparse)
+        
         # Carica preprocessor
         if not os.path.exists("scaler_preprocessor.pkl"):
             print(" File 'scaler_preprocessor.pkl' non trovato!")
             print(" Esegui il notebook ml.ipynb per generare i file")
-            return None, None, None, None
+            return None, None, None, None, None
         
-        preprocessor = joblib.load("scaler_preprocessor.pkl")
-        print(" Preprocessor caricato")
+        # sklearn viene importato solo alla prima transform
+        if sparse:
+            from inferenza import preprocessore_sparse
+            preprocessor = ArtefattoLazy("scaler_preprocessor.pkl", "Preprocessor (CSR)",
+                                         trasforma=preprocessore_sparse)
+        else:
+            preprocessor = ArtefattoLazy("scaler_preprocessor.pkl", "Preprocessor")
+        print(" Preprocessor pronto (caricato al primo utilizzo)")
         
-        # Carica modello
-        if not os.path.exists("rf_model.pkl"):
-            print(" File 'rf_model.pkl' non trovato!")
-            print(" Esegui il notebook ml.ipynb per generare i file")
-            return None, None, None, None
+        # Carica modello (Random Forest o ensemble dei modelli disponibili)
+        if modelli is None and not os.path.exists("rf_model.pkl"):
+            print(" File 'rf_model.pkl' non trovato: uso l'ensemble dei modelli disponibili")
+            modelli = list(MODELLI_FILE)
         
-        final_system = joblib.load("rf_model.pkl")
-        print(" Modello caricato")
+        if modelli:
+            try:
+                final_system = EnsemblePredittore.da_file(modelli, pesi=pesi)
+            except FileNotFoundError as e:
+                print(f" {e}")
+                print(" Esegui il notebook ml.ipynb per generare i file")
+                return None, None, None, None, None
+            print(f" Ensemble pronto: {', '.join(f'{n}={p:.2f}' for n, p in final_system.pesi.items())}")
+        else:
+            final_system = ArtefattoLazy("rf_model.pkl", "Modello")
+            print(" Modello pronto (caricato al primo utilizzo)")
         
         # Carica colonne
         if not os.path.exists("X_columns.pkl"):
             print(" File 'X_columns.pkl' non trovato!")
             print(" Esegui il notebook ml.ipynb per generare i file")
-            return None, None, None, None
+            return None, None, None, None, None
         
         X_columns = joblib.load("X_columns.pkl")
         print(f" Colonne caricate: {len(X_columns)} features")
@@ -66,20 +104,46 @@ def carica_risorse():
             
             risposta = input("\nVuoi continuare comunque? (s/n): ").strip().lower()
             if risposta != 's':
-                return None, None, None, None
+                return None, None, None, None, None
+        
+        # Profilo statistico del dataset (calcolato una volta, riusato dagli helper)
+        profilo = carica_o_costruisci_profilo(df, "spotify_clean.csv", PROFILO_PATH)
+        print(f" Profilo dataset pronto: {len(profilo.numeriche)} numeriche, {len(profilo.categoriche)} categoriche")
         
         print(" Tutte le risorse caricate con successo!\n")
-        return df, X_columns, preprocessor, final_system
+        return df, X_columns, preprocessor, final_system, profilo
         
     except Exception as e:
         print(f" Errore durante il caricamento: {e}")
         import traceback
         traceback.print_exc()
-        return None, None, None, None
+        return None, None, None, None, None
+
+
 
+def carica_da_bundle(artefatti, df, modelli=None, pesi=None, sparse=False):
+    """X_columns, preprocessor, modello e profilo da un bundle (file verificati al primo uso)."""
+    print(f" Bundle {artefatti.path} versione {artefatti.versione}")
+    X_columns = artefatti.X_columns
+    preprocessor = artefatti.preprocessore(sparse)
+    final_system = artefatti.predittore(modelli, pesi)
+    if isinstance(final_system, EnsemblePredittore):
+        print(f" Ensemble pronto: {', '.join(f'{n}={p:.2f}' for n, p in final_system.pesi.items())}")
+    print(f" Preprocessor, modello e {len(X_columns)} features pronti (caricati al primo utilizzo)")
+    
+    profilo = artefatti.profilo()
+    if profilo is None:
+        profilo = carica_o_costruisci_profilo(df, "spotify_clean.csv", PROFILO_PATH)
+    print(" Tutte le risorse caricate con successo!\n")
+    return X_columns, preprocessor, final_system, profilo
 
-def menu_interattivo(df, X_columns, preprocessor, final_system):
-    """Menu principale dell'applicazione."""
+def menu_interattivo(df, X_columns, preprocessor, final_system, profilo=None, modalita_template='casuale',
+                     rng=None, n_processi=1):
+    """
+    Menu principale dell'applicazione.
+    rng: unico np.random.Generator di tutte le opzioni (--seed), None = non riproducibile.
+    """
+    rng = np.random.default_rng() if rng is None else rng
     while True:
         print("\n" + "="*55)
         print("🎵  SPOTIFY AI - MENU PRINCIPALE  🎵".center(55))
@@ -89,14 +153,17 @@ def menu_interattivo(df, X_columns, preprocessor, final_system):
         print("  3. 🎲  Genera tracce casuali e statistiche")
         print("  4. 🎬  Animazione predizioni in tempo reale")
         print("  5. 🎵  Onda sonora da predizione ML")
-        print("  6. 👋  Esci")
+        print("  6. 🧭  Mappa di sensibilità (griglia what-if)")
+        print("  7. 🚀  Ricerca guidata di hit")
+        print("  8. 👋  Esci")
         print("="*55)
         
-        scelta = input("\n➤ Scegli un'opzione (1-6): ").strip()
+        scelta = input("\n➤ Scegli un'opzione (1-8): ").strip()
         
         if scelta == "1":
             print("\n" + "="*55)
-            predici_popolarita_interattiva(df, X_columns, preprocessor, final_system)
+            predici_popolarita_interattiva(df, X_columns, preprocessor, final_system, profilo=profilo,
+                                           modalita_template=modalita_template, rng=rng)
             
         elif scelta == "2":
             print("\n" + "="*55)
@@ -104,7 +171,10 @@ def menu_interattivo(df, X_columns, preprocessor, final_system):
                 soglia = input("Inserisci soglia popolarità (default 80): ").strip()
                 soglia = int(soglia) if soglia else 80
                 soglia = max(0, min(100, soglia))
-                paesi_hit(df, soglia_hit=soglia)
+                gruppi = input("Raggruppa per (default country, es. country,genre): ").strip()
+                chiavi = tuple(c.strip() for c in gruppi.split(',') if c.strip()) or ('country',)
+                with chiamata('paesi_hit'):
+                    paesi_hit(df, soglia_hit=soglia, chiavi=chiavi)
             except ValueError:
                 print(" Valore non valido, uso soglia 80")
                 paesi_hit(df, soglia_hit=80)
@@ -114,26 +184,31 @@ def menu_interattivo(df, X_columns, preprocessor, final_system):
         elif scelta == "3":
             print("\n" + "="*55)
             try:
-                n_str = input("Quante tracce vuoi generare? (1-100, default 10): ").strip()
+                n_str = input("Quante tracce vuoi generare? (default 10): ").strip()
                 n = int(n_str) if n_str else 10
-                n = max(1, min(100, n))
-                generatore_hit(df, X_columns, preprocessor, final_system, n=n)
+                n = max(1, n)
+                with chiamata('generatore_hit'):
+                    generatore_hit(df, X_columns, preprocessor, final_system, n=n, profilo=profilo,
+                                   rng=rng, n_processi=n_processi)
             except ValueError:
                 print(" Valore non valido, genero 10 tracce")
-                generatore_hit(df, X_columns, preprocessor, final_system, n=10)
+                generatore_hit(df, X_columns, preprocessor, final_system, n=10, profilo=profilo, rng=rng)
             except KeyboardInterrupt:
                 print("\n Operazione annullata.")
         
         elif scelta == "4":
             print("\n" + "="*55)
             try:
-                n_str = input("Quante tracce visualizzare? (10-100, default 50): ").strip()
+                n_str = input("Quante tracce visualizzare? (10-100, default 50, 0 = monitor continuo): ").strip()
                 n = int(n_str) if n_str else 50
-                n = max(10, min(100, n))
-                visualizza_predizioni_animate(df, X_columns, preprocessor, final_system, n_tracce=n)
+                n = None if n == 0 else max(10, min(100, n))
+                with chiamata('predizioni_animate'):
+                    visualizza_predizioni_animate(df, X_columns, preprocessor, final_system, n_tracce=n, profilo=profilo,
+                                                  rng=rng)
             except ValueError:
                 print(" Valore non valido, uso 50 tracce")
-                visualizza_predizioni_animate(df, X_columns, preprocessor, final_system, n_tracce=50)
+                visualizza_predizioni_animate(df, X_columns, preprocessor, final_system, n_tracce=50, profilo=profilo,
+                                              rng=rng)
             except KeyboardInterrupt:
                 print("\n Operazione annullata.")
             except Exception as e:
@@ -142,13 +217,37 @@ def menu_interattivo(df, X_columns, preprocessor, final_system):
         elif scelta == "5":
             print("\n" + "="*55)
             try:
-                visualizza_onda_sonora_da_predizione(df, X_columns, preprocessor, final_system)
+                with chiamata('onda_sonora'):
+                    visualizza_onda_sonora_da_predizione(df, X_columns, preprocessor, final_system, profilo=profilo,
+                                                         rng=rng)
             except KeyboardInterrupt:
                 print("\n  Operazione annullata.")
             except Exception as e:
                 print(f"\n Errore durante l'animazione: {e}")
                 
         elif scelta == "6":
+            print("\n" + "="*55)
+            try:
+                with chiamata('sensibilita'):
+                    sensibilita_interattiva(df, X_columns, preprocessor, final_system, profilo=profilo,
+                                            modalita_template=modalita_template, rng=rng)
+            except ValueError as e:
+                print(f" Valore non valido: {e}")
+            except KeyboardInterrupt:
+                print("\n  Operazione annullata.")
+                
+        elif scelta == "7":
+            print("\n" + "="*55)
+            try:
+                with chiamata('ricerca_hit'):
+                    ricerca_hit_interattiva(df, X_columns, preprocessor, final_system, profilo=profilo,
+                                            modalita_template=modalita_template, rng=rng)
+            except ValueError as e:
+                print(f" Valore non valido: {e}")
+            except KeyboardInterrupt:
+                print("\n  Operazione annullata.")
+                
+        elif scelta == "8":
             print("\n" + "="*55)
             print(" Grazie per aver usato Spotify AI!".center(55))
             print(" A presto!".center(55))
@@ -156,7 +255,7 @@ def menu_interattivo(df, X_columns, preprocessor, final_system):
             break
             
         else:
-            print("  Opzione non valida. Scegli un numero tra 1 e 6.")
+            print("  Opzione non valida. Scegli un numero tra 1 e 8.")
 
 
 def stampa_banner():
@@ -174,13 +273,104 @@ def stampa_banner():
     print(banner)
 
 
+def parse_args(argv=None):
+    """Argomenti da riga di comando: senza sottocomando parte il menu interattivo."""
+    parser = argparse.ArgumentParser(description="Spotify AI Analyzer")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="Stampa il tempo di import per pacchetto e delle fasi di avvio")
+    parser.add_argument("--ensemble", metavar="MODELLI",
+                        help="Combina più modelli, es. rf,lgbm,cat (i file mancanti vengono saltati)")
+    parser.add_argument("--pesi", metavar="PESI",
+                        help="Pesi dell'ensemble, es. rf=0.5,lgbm=0.3,cat=0.2 (default: ensemble_pesi.json o uniformi)")
+    parser.add_argument("--template", default="casuale", metavar="MODO",
+                        help="Template dell'opzione 1: casuale (default), profilo (medie/mode del dataset) "
+                             "oppure il numero di una riga fissa; gli ultimi due sono deterministici")
+    parser.add_argument("--cache", type=int, default=10_000, metavar="N",
+                        help="Predizioni memorizzate in cache LRU (default 10000, 0 = disattivata)")
+    parser.add_argument("--cache-ttl", type=float, metavar="SECONDI",
+                        help="Scadenza delle predizioni in cache (default: nessuna)")
+    parser.add_argument("--cache-disco", metavar="PATH",
+                        help="File SQLite per conservare la cache tra un avvio e l'altro")
+    parser.add_argument("--trace", action="store_true",
+                        help="Stampa su stderr il dettaglio delle fasi di ogni operazione (JSON per riga)")
+    parser.add_argument("--metriche", metavar="PATH",
+                        help="Attiva i timer per fase e li salva all'uscita (.json, oppure .prom per Prometheus)")
+    parser.add_argument("--headless", nargs="?", const="grafici", metavar="CARTELLA",
+                        help="Niente finestre: grafici (PNG) e animazioni salvati in CARTELLA (default grafici/) "
+                             "da un thread in background")
+    parser.add_argument("--formato-animazioni", choices=["gif", "mp4"], default="gif",
+                        help="Formato delle animazioni in modalità headless (mp4 richiede ffmpeg)")
+    parser.add_argument("--bundle", default=BUNDLE_PATH, metavar="CARTELLA",
+                        help=f"Bundle versionato degli artefatti (default {BUNDLE_PATH}, se esiste; '' = file .pkl)")
+    parser.add_argument("--campionatore", choices=["copula", "uniforme"], default="copula",
+                        help="Tracce sintetiche (opzioni 3-5): copula gaussiana adattata al dataset (default) "
+                             "oppure colonne uniformi indipendenti")
+    parser.add_argument("--seed", type=int,
+                        help="Seme del generatore casuale: stesse tracce, template e animazioni a ogni avvio "
+                             "(default: casuale, stampato all'avvio)")
+    parser.add_argument("--processi-generazione", type=int, default=1, metavar="N",
+                        help="Processi per generare i batch grandi di tracce (opzione 3); "
+                             "il risultato con --seed non dipende da N")
+    parser.add_argument("--sparse", action="store_true",
+                        help="One-hot in formato sparso (CSR): meno memoria per i batch grandi")
+    sub = parser.add_subparsers(dest="comando")
+    
+    serve = sub.add_parser("serve", help="Server HTTP/JSON di scoring persistente")
+    serve.add_argument("--host", default="127.0.0.1", help="Indirizzo di ascolto (default 127.0.0.1)")
+    serve.add_argument("--port", type=int, default=8000, help="Porta (default 8000)")
+    serve.add_argument("--max-batch", type=int, default=4096,
+                       help="Righe massime per micro-batch (default 4096)")
+    serve.add_argument("--max-wait-ms", type=float, default=5,
+                       help="Attesa massima per riempire un micro-batch in ms (default 5)")
+    
+    score = sub.add_parser("score", help="Scoring a blocchi di un catalogo CSV/Parquet (anche più grande della memoria)")
+    score.add_argument("input", help="File di tracce da valutare (.csv o .parquet)")
+    score.add_argument("output", help="File delle predizioni (.csv o .parquet)")
+    score.add_argument("--chunksize", type=int, default=100_000,
+                       help="Righe per blocco (default 100000)")
+    score.add_argument("--processi", type=int, default=1,
+                       help="Processi paralleli, ognuno con una copia dei modelli (default 1)")
+    score.add_argument("--spiega", action="store_true",
+                       help="Aggiunge il contributo di ogni feature alla predizione (contributo_<colonna>, valore_base)")
+    
+    return parser.parse_args(argv)
+
+
 # --- MAIN ---
 if __name__ == "__main__":
     try:
+        args = parse_args()
+        if args.trace or args.metriche:
+            STRUMENTAZIONE.abilita(traccia=args.trace)
+        if args.headless:
+            RENDERER.configura(headless=True, cartella=args.headless,
+                               formato_animazioni=args.formato_animazioni)
+        fase = PROFILO_AVVIO.fase if PROFILO_AVVIO else (lambda nome: nullcontext())
+        
+        if args.comando == "score":
+            # Niente dataset in memoria né menu: solo artefatti e streaming del catalogo
+            from scoring_batch import punteggia_file
+            punteggia_file(args.input, args.output,
+                           dimensione_blocco=max(1, args.chunksize), n_processi=max(1, args.processi),
+                           modelli=args.ensemble.split(',') if args.ensemble else None,
+                           pesi=parse_pesi(args.pesi) if args.pesi else None,
+                           sparse=args.sparse, bundle=args.bundle, spiega=args.spiega)
+            sys.exit(0)
+        
         stampa_banner()
         
         # Carica risorse
-        df, X_columns, preprocessor, final_system = carica_risorse()
+        with fase("carica_risorse"):
+            df, X_columns, preprocessor, final_system, profilo = carica_risorse(
+                modelli=args.ensemble.split(',') if args.ensemble else None,
+                pesi=parse_pesi(args.pesi) if args.pesi else None,
+                sparse=args.sparse,
+                bundle=args.bundle,
+            )
+        
+        if PROFILO_AVVIO:
+            PROFILO_AVVIO.disattiva()
+            PROFILO_AVVIO.stampa()
         
         # Verifica che tutto sia stato caricato correttamente
         if df is None or X_columns is None or preprocessor is None or final_system is None:
@@ -190,13 +380,45 @@ if __name__ == "__main__":
             print("   • scaler_preprocessor.pkl")
             print("   • rf_model.pkl")
             print("   • X_columns.pkl")
+            print("   • oppure la cartella modello.bundle (python bundle.py crea)")
             print("\n Suggerimenti:")
             print("   1. Esegui: python regenerate_features.py")
             print("   2. Oppure riesegui il notebook ml.ipynb")
             sys.exit(1)
         
-        # Avvia menu
-        menu_interattivo(df, X_columns, preprocessor, final_system)
+        if args.campionatore == "copula":
+            # Adattato (o letto da campionatore.npz / dal bundle) alla prima traccia generata
+            imposta_campionatore(campionatore_pigro(df, X_columns, apri_bundle(args.bundle)))
+        
+        if args.cache > 0:
+            from cache_predizioni import PredittoreConCache
+            final_system = PredittoreConCache(final_system, max_voci=args.cache,
+                                              ttl=args.cache_ttl, path_disco=args.cache_disco)
+        
+        if args.comando == "serve":
+            from server import avvia_server
+            # Il server carica subito i modelli: la prima richiesta non paga l'unpickling
+            preprocessor.carica()
+            for modello in getattr(final_system, 'modelli', {'modello': final_system}).values():
+                modello.carica()
+            avvia_server(X_columns, preprocessor, final_system, profilo,
+                         host=args.host, port=args.port,
+                         max_batch=args.max_batch, max_wait_ms=args.max_wait_ms)
+        else:
+            # Avvia menu
+            # Seme sempre stampato: anche una sessione senza --seed si può ripetere
+            seed = args.seed if args.seed is not None else np.random.SeedSequence().entropy
+            print(f" Seed: {seed}" + ("" if args.seed is not None else " (--seed per ripetere la sessione)"))
+            menu_interattivo(df, X_columns, preprocessor, final_system, profilo,
+                             modalita_template=args.template, rng=np.random.default_rng(seed),
+                             n_processi=max(1, args.processi_generazione))
+            RENDERER.attendi()
+        
+        if STRUMENTAZIONE.attiva:
+            STRUMENTAZIONE.stampa()
+            if args.metriche:
+                STRUMENTAZIONE.esporta(args.metriche)
+                print(f" Metriche salvate in {args.metriche}")
         
     except KeyboardInterrupt:
         print("\n\nApplicazione interrotta dall'utente. Ciao!")
@@ -0,0 +1,159 @@
+# profilo.py - STATISTICHE PRECALCOLATE DEL DATASET
+import os
+import numpy as np
+import pandas as pd
+import joblib
+
+from feature_pipeline import SOGLIA_LABEL_RARE
+
+
+PROFILO_PATH = "dataset_profile.pkl"
+
+_TIPI_INTERI_CENTRALI = ['int64', 'int32', 'uint8', 'uint16']
+# Oltre questa cardinalità una colonna è un identificativo (track_id, date, nomi):
+# niente vocabolario, resterebbero milioni di stringhe in ogni profilo e bundle
+MAX_VOCABOLARIO = 1000
+
+
+class DatasetProfile:
+    """
+    Statistiche per colonna calcolate una sola volta su spotify_clean.csv:
+    limiti min/max, valori centrali (mediana/media), mode, gruppi di dtype
+    e vocabolari delle categoriche (solo fino a MAX_VOCABOLARIO valori
+    distinti). Gli helper di utils.py lo usano al posto di riscansionare il
+    DataFrame a ogni chiamata.
+    statistiche: quelle delle feature derivate (feature_pipeline), salvate
+    esplicitamente e non ricavate dai vocabolari, che possono essere troncati:
+    'label_frequenti' = label con almeno SOGLIA_LABEL_RARE tracce,
+    'stream_count_mediana' = mediana vera (centrali ha la media per i float).
+    """
+
+    def __init__(self, colonne, dtypes, numeriche, categoriche, limiti,
+                 centrali, mode, vocabolari, n_righe, sorgente=None, statistiche=None):
+        self.colonne = colonne
+        self.dtypes = dtypes
+        self.numeriche = numeriche
+        self.categoriche = categoriche
+        self.limiti = limiti
+        self.centrali = centrali
+        self.mode = mode
+        self.vocabolari = vocabolari
+        self.n_righe = n_righe
+        self.sorgente = sorgente
+        self.statistiche = statistiche
+
+    @classmethod
+    def da_dataframe(cls, df, sorgente=None):
+        """Costruisce il profilo con una sola passata sulle colonne del DataFrame."""
+        numeriche = df.select_dtypes(include=[np.number]).columns.tolist()
+        categoriche = df.select_dtypes(include=['object', 'category']).columns.tolist()
+
+        limiti = {}
+        centrali = {}
+        for col in df.columns:
+            serie = df[col]
+            if col in numeriche:
+                limiti[col] = (serie.min(), serie.max())
+            if col in numeriche or serie.dtype == bool:
+                # Interi → mediana, float (e bool) → media
+                if serie.dtype in _TIPI_INTERI_CENTRALI:
+                    centrali[col] = int(serie.median())
+                else:
+                    centrali[col] = float(serie.mean())
+
+        mode = {}
+        vocabolari = {}
+        for col in categoriche:
+            mode_val = df[col].mode()
+            mode[col] = str(mode_val[0]) if len(mode_val) > 0 else 'Unknown'
+            if df[col].nunique() <= MAX_VOCABOLARIO:
+                vocabolari[col] = sorted(df[col].dropna().astype(str).unique().tolist())
+
+        statistiche = {}
+        if 'stream_count' in df.columns:
+            statistiche['stream_count_mediana'] = float(np.median(df['stream_count'].to_numpy()))
+        if 'label' in df.columns:
+            conteggi = df['label'].astype(str).value_counts()
+            statistiche['label_frequenti'] = sorted(conteggi[conteggi >= SOGLIA_LABEL_RARE].index)
+
+        return cls(
+            colonne=df.columns.tolist(),
+            dtypes={col: str(dtype) for col, dtype in df.dtypes.items()},
+            numeriche=numeriche,
+            categoriche=categoriche,
+            limiti=limiti,
+            centrali=centrali,
+            mode=mode,
+            vocabolari=vocabolari,
+            n_righe=len(df),
+            sorgente=sorgente,
+            statistiche=statistiche,
+        )
+
+    def colonne_disponibili(self):
+        """Stesso formato di utils.get_available_columns."""
+        return {
+            'numerical': list(self.numeriche),
+            'categorical': list(self.categoriche),
+            'all': list(self.colonne)
+        }
+
+    def salva(self, path=PROFILO_PATH):
+        joblib.dump(self, path)
+
+    @staticmethod
+    def carica(path=PROFILO_PATH):
+        return joblib.load(path)
+
+    def salva_json(self, path):
+        """Versione senza pickle (usata dal bundle degli artefatti)."""
+        import json
+        dati = dict(vars(self))
+        dati['limiti'] = {col: list(lim) for col, lim in self.limiti.items()}
+        with open(path, 'w') as f:
+            json.dump(dati, f, default=lambda v: v.item() if hasattr(v, 'item') else str(v))
+
+    @classmethod
+    def carica_json(cls, path):
+        import json
+        with open(path) as f:
+            dati = json.load(f)
+        dati['limiti'] = {col: tuple(lim) for col, lim in dati['limiti'].items()}
+        if dati.get('sorgente') is not None:
+            dati['sorgente'] = tuple(dati['sorgente'])
+        return cls(**dati)
+
+
+def firma_file(path):
+    """Firma leggera (mtime + dimensione) per capire se il CSV è cambiato."""
+    stat = os.stat(path)
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def carica_o_costruisci_profilo(df, csv_path, profilo_path=PROFILO_PATH):
+    """
+    Riusa il profilo salvato su disco se corrisponde al CSV sorgente,
+    altrimenti lo ricalcola da df e lo salva accanto a X_columns.pkl.
+    """
+    firma = firma_file(csv_path) if os.path.exists(csv_path) else None
+
+    if os.path.exists(profilo_path):
+        try:
+            profilo = DatasetProfile.carica(profilo_path)
+            # Un profilo salvato prima del limite sui vocabolari o senza le
+            # statistiche delle feature derivate va ricostruito
+            statistiche = getattr(profilo, 'statistiche', None)
+            aggiornato = (all(len(v) <= MAX_VOCABOLARIO for v in profilo.vocabolari.values())
+                          and statistiche is not None
+                          and ('stream_count' not in df.columns or 'stream_count_mediana' in statistiche))
+            if firma is not None and profilo.sorgente == firma and aggiornato:
+                return profilo
+        except Exception:
+            pass
+
+    profilo = DatasetProfile.da_dataframe(df, sorgente=firma)
+    try:
+        profilo.salva(profilo_path)
+    except OSError as e:
+        print(f"  Impossibile salvare il profilo: {e}")
+    return profilo
@@ -0,0 +1,102 @@
+# rendering.py - GRAFICI E ANIMAZIONI: FINESTRA INTERATTIVA O FILE SU DISCO (HEADLESS)
+import os
+import queue
+import threading
+import time
+
+
+class Renderer:
+    """
+    In modalità interattiva mostra(fig) equivale a plt.show().
+    In modalità headless la figura viene staccata da pyplot e consegnata a un
+    thread di rendering che la salva su disco (PNG, animazioni MP4 o GIF):
+    chi chiama non aspetta né la GUI né l'encoding dei frame.
+    """
+
+    def __init__(self):
+        self.headless = False
+        self.cartella = "grafici"
+        self.formato_animazioni = "gif"
+        self._coda = queue.Queue()
+        self._worker = None
+        self._contatore = 0
+        self._lock = threading.Lock()
+
+    def configura(self, headless=False, cartella="grafici", formato_animazioni="gif"):
+        self.headless = headless
+        self.cartella = cartella
+        self.formato_animazioni = formato_animazioni
+        if headless:
+            # Senza display: backend non interattivo, va scelto prima di creare figure
+            import matplotlib
+            matplotlib.use("Agg")
+            os.makedirs(cartella, exist_ok=True)
+
+    def _avvia_worker(self):
+        if self._worker is None:
+            self._worker = threading.Thread(target=self._loop, name="rendering", daemon=True)
+            self._worker.start()
+
+    def _loop(self):
+        while True:
+            lavoro = self._coda.get()
+            try:
+                lavoro()
+            except Exception as e:
+                print(f"\n  Rendering non riuscito: {e}")
+            finally:
+                self._coda.task_done()
+
+    def _path(self, nome, estensione):
+        with self._lock:
+            self._contatore += 1
+            numero = self._contatore
+        return os.path.join(self.cartella, f"{nome}_{time.strftime('%Y%m%d_%H%M%S')}_{numero}.{estensione}")
+
+    def mostra(self, fig, nome="grafico"):
+        import matplotlib.pyplot as plt
+        if not self.headless:
+            plt.show()
+            return None
+        path = self._path(nome, "png")
+        # Fuori da pyplot: da qui in poi la figura la usa solo il thread di rendering
+        plt.close(fig)
+        self._avvia_worker()
+        self._coda.put(lambda: fig.savefig(path, dpi=100))
+        print(f"  Grafico in scrittura: {path}")
+        return path
+
+    def mostra_animazione(self, animazione, fig, nome="animazione", fps=20):
+        import matplotlib.pyplot as plt
+        if not self.headless:
+            plt.show()
+            return None
+        from matplotlib import animation as mpl_animation
+        formato = self.formato_animazioni
+        if formato == "mp4" and not mpl_animation.writers.is_available("ffmpeg"):
+            print("  ffmpeg non disponibile: animazione salvata come GIF")
+            formato = "gif"
+        writer = "ffmpeg" if formato == "mp4" else "pillow"
+        path = self._path(nome, formato)
+        plt.close(fig)
+        self._avvia_worker()
+        self._coda.put(lambda: animazione.save(path, writer=writer, fps=fps, dpi=80))
+        print(f"  Animazione in scrittura: {path}")
+        return path
+
+    def accoda(self, lavoro):
+        """Esegue lavoro nel thread di rendering, dopo i file già in coda."""
+        self._avvia_worker()
+        self._coda.put(lavoro)
+
+    def attendi(self):
+        """Attende che tutti i file in coda siano scritti (da chiamare prima di uscire)."""
+        if self._worker is not None and self._coda.unfinished_tasks:
+            print("  Attendo il completamento dei grafici in scrittura...")
+            self._coda.join()
+
+
+# Istanza unica condivisa da utils e main
+RENDERER = Renderer()
+mostra = RENDERER.mostra
+mostra_animazione = RENDERER.mostra_animazione
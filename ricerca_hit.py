@@ -0,0 +1,191 @@
+# ricerca_hit.py - RICERCA GUIDATA DELLE FEATURE CHE MASSIMIZZANO LA POPOLARITÀ PREDETTA
+import time
+
+import numpy as np
+import pandas as pd
+
+from avvio import ArtefattoLazy
+from utils import costruisci_input, varia_template, calcola_limiti_numerici
+from inferenza import compila
+from cache_predizioni import senza_cache
+from strumentazione import fase, conta, chiamata
+from rendering import mostra
+from feature_pipeline import FEATURE_DERIVATE, STIME
+
+
+SOGLIA_HIT = 80
+
+
+def feature_ricercabili(template, df, profilo=None):
+    """
+    Colonne numeriche di base del template (non derivate: quelle derivate
+    seguono via varia_template) con limiti noti: nome → (minimo, massimo, intera).
+    """
+    limiti = profilo.limiti if profilo is not None else calcola_limiti_numerici(df, list(template))
+    ricercabili = {}
+    for col, val in template.items():
+        if col in FEATURE_DERIVATE and col not in STIME:
+            continue
+        if col not in limiti or isinstance(val, str):
+            continue
+        minimo, massimo = (float(v) for v in limiti[col])
+        if massimo <= minimo:
+            continue
+        dtype = profilo.dtypes.get(col, '') if profilo is not None else str(df[col].dtype)
+        ricercabili[col] = (minimo, massimo, dtype.startswith(('int', 'uint')))
+    return ricercabili
+
+
+def ricerca_hit(df, X_columns, preprocessor, final_system, profilo=None, modalita_template='casuale',
+                feature=None, limiti=None, vincoli=(), raggio=None, popolazione=2000, generazioni=30,
+                quota_elite=0.1, smorzamento=0.7, top_k=10, rng=None, verbose=True):
+    """
+    Metodo cross-entropy sulle feature numeriche della traccia base (template
+    del menu): a ogni generazione una popolazione di candidati viene estratta
+    da normali troncate, valutata con una sola transform e una sola predict,
+    e media/deviazione si spostano verso l'élite (la quota_elite migliore).
+    - feature: colonne da ottimizzare (default: tutte quelle ricercabili)
+    - limiti: dict colonna → (minimo, massimo) che restringe quelli del dataset
+    - vincoli: funzioni colonne → array bool; i candidati che ne violano uno vengono scartati
+    - raggio: se indicato, ogni feature resta entro ± raggio × (massimo − minimo) dalla traccia base
+    Restituisce (DataFrame dei top_k candidati distinti, storia per generazione).
+    """
+    rng = np.random.default_rng() if rng is None else rng
+    final_system = senza_cache(final_system)  # candidati sempre nuovi: la cache non servirebbe
+
+    with fase('template'):
+        template = costruisci_input(df, X_columns, {}, profilo, modalita_template, rng)
+    ricercabili = feature_ricercabili(template, df, profilo)
+    feature = list(ricercabili) if feature is None else list(feature)
+    sconosciute = [col for col in feature if col not in ricercabili]
+    if sconosciute:
+        raise ValueError(f"Feature non ricercabili (non numeriche o senza limiti): {', '.join(sconosciute)}")
+
+    minimi = np.array([ricercabili[col][0] for col in feature])
+    massimi = np.array([ricercabili[col][1] for col in feature])
+    for j, col in enumerate(feature):
+        if limiti and col in limiti:
+            minimi[j], massimi[j] = max(minimi[j], limiti[col][0]), min(massimi[j], limiti[col][1])
+    intere = np.array([ricercabili[col][2] for col in feature])
+    ampiezza = np.maximum(massimi - minimi, 1e-12)
+
+    # Spazio normalizzato [0, 1] per feature: stessa scala per tutte le deviazioni
+    base = np.clip((np.array([float(template[col]) for col in feature]) - minimi) / ampiezza, 0, 1)
+    basso, alto = np.zeros(len(feature)), np.ones(len(feature))
+    if raggio is not None:
+        basso, alto = np.clip(base - raggio, 0, 1), np.clip(base + raggio, 0, 1)
+    media, deviazione = base.copy(), (alto - basso) / 2
+    n_elite = max(2, int(popolazione * quota_elite))
+
+    compilato = compila(preprocessor)
+    # Modelli caricati prima del cronometro: le valutazioni/s misurano solo la ricerca
+    for modello in getattr(final_system, 'modelli', {'modello': final_system}).values():
+        if isinstance(modello, ArtefattoLazy):
+            modello.carica()
+    storia = []
+    migliori_valori = np.empty((0, len(feature)))
+    migliori_pred = np.empty(0)
+    valutazioni = 0
+    inizio = time.perf_counter()
+
+    with chiamata('ricerca_hit'):
+        for generazione in range(1, generazioni + 1):
+            with fase('generazione'):
+                U = np.clip(media + deviazione * rng.standard_normal((popolazione, len(feature))), basso, alto)
+                if generazione == 1:
+                    U[0] = base  # la traccia base è sempre tra i candidati
+                valori = minimi + U * ampiezza
+                valori[:, intere] = np.round(valori[:, intere])
+                colonne = varia_template(template, {col: valori[:, j] for j, col in enumerate(feature)},
+                                         X_columns, profilo)
+                ammessi = np.ones(popolazione, dtype=bool)
+                for vincolo in vincoli:
+                    ammessi &= np.asarray(vincolo(colonne), dtype=bool)
+            with fase('transform'):
+                X = compilato.trasforma_colonne(colonne)
+            with fase('predict'):
+                pred = np.clip(final_system.predict(X), 0, 100)
+            conta('tracce_predette', popolazione)
+            valutazioni += popolazione
+            if generazione == 1:
+                pred_base = float(pred[0])
+
+            punteggio = np.where(ammessi, pred, -np.inf)
+            elite = np.argpartition(-punteggio, n_elite - 1)[:n_elite]
+            elite = elite[np.isfinite(punteggio[elite])]
+            if len(elite):
+                media = smorzamento * U[elite].mean(axis=0) + (1 - smorzamento) * media
+                deviazione = smorzamento * U[elite].std(axis=0) + (1 - smorzamento) * deviazione
+
+            # Migliori candidati distinti visti finora
+            migliori_valori = np.concatenate([migliori_valori, valori[elite]])
+            migliori_pred = np.concatenate([migliori_pred, pred[elite]])
+            migliori_valori, indici = np.unique(np.round(migliori_valori, 6), axis=0, return_index=True)
+            migliori_pred = migliori_pred[indici]
+            ordine = np.argsort(-migliori_pred)[:top_k]
+            migliori_valori, migliori_pred = migliori_valori[ordine], migliori_pred[ordine]
+
+            durata = time.perf_counter() - inizio
+            storia.append({
+                'generazione': generazione,
+                'migliore': float(migliori_pred[0]) if len(migliori_pred) else float('nan'),
+                'media_elite': float(pred[elite].mean()) if len(elite) else float('nan'),
+                'ammessi': int(ammessi.sum()),
+                'valutazioni': valutazioni,
+                'valutazioni_al_s': valutazioni / max(durata, 1e-9),
+            })
+            if verbose:
+                ultimo = storia[-1]
+                print(f"   Gen {generazione:>3}  migliore {ultimo['migliore']:6.2f}  élite {ultimo['media_elite']:6.2f}  "
+                      f"({ultimo['valutazioni_al_s']:,.0f} valutazioni/s)")
+            if deviazione.max() < 1e-3:
+                break
+
+    migliori = pd.DataFrame(migliori_valori, columns=feature)
+    migliori['predicted_popularity'] = migliori_pred
+    storia[0]['base'] = pred_base
+    return migliori, storia
+
+
+def mostra_ricerca(storia, nome="ricerca_hit"):
+    """Andamento del migliore e della media dell'élite per generazione."""
+    import matplotlib.pyplot as plt
+
+    generazioni = [s['generazione'] for s in storia]
+    fig, ax = plt.subplots(figsize=(10, 5))
+    ax.plot(generazioni, [s['migliore'] for s in storia], 'o-', color='#1DB954', lw=2, label='Migliore')
+    ax.plot(generazioni, [s['media_elite'] for s in storia], 's--', color='orange', label='Media élite')
+    ax.axhline(storia[0]['base'], color='gray', ls=':', label=f"Traccia base ({storia[0]['base']:.1f})")
+    ax.axhline(SOGLIA_HIT, color='red', ls=':', label=f'Soglia Hit ({SOGLIA_HIT})')
+    ax.set_title("🚀 Ricerca guidata di hit", fontsize=14, fontweight='bold')
+    ax.set_xlabel("Generazione")
+    ax.set_ylabel("Popolarità predetta")
+    ax.grid(alpha=0.3)
+    ax.legend()
+    plt.tight_layout()
+    mostra(fig, nome)
+
+
+def ricerca_hit_interattiva(df, X_columns, preprocessor, final_system, profilo=None,
+                            modalita_template='casuale', rng=None):
+    """Opzione del menu: parametri da input, migliori candidati e grafico di convergenza."""
+    print("\n🚀 Ricerca guidata di hit (metodo cross-entropy)")
+    testo = input("Candidati per generazione (default 2000): ").strip()
+    popolazione = max(10, int(testo)) if testo else 2000
+    testo = input("Generazioni (default 30): ").strip()
+    generazioni = max(1, int(testo)) if testo else 30
+    testo = input("Distanza massima dalla traccia base, 0-1 dell'intervallo (vuoto = nessun limite): ").strip()
+    raggio = float(testo) if testo else None
+
+    print(f"\n Traccia base: template {modalita_template}")
+    migliori, storia = ricerca_hit(df, X_columns, preprocessor, final_system, profilo=profilo,
+                                   modalita_template=modalita_template, raggio=raggio,
+                                   popolazione=popolazione, generazioni=generazioni, rng=rng)
+
+    ultimo = storia[-1]
+    print(f"\n🏁 {ultimo['valutazioni']:,} valutazioni ({ultimo['valutazioni_al_s']:,.0f}/s)")
+    print(f" Popolarità: traccia base {storia[0]['base']:.2f} → migliore {ultimo['migliore']:.2f}")
+    print(f"\n Migliori {len(migliori)} candidati:")
+    print(migliori.round(3).to_string(index=False))
+    mostra_ricerca(storia)
+    return migliori
@@ -0,0 +1,198 @@
+# scoring_batch.py - SCORING A BLOCCHI DI CATALOGHI PIÙ GRANDI DELLA MEMORIA
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from utils import prepara_tracce, predici_batch, spiega_batch, categorie_sconosciute_a_moda
+from profilo import DatasetProfile, carica_o_costruisci_profilo, PROFILO_PATH
+from bundle import BUNDLE_PATH, apri_bundle
+from spiegazioni import COLONNA_BASE, PREFISSO_CONTRIBUTO
+
+
+COLONNE_ID = ['track_id', 'track_name', 'artist_name']
+COLONNA_PREDIZIONE = 'predicted_popularity'
+
+
+# --- LETTURA / SCRITTURA IN STREAMING ---
+
+def _is_parquet(path):
+    return path.lower().endswith(('.parquet', '.pq'))
+
+
+def leggi_a_blocchi(path, dimensione_blocco):
+    """Generatore di DataFrame di al più dimensione_blocco righe (CSV o Parquet)."""
+    if _is_parquet(path):
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=dimensione_blocco):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize=dimensione_blocco)
+
+
+class ScrittorePredizioni:
+    """Accoda i blocchi di predizioni al file di output (CSV o Parquet) man mano che arrivano."""
+
+    def __init__(self, path):
+        self.path = path
+        self._parquet = None
+        self._primo = True
+
+    def scrivi(self, blocco):
+        if _is_parquet(self.path):
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            tabella = pa.Table.from_pandas(blocco, preserve_index=False)
+            if self._parquet is None:
+                self._parquet = pq.ParquetWriter(self.path, tabella.schema)
+            self._parquet.write_table(tabella)
+        else:
+            blocco.to_csv(self.path, mode='w' if self._primo else 'a', header=self._primo, index=False)
+        self._primo = False
+
+    def chiudi(self):
+        if self._parquet is not None:
+            self._parquet.close()
+
+
+# --- SCORING DI UN BLOCCO ---
+
+def punteggia_blocco(blocco, X_columns, preprocessor, final_system, profilo=None, spiega=False):
+    """
+    Feature engineering + transform + predict di un blocco. Restituisce (output, categorie sostituite).
+    spiega=True aggiunge il contributo di ogni feature (contributo_<colonna>) e il valore base.
+    """
+    output = blocco[[col for col in COLONNE_ID if col in blocco.columns]].copy()
+    df_tracce = prepara_tracce(blocco, X_columns, profilo)
+    sostituite = categorie_sconosciute_a_moda(df_tracce, preprocessor, profilo)
+    output[COLONNA_PREDIZIONE] = predici_batch(df_tracce, preprocessor, final_system)
+    if spiega:
+        contributi = spiega_batch(df_tracce, X_columns, preprocessor, final_system)
+        contributi.columns = [c if c == COLONNA_BASE else PREFISSO_CONTRIBUTO + c for c in contributi.columns]
+        output = pd.concat([output, contributi.set_axis(output.index)], axis=1)
+    return output, sostituite
+
+
+# --- ARTEFATTI (PROCESSO PRINCIPALE E WORKER) ---
+
+def carica_artefatti(modelli=None, pesi=None, sparse=False, bundle=BUNDLE_PATH):
+    """
+    Carica subito X_columns, preprocessor, modello (o ensemble) e profilo,
+    senza leggere spotify_clean.csv se il profilo è già salvato.
+    """
+    import joblib
+    from ensemble import EnsemblePredittore, MODELLI_FILE
+
+    artefatti = apri_bundle(bundle)
+    if artefatti is not None and artefatti.manifest.get('profilo'):
+        preprocessor = artefatti.preprocessore(sparse).carica()
+        final_system = artefatti.predittore(modelli, pesi)
+        for modello in getattr(final_system, 'modelli', {'modello': final_system}).values():
+            modello.carica()
+        return artefatti.X_columns, preprocessor, final_system, artefatti.profilo()
+
+    X_columns = joblib.load("X_columns.pkl")
+    preprocessor = joblib.load("scaler_preprocessor.pkl")
+    if sparse:
+        from inferenza import preprocessore_sparse
+        preprocessor = preprocessore_sparse(preprocessor)
+
+    if modelli is None and not os.path.exists("rf_model.pkl"):
+        modelli = list(MODELLI_FILE)
+    if modelli:
+        final_system = EnsemblePredittore.da_file(modelli, pesi=pesi)
+        for modello in final_system.modelli.values():
+            modello.carica()
+    else:
+        final_system = joblib.load("rf_model.pkl")
+
+    if os.path.exists(PROFILO_PATH):
+        profilo = DatasetProfile.carica(PROFILO_PATH)
+    elif os.path.exists("spotify_clean.csv"):
+        from cache_dataset import carica_dataset
+        profilo = carica_o_costruisci_profilo(carica_dataset("spotify_clean.csv", verbose=False),
+                                              "spotify_clean.csv", PROFILO_PATH)
+    else:
+        profilo = None
+    return X_columns, preprocessor, final_system, profilo
+
+
+_ARTEFATTI_WORKER = None
+
+
+def _inizializza_worker(modelli, pesi, sparse, bundle):
+    global _ARTEFATTI_WORKER
+    # Le stampe di caricamento dei worker non servono: una sola volta nel processo principale
+    with open(os.devnull, 'w') as nulla:
+        stdout, sys.stdout = sys.stdout, nulla
+        try:
+            _ARTEFATTI_WORKER = carica_artefatti(modelli, pesi, sparse, bundle)
+        finally:
+            sys.stdout = stdout
+
+
+def _punteggia_nel_worker(blocco, spiega=False):
+    X_columns, preprocessor, final_system, profilo = _ARTEFATTI_WORKER
+    return punteggia_blocco(blocco, X_columns, preprocessor, final_system, profilo, spiega)
+
+
+# --- PIPELINE ---
+
+def punteggia_file(input_path, output_path, dimensione_blocco=100_000, n_processi=1,
+                   modelli=None, pesi=None, sparse=False, bundle=BUNDLE_PATH, spiega=False):
+    """
+    Legge input_path a blocchi, calcola le predizioni e le scrive in output_path
+    nello stesso ordine. In memoria restano al più ~2 blocchi per processo:
+    il picco non dipende dalla dimensione del file.
+    spiega=True scrive anche i contributi delle feature di ogni traccia.
+    """
+    print("="*70)
+    print(f"📦 SCORING A BLOCCHI: {input_path} → {output_path}")
+    print("="*70)
+    print(f"   Blocchi da {dimensione_blocco} righe, {n_processi} processo/i")
+    if spiega:
+        print("   Con i contributi delle feature per ogni traccia")
+
+    scrittore = ScrittorePredizioni(output_path)
+    totale_righe = 0
+    totale_sostituite = 0
+    inizio = time.perf_counter()
+
+    def registra(risultato):
+        nonlocal totale_righe, totale_sostituite
+        output, sostituite = risultato
+        scrittore.scrivi(output)
+        totale_righe += len(output)
+        totale_sostituite += sostituite
+        velocita = totale_righe / max(time.perf_counter() - inizio, 1e-9)
+        print(f"   ✅ {totale_righe:>12,} righe  ({velocita:,.0f} righe/s)", end="\r", flush=True)
+
+    try:
+        if n_processi <= 1:
+            artefatti = carica_artefatti(modelli, pesi, sparse, bundle)
+            for blocco in leggi_a_blocchi(input_path, dimensione_blocco):
+                registra(punteggia_blocco(blocco, *artefatti, spiega=spiega))
+        else:
+            with ProcessPoolExecutor(max_workers=n_processi, initializer=_inizializza_worker,
+                                     initargs=(modelli, pesi, sparse, bundle)) as pool:
+                # Coda limitata: la lettura si ferma se i worker sono indietro
+                in_corso = deque()
+                for blocco in leggi_a_blocchi(input_path, dimensione_blocco):
+                    in_corso.append(pool.submit(_punteggia_nel_worker, blocco, spiega))
+                    if len(in_corso) >= 2 * n_processi:
+                        registra(in_corso.popleft().result())
+                while in_corso:
+                    registra(in_corso.popleft().result())
+    finally:
+        scrittore.chiudi()
+
+    durata = time.perf_counter() - inizio
+    print(f"\n\n🏁 {totale_righe:,} tracce in {durata:.1f}s ({totale_righe / max(durata, 1e-9):,.0f} righe/s)")
+    if totale_sostituite:
+        print(f"   ⚠️  {totale_sostituite} valori categorici sconosciuti sostituiti con la moda")
+    print(f"💾 Predizioni salvate in {output_path}")
+    return totale_righe
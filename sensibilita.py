@@ -0,0 +1,222 @@
+# sensibilita.py - GRIGLIA WHAT-IF: POPOLARITÀ SU TUTTE LE COMBINAZIONI DI ALCUNE FEATURE
+import os
+import time
+from itertools import combinations
+
+import numpy as np
+
+from utils import costruisci_input, varia_template
+from inferenza import compila
+from strumentazione import fase, conta, chiamata
+from rendering import RENDERER, mostra
+
+
+# feature → (minimo, massimo, punti): stessi intervalli dell'opzione 1 del menu
+ASSI_DEFAULT = {
+    'danceability': (0.0, 1.0, 100),
+    'energy': (0.0, 1.0, 100),
+    'loudness': (-60.0, 5.0, 50),
+}
+SENSIBILITA_PATH = "sensibilita.npz"
+
+
+class MappaSensibilita:
+    """
+    Cubo delle predizioni su una griglia densa: cubo[i, j, k] è la popolarità
+    della traccia base con assi[0] = valori[0][i], assi[1] = valori[1][j], ...
+    Le altre feature restano quelle della traccia base.
+    """
+
+    def __init__(self, feature, valori, cubo, base):
+        self.feature = list(feature)
+        self.valori = [np.asarray(v, dtype=np.float64) for v in valori]
+        self.cubo = cubo
+        self.base = base  # valori della traccia base per le feature della griglia
+
+    def _asse(self, nome):
+        return self.feature.index(nome)
+
+    def dipendenza_parziale(self, nome):
+        """Curva di dipendenza parziale: media del cubo sugli altri assi della griglia."""
+        asse = self._asse(nome)
+        altri = tuple(i for i in range(self.cubo.ndim) if i != asse)
+        return self.cubo.mean(axis=altri) if altri else self.cubo.copy()
+
+    def mappa(self, riga, colonna):
+        """Heatmap (valori di `riga` × valori di `colonna`), media sugli assi restanti."""
+        i, j = self._asse(riga), self._asse(colonna)
+        altri = tuple(a for a in range(self.cubo.ndim) if a not in (i, j))
+        piano = self.cubo.mean(axis=altri) if altri else self.cubo
+        return piano if i < j else piano.T
+
+    def massimo(self):
+        """Combinazione della griglia con la popolarità più alta: (dict feature → valore, predizione)."""
+        idx = np.unravel_index(np.argmax(self.cubo), self.cubo.shape)
+        punto = {nome: float(v[i]) for nome, v, i in zip(self.feature, self.valori, idx)}
+        return punto, float(self.cubo[idx])
+
+    def salva(self, path=SENSIBILITA_PATH):
+        dati = {'feature': np.asarray(self.feature, dtype=str), 'cubo': self.cubo,
+                'base': np.asarray([self.base.get(f, np.nan) for f in self.feature], dtype=np.float64)}
+        for i, v in enumerate(self.valori):
+            dati[f'valori_{i}'] = v
+        np.savez_compressed(path, **dati)
+
+    @classmethod
+    def carica(cls, path=SENSIBILITA_PATH):
+        with np.load(path) as dati:
+            feature = dati['feature'].tolist()
+            valori = [dati[f'valori_{i}'] for i in range(len(feature))]
+            base = dict(zip(feature, dati['base'].tolist()))
+            return cls(feature, valori, dati['cubo'], base)
+
+
+def crea_assi(specifiche=None, profilo=None):
+    """
+    Valori di ogni asse della griglia.
+    specifiche: dict feature → (minimo, massimo, punti) oppure solo punti
+    (intervallo dai limiti del profilo, o da ASSI_DEFAULT). None = ASSI_DEFAULT.
+    """
+    specifiche = ASSI_DEFAULT if specifiche is None else specifiche
+    assi = {}
+    for nome, spec in specifiche.items():
+        if np.isscalar(spec):
+            if profilo is not None and nome in profilo.limiti:
+                minimo, massimo = profilo.limiti[nome]
+            elif nome in ASSI_DEFAULT:
+                minimo, massimo = ASSI_DEFAULT[nome][:2]
+            else:
+                raise ValueError(f"Intervallo sconosciuto per '{nome}': indicare (minimo, massimo, punti)")
+            spec = (minimo, massimo, spec)
+        minimo, massimo, punti = spec
+        assi[nome] = np.linspace(float(minimo), float(massimo), max(1, int(punti)))
+    return assi
+
+
+def griglia_sensibilita(df, X_columns, preprocessor, final_system, assi=None, profilo=None,
+                        modalita_template='profilo', dimensione_blocco=50_000, rng=None, verbose=True):
+    """
+    Predice la popolarità su tutte le combinazioni degli assi attorno a una
+    traccia base (template del menu). Le feature derivate vengono ricalcolate
+    in modo vettoriale per blocco, e ogni blocco è una sola transform e una
+    sola predict: il picco di memoria dipende da dimensione_blocco, non dalla griglia.
+    assi: dict feature → array di valori (vedi crea_assi); None = ASSI_DEFAULT.
+    rng: np.random.Generator per il template 'casuale'.
+    """
+    assi = crea_assi(profilo=profilo) if assi is None else assi
+    feature = list(assi)
+    valori = [np.asarray(assi[nome], dtype=np.float64) for nome in feature]
+    forma = tuple(len(v) for v in valori)
+    totale = int(np.prod(forma))
+
+    with fase('template'):
+        template = costruisci_input(df, X_columns, {}, profilo, modalita_template, rng)
+    mancanti = [nome for nome in feature if nome not in template]
+    if mancanti:
+        raise ValueError(f"Feature non presenti nell'input del modello: {', '.join(mancanti)}")
+    base = {nome: float(template[nome]) for nome in feature}
+
+    compilato = compila(preprocessor)
+    cubo = np.empty(totale, dtype=np.float64)
+    inizio = time.perf_counter()
+
+    with chiamata('griglia_sensibilita'):
+        for da in range(0, totale, dimensione_blocco):
+            a = min(da + dimensione_blocco, totale)
+            n = a - da
+            with fase('preparazione'):
+                indici = np.unravel_index(np.arange(da, a), forma)
+                colonne = varia_template(template, {nome: v[idx] for nome, v, idx in zip(feature, valori, indici)},
+                                         X_columns, profilo)
+            with fase('transform'):
+                X = compilato.trasforma_colonne(colonne)
+            with fase('predict'):
+                cubo[da:a] = final_system.predict(X)
+            conta('tracce_predette', n)
+            if verbose:
+                velocita = a / max(time.perf_counter() - inizio, 1e-9)
+                print(f"   ✅ {a:>12,}/{totale:,} punti  ({velocita:,.0f} predizioni/s)", end="\r", flush=True)
+
+    if verbose:
+        durata = time.perf_counter() - inizio
+        print(f"\n   🏁 {totale:,} predizioni in {durata:.1f}s ({totale / max(durata, 1e-9):,.0f}/s)")
+    return MappaSensibilita(feature, valori, np.clip(cubo, 0, 100).reshape(forma), base)
+
+
+def mostra_sensibilita(mappa, nome="sensibilita"):
+    """Heatmap per ogni coppia di assi (media sugli altri) e curve di dipendenza parziale."""
+    import matplotlib.pyplot as plt
+
+    coppie = list(combinations(mappa.feature, 2))
+    colonne = max(len(coppie), len(mappa.feature))
+    righe = 2 if coppie else 1
+    fig, axes = plt.subplots(righe, colonne, figsize=(5 * colonne, 4.2 * righe), squeeze=False)
+    fig.suptitle("🧭 Sensibilità della popolarità predetta", fontsize=14, fontweight='bold')
+
+    for ax, (r, c) in zip(axes[0], coppie):
+        piano = mappa.mappa(r, c)
+        vr, vc = mappa.valori[mappa._asse(r)], mappa.valori[mappa._asse(c)]
+        im = ax.imshow(piano, origin='lower', aspect='auto', cmap='viridis',
+                       extent=(vc[0], vc[-1], vr[0], vr[-1]))
+        ax.plot(mappa.base[c], mappa.base[r], marker='*', color='red', markersize=12)
+        ax.set_xlabel(c)
+        ax.set_ylabel(r)
+        fig.colorbar(im, ax=ax, label='popolarità')
+
+    for ax, feature in zip(axes[-1], mappa.feature):
+        ax.plot(mappa.valori[mappa._asse(feature)], mappa.dipendenza_parziale(feature), color='#1DB954', lw=2)
+        ax.axvline(mappa.base[feature], color='red', ls='--', lw=1, label='traccia base')
+        ax.set_xlabel(feature)
+        ax.set_ylabel('popolarità media')
+        ax.grid(alpha=0.3)
+        ax.legend()
+
+    if coppie:
+        for ax in axes[0][len(coppie):]:
+            ax.axis('off')
+    for ax in axes[-1][len(mappa.feature):]:
+        ax.axis('off')
+    plt.tight_layout()
+    mostra(fig, nome)
+
+
+def sensibilita_interattiva(df, X_columns, preprocessor, final_system, profilo=None,
+                            modalita_template='profilo', rng=None):
+    """
+    Opzione del menu: risoluzione della griglia da input, grafici e cubo su disco:
+    in headless nella cartella dei grafici, altrimenti solo se si indica un percorso.
+    """
+    print("\n🧭 Mappa di sensibilità (griglia what-if)")
+    disponibili = {nome: spec for nome, spec in ASSI_DEFAULT.items() if nome in df.columns}
+    if not disponibili:
+        print(" Nessuna delle feature della griglia è presente nel dataset")
+        return None
+
+    specifiche = {}
+    for nome, (minimo, massimo, punti) in disponibili.items():
+        testo = input(f"Punti per {nome} [{minimo:g}, {massimo:g}] (default {punti}): ").strip()
+        specifiche[nome] = (minimo, massimo, max(2, int(testo)) if testo else punti)
+    totale = int(np.prod([spec[2] for spec in specifiche.values()]))
+    print(f"\n Griglia di {totale:,} punti attorno alla traccia base (template: {modalita_template})")
+
+    mappa = griglia_sensibilita(df, X_columns, preprocessor, final_system, crea_assi(specifiche),
+                                profilo=profilo, modalita_template=modalita_template, rng=rng)
+
+    punto, pred = mappa.massimo()
+    print(f"\n Traccia base: " + ", ".join(f"{k}={v:.2f}" for k, v in mappa.base.items()))
+    print(f" Popolarità sulla griglia: min {mappa.cubo.min():.2f}, media {mappa.cubo.mean():.2f}, "
+          f"max {pred:.2f}")
+    print(" Combinazione migliore: " + ", ".join(f"{k}={v:.2f}" for k, v in punto.items()))
+    for nome in mappa.feature:
+        curva = mappa.dipendenza_parziale(nome)
+        print(f"   {nome:<14} escursione media {curva.max() - curva.min():6.2f} punti")
+
+    if RENDERER.headless:
+        percorso = os.path.join(RENDERER.cartella, SENSIBILITA_PATH)
+    else:
+        percorso = input(f"Percorso per salvare il cubo (es. {SENSIBILITA_PATH}, vuoto = non salvare): ").strip()
+    if percorso:
+        mappa.salva(percorso)
+        print(f"💾 Cubo salvato in {percorso}")
+    mostra_sensibilita(mappa)
+    return mappa
@@ -0,0 +1,235 @@
+# server.py - SERVER DI SCORING PERSISTENTE (HTTP/JSON)
+import json
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from utils import tracce_da_record, predici_batch, valida_record, categorie_sconosciute_a_moda
+from strumentazione import STRUMENTAZIONE, chiamata
+
+
+class MicroBatcher:
+    """
+    Raccoglie le richieste concorrenti in un'unica coda e le unisce in
+    micro-batch: una sola preprocessor.transform e una sola predict per
+    tutte le tracce arrivate entro max_wait_ms (fino a max_batch righe).
+    """
+
+    def __init__(self, X_columns, preprocessor, final_system, profilo,
+                 max_batch=4096, max_wait_ms=5, finestra_latenze=10_000):
+        self.X_columns = X_columns
+        self.preprocessor = preprocessor
+        self.final_system = final_system
+        self.profilo = profilo
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.coda = queue.Queue()
+        self.latenze = deque(maxlen=finestra_latenze)
+        self.lock = threading.Lock()
+        self.n_richieste = 0
+        self.n_tracce = 0
+        self.n_batch = 0
+        self.n_sostituite = 0
+        self._stop = threading.Event()
+        self._worker = threading.Thread(target=self._loop, name="micro-batcher", daemon=True)
+
+    def avvia(self):
+        self._worker.start()
+
+    def ferma(self):
+        self._stop.set()
+        self.coda.put(None)
+        self._worker.join(timeout=1)
+
+    def predici(self, records):
+        """Accoda un gruppo di tracce e attende le relative predizioni."""
+        futuro = Future()
+        self.coda.put((records, futuro))
+        return futuro.result()
+
+    def _raccogli(self):
+        """Prende la prima richiesta in coda e accoda le successive fino al limite."""
+        primo = self.coda.get()
+        if primo is None:
+            return []
+        gruppo = [primo]
+        n_righe = len(primo[0])
+        scadenza = time.perf_counter() + self.max_wait
+        while n_righe < self.max_batch:
+            attesa = scadenza - time.perf_counter()
+            if attesa <= 0:
+                break
+            try:
+                elemento = self.coda.get(timeout=attesa)
+            except queue.Empty:
+                break
+            if elemento is None:
+                break
+            gruppo.append(elemento)
+            n_righe += len(elemento[0])
+        return gruppo
+
+    def _loop(self):
+        while not self._stop.is_set():
+            gruppo = self._raccogli()
+            if not gruppo:
+                continue
+            tutti = [r for records, _ in gruppo for r in records]
+            try:
+                with chiamata('micro_batch'):
+                    preds = self._predici_tracce(tutti)
+            except Exception:
+                # Una traccia non valida non deve far fallire le richieste
+                # finite nello stesso micro-batch: si riprova una per una
+                self._predici_separati(gruppo)
+                continue
+
+            inizio = 0
+            for records, futuro in gruppo:
+                fine = inizio + len(records)
+                futuro.set_result(preds[inizio:fine].tolist())
+                inizio = fine
+
+            with self.lock:
+                self.n_batch += 1
+
+    def _predici_tracce(self, records):
+        """Come lo scoring a blocchi: categorie sconosciute all'encoder → moda (contate in /stats)."""
+        df_tracce = tracce_da_record(records, self.X_columns, self.profilo)
+        sostituite = categorie_sconosciute_a_moda(df_tracce, self.preprocessor, self.profilo)
+        if sostituite:
+            with self.lock:
+                self.n_sostituite += sostituite
+        return predici_batch(df_tracce, self.preprocessor, self.final_system)
+
+    def _predici_separati(self, gruppo):
+        for records, futuro in gruppo:
+            try:
+                futuro.set_result(self._predici_tracce(records).tolist())
+            except Exception as e:
+                futuro.set_exception(e)
+            with self.lock:
+                self.n_batch += 1
+
+    def registra(self, n_tracce, latenza):
+        with self.lock:
+            self.n_richieste += 1
+            self.n_tracce += n_tracce
+            self.latenze.append(latenza)
+
+    def statistiche(self):
+        with self.lock:
+            latenze = np.array(self.latenze) * 1000
+            stats = {
+                'richieste': self.n_richieste,
+                'tracce': self.n_tracce,
+                'batch': self.n_batch,
+                'categorie_sostituite': self.n_sostituite,
+                'tracce_per_batch': self.n_tracce / self.n_batch if self.n_batch else 0.0,
+            }
+        if len(latenze):
+            stats['latenza_p50_ms'] = float(np.percentile(latenze, 50))
+            stats['latenza_p99_ms'] = float(np.percentile(latenze, 99))
+        else:
+            stats['latenza_p50_ms'] = stats['latenza_p99_ms'] = None
+        if hasattr(self.final_system, 'statistiche_cache'):
+            stats['cache'] = self.final_system.statistiche_cache()
+        return stats
+
+
+def crea_handler(batcher):
+    """Handler HTTP legato a un MicroBatcher già avviato."""
+
+    class ScoringHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _rispondi(self, codice, payload):
+            corpo = json.dumps(payload).encode("utf-8")
+            self.send_response(codice)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(corpo)))
+            self.end_headers()
+            self.wfile.write(corpo)
+
+        def do_GET(self):
+            if self.path == "/health":
+                self._rispondi(200, {'status': 'ok'})
+            elif self.path == "/stats":
+                self._rispondi(200, batcher.statistiche())
+            elif self.path == "/metrics":
+                # Timer per fase in formato Prometheus (vuoto senza --metriche/--trace)
+                corpo = STRUMENTAZIONE.formato_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(corpo)))
+                self.end_headers()
+                self.wfile.write(corpo)
+            else:
+                self._rispondi(404, {'errore': f"endpoint non trovato: {self.path}"})
+
+        def do_POST(self):
+            if self.path != "/predict":
+                self._rispondi(404, {'errore': f"endpoint non trovato: {self.path}"})
+                return
+
+            inizio = time.perf_counter()
+            try:
+                lunghezza = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(lunghezza) or b"{}")
+                records = body.get('tracks') if isinstance(body, dict) else body
+                if not isinstance(records, list) or not records:
+                    raise ValueError("serve una lista non vuota di tracce in 'tracks'")
+                # Errori di una traccia → 400 con il campo, prima di entrare nel micro-batch
+                valida_record(records, batcher.preprocessor, batcher.profilo)
+            except (ValueError, json.JSONDecodeError) as e:
+                self._rispondi(400, {'errore': str(e)})
+                return
+
+            try:
+                preds = batcher.predici(records)
+            except Exception as e:
+                self._rispondi(500, {'errore': str(e)})
+                return
+
+            batcher.registra(len(records), time.perf_counter() - inizio)
+            self._rispondi(200, {'predictions': preds})
+
+        def log_message(self, format, *args):
+            # Niente log per richiesta: a migliaia di req/s rallenta il server
+            pass
+
+    return ScoringHandler
+
+
+class ScoringHTTPServer(ThreadingHTTPServer):
+    # Backlog ampio: il default (5) rifiuta connessioni sotto carico concorrente
+    request_queue_size = 1024
+    daemon_threads = True
+
+
+def avvia_server(X_columns, preprocessor, final_system, profilo,
+                 host="127.0.0.1", port=8000, max_batch=4096, max_wait_ms=5):
+    """Avvia il server di scoring: le risorse sono già caricate una sola volta."""
+    batcher = MicroBatcher(X_columns, preprocessor, final_system, profilo,
+                           max_batch=max_batch, max_wait_ms=max_wait_ms)
+    batcher.avvia()
+
+    server = ScoringHTTPServer((host, port), crea_handler(batcher))
+
+    print(f" Server di scoring attivo su http://{host}:{port}")
+    print("   • POST /predict  {\"tracks\": [{...}, ...]}")
+    print("   • GET  /stats    latenze p50/p99 e dimensione media dei batch")
+    print("   • GET  /health")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n Server interrotto.")
+    finally:
+        server.server_close()
+        batcher.ferma()
+        print(f" Statistiche finali: {batcher.statistiche()}")
@@ -0,0 +1,126 @@
+# spiegazioni.py - CONTRIBUTI DELLE FEATURE PER OGNI TRACCIA (PERCORSI NATIVI DEI MODELLI AD ALBERI)
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from avvio import ArtefattoLazy
+from cache_predizioni import senza_cache
+from inferenza import compila
+
+
+COLONNA_BASE = 'valore_base'
+PREFISSO_CONTRIBUTO = 'contributo_'
+
+# LRU piccola: tiene in vita i modelli (per la validità dell'id), quindi pochi
+MAX_FORESTE = 2
+_FORESTE = OrderedDict()
+
+
+# --- CONTRIBUTI DI UN SINGOLO MODELLO (sulle colonne del preprocessor) ---
+
+def _foresta_compatta(modello):
+    """RandomForest sklearn → ForestaCompatta esatta (float64), convertita una sola volta per oggetto."""
+    from compatta import ForestaCompatta, alberi_da_sklearn
+    chiave = id(modello)
+    if chiave in _FORESTE:
+        _FORESTE.move_to_end(chiave)
+        return _FORESTE[chiave][1]
+    # Si tiene anche il riferimento al modello: l'id resta valido
+    _FORESTE[chiave] = (modello, ForestaCompatta.da_alberi(alberi_da_sklearn(modello),
+                                                           modello.n_features_in_))
+    if len(_FORESTE) > MAX_FORESTE:
+        _FORESTE.popitem(last=False)
+    return _FORESTE[chiave][1]
+
+
+def contributi_modello(modello, X):
+    """
+    Contributi di ogni colonna di X (già preprocessata) alla predizione:
+    (contributi righe × colonne, valore base per riga), con
+    contributi.sum(axis=1) + base == modello.predict(X).
+    - LightGBM: pred_contrib (TreeSHAP nativo)
+    - CatBoost: ShapValues (TreeSHAP nativo)
+    - Random Forest / ForestaCompatta: attribuzione per percorso (Saabas)
+    """
+    if isinstance(modello, ArtefattoLazy):
+        modello = modello.carica()
+    X = X.toarray() if hasattr(X, 'toarray') else np.asarray(X)
+    modulo = type(modello).__module__.split('.')[0]
+
+    if hasattr(modello, 'contributi'):
+        return modello.contributi(X)
+    if hasattr(modello, 'estimators_') and hasattr(modello, 'n_features_in_'):
+        return _foresta_compatta(modello).contributi(X)
+    if modulo == 'lightgbm':
+        shap = np.asarray(modello.predict(X, pred_contrib=True), dtype=np.float64)
+    elif modulo == 'catboost':
+        from catboost import Pool
+        shap = np.asarray(modello.get_feature_importance(Pool(X), type='ShapValues'), dtype=np.float64)
+    else:
+        raise TypeError(f"Spiegazioni non disponibili per {type(modello).__name__}")
+    # L'ultima colonna è il valore atteso del modello
+    return shap[:, :-1], shap[:, -1]
+
+
+def contributi_sistema(final_system, X):
+    """
+    Come contributi_modello, anche per EnsemblePredittore (combinazione con gli
+    stessi pesi e la stessa intercetta della predict: i contributi sono additivi)
+    e per il modello avvolto dalla cache delle predizioni.
+    """
+    final_system = senza_cache(final_system)
+    if not hasattr(final_system, 'predici_tutti'):
+        return contributi_modello(final_system, X)
+
+    contributi = base = 0.0
+    for nome, modello in final_system.modelli.items():
+        c, b = contributi_modello(modello, X)
+        contributi = contributi + final_system.pesi[nome] * c
+        base = base + final_system.pesi[nome] * b
+    if final_system.intercetta is not None:
+        base = base + final_system.intercetta
+    return contributi, base
+
+
+# --- RITORNO ALLE COLONNE ORIGINALI ---
+
+def matrice_gruppi(compilato, X_columns):
+    """
+    Matrice colonne del preprocessor × X_columns: ogni colonna one-hot confluisce
+    nella sua categorica, ogni numerica in se stessa.
+    """
+    indice = {col: i for i, col in enumerate(X_columns)}
+    gruppi = np.zeros((compilato.n_output, len(X_columns)))
+    for j, col in enumerate(compilato.colonne_num):
+        gruppi[j, indice[col]] = 1.0
+    for col, pos, offset in zip(compilato.colonne_cat, compilato.posizioni, compilato.offset_cat):
+        uscite = pos[pos >= 0]
+        gruppi[offset + uscite, indice[col]] = 1.0
+    return gruppi
+
+
+def spiega(df_tracce, X_columns, preprocessor, final_system, dimensione_blocco=10_000):
+    """
+    Contributi per traccia sulle X_columns (DataFrame con lo stesso indice di
+    df_tracce, più la colonna valore_base). Il batch è elaborato a blocchi di
+    dimensione_blocco righe: la memoria non dipende dal numero di tracce.
+    La somma di una riga è la predizione prima del clip in [0, 100].
+    """
+    compilato = compila(preprocessor)
+    gruppi = matrice_gruppi(compilato, X_columns)
+    out = np.empty((len(df_tracce), len(X_columns) + 1))
+    for inizio in range(0, len(df_tracce), dimensione_blocco):
+        blocco = df_tracce.iloc[inizio:inizio + dimensione_blocco]
+        X = compilato.trasforma_colonne(blocco, sparse=False)
+        contributi, base = contributi_sistema(final_system, X)
+        out[inizio:inizio + len(blocco), :-1] = contributi @ gruppi
+        out[inizio:inizio + len(blocco), -1] = base
+    return pd.DataFrame(out, index=df_tracce.index, columns=list(X_columns) + [COLONNA_BASE])
+
+
+def fattori_principali(riga, k=5):
+    """Le k feature con il contributo più grande in valore assoluto: lista di (feature, contributo)."""
+    contributi = riga.drop(COLONNA_BASE, errors='ignore')
+    ordine = contributi.abs().sort_values(ascending=False).index[:k]
+    return [(col, float(contributi[col])) for col in ordine]
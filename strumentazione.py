@@ -0,0 +1,185 @@
+# strumentazione.py - TIMER PER FASE, CONTATORI E TRACCE DELLE CHIAMATE (OPZIONALI)
+import json
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import nullcontext
+
+import numpy as np
+
+
+_NULLA = nullcontext()
+_FINESTRA = 10_000  # durate recenti per fase usate per i percentili
+
+
+class Strumentazione:
+    """
+    Aggrega la durata di ogni fase (template, transform, predict, grafico, ...)
+    e dei contatori. Da disattivata, fase() e chiamata() restituiscono un
+    context manager vuoto già pronto e conta() esce subito: il costo sul
+    percorso caldo è un solo controllo di un booleano.
+    Con traccia=True ogni chiamata di primo livello stampa il dettaglio delle
+    sue fasi su stderr (una riga JSON).
+    """
+
+    def __init__(self):
+        self.attiva = False
+        self.traccia = False
+        self._lock = threading.Lock()
+        self._locale = threading.local()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.durate = {}     # fase → deque delle durate recenti (s)
+            self.totali = {}     # fase → [chiamate, secondi totali, massimo]
+            self.contatori = {}
+
+    def abilita(self, traccia=False):
+        self.attiva = True
+        self.traccia = traccia
+
+    def disabilita(self):
+        self.attiva = False
+        self.traccia = False
+
+    # --- PERCORSO CALDO ---
+
+    def fase(self, nome):
+        if not self.attiva:
+            return _NULLA
+        return _Fase(self, nome)
+
+    def chiamata(self, nome):
+        """Operazione di primo livello (un'opzione di menu, un micro-batch del server)."""
+        if not self.attiva:
+            return _NULLA
+        return _Chiamata(self, nome)
+
+    def conta(self, nome, n=1):
+        if not self.attiva:
+            return
+        with self._lock:
+            self.contatori[nome] = self.contatori.get(nome, 0) + n
+
+    def _registra(self, nome, durata):
+        with self._lock:
+            if nome not in self.totali:
+                self.totali[nome] = [0, 0.0, 0.0]
+                self.durate[nome] = deque(maxlen=_FINESTRA)
+            totale = self.totali[nome]
+            totale[0] += 1
+            totale[1] += durata
+            totale[2] = max(totale[2], durata)
+            self.durate[nome].append(durata)
+        pila = getattr(self._locale, 'pila', None)
+        if pila:
+            pila[-1]['fasi'].append((nome, durata))
+
+    # --- ESPORTAZIONE ---
+
+    def riepilogo(self):
+        """Dict serializzabile: per fase chiamate, totale, media, p50/p99, massimo; contatori."""
+        with self._lock:
+            fasi = {}
+            for nome, (n, totale, massimo) in self.totali.items():
+                durate = np.fromiter(self.durate[nome], dtype=np.float64)
+                fasi[nome] = {
+                    'chiamate': n,
+                    'totale_s': totale,
+                    'media_ms': totale / n * 1000,
+                    'p50_ms': float(np.percentile(durate, 50) * 1000),
+                    'p99_ms': float(np.percentile(durate, 99) * 1000),
+                    'max_ms': massimo * 1000,
+                }
+            return {'fasi': fasi, 'contatori': dict(self.contatori)}
+
+    def esporta_json(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.riepilogo(), f, indent=2)
+
+    def formato_prometheus(self, prefisso="spotify"):
+        """Testo nel formato di esposizione Prometheus (summary per fase + contatori)."""
+        riepilogo = self.riepilogo()
+        righe = [
+            f"# HELP {prefisso}_fase_durata_secondi Durata delle fasi di predizione e visualizzazione",
+            f"# TYPE {prefisso}_fase_durata_secondi summary",
+        ]
+        for nome, stats in riepilogo['fasi'].items():
+            etichetta = f'fase="{nome}"'
+            righe.append(f'{prefisso}_fase_durata_secondi{{{etichetta},quantile="0.5"}} {stats["p50_ms"] / 1000:.9f}')
+            righe.append(f'{prefisso}_fase_durata_secondi{{{etichetta},quantile="0.99"}} {stats["p99_ms"] / 1000:.9f}')
+            righe.append(f'{prefisso}_fase_durata_secondi_sum{{{etichetta}}} {stats["totale_s"]:.9f}')
+            righe.append(f'{prefisso}_fase_durata_secondi_count{{{etichetta}}} {stats["chiamate"]}')
+        for nome, valore in riepilogo['contatori'].items():
+            righe.append(f"# TYPE {prefisso}_{nome}_total counter")
+            righe.append(f"{prefisso}_{nome}_total {valore}")
+        return "\n".join(righe) + "\n"
+
+    def esporta(self, path):
+        """JSON o Prometheus a seconda dell'estensione (.prom / .txt → Prometheus)."""
+        if path.endswith(('.prom', '.txt')):
+            with open(path, 'w') as f:
+                f.write(self.formato_prometheus())
+        else:
+            self.esporta_json(path)
+
+    def stampa(self):
+        riepilogo = self.riepilogo()
+        if not riepilogo['fasi'] and not riepilogo['contatori']:
+            return
+        print("\n" + "="*70)
+        print("⏱️  TEMPI PER FASE".center(70))
+        print("="*70)
+        print(f"  {'Fase':24s} {'chiamate':>9s} {'media ms':>10s} {'p50 ms':>10s} {'p99 ms':>10s}")
+        for nome, stats in sorted(riepilogo['fasi'].items(), key=lambda kv: -kv[1]['totale_s']):
+            print(f"  {nome:24s} {stats['chiamate']:9d} {stats['media_ms']:10.3f} "
+                  f"{stats['p50_ms']:10.3f} {stats['p99_ms']:10.3f}")
+        for nome, valore in riepilogo['contatori'].items():
+            print(f"  {nome:24s} {valore:9d}")
+        print("="*70)
+
+
+class _Fase:
+    __slots__ = ('strumentazione', 'nome', 'inizio')
+
+    def __init__(self, strumentazione, nome):
+        self.strumentazione = strumentazione
+        self.nome = nome
+
+    def __enter__(self):
+        self.inizio = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.strumentazione._registra(self.nome, time.perf_counter() - self.inizio)
+        return False
+
+
+class _Chiamata(_Fase):
+    __slots__ = ()
+
+    def __enter__(self):
+        locale = self.strumentazione._locale
+        if not hasattr(locale, 'pila'):
+            locale.pila = []
+        locale.pila.append({'chiamata': self.nome, 'fasi': []})
+        return super().__enter__()
+
+    def __exit__(self, *exc):
+        durata = time.perf_counter() - self.inizio
+        record = self.strumentazione._locale.pila.pop()
+        self.strumentazione._registra(self.nome, durata)
+        if self.strumentazione.traccia:
+            record['totale_ms'] = round(durata * 1000, 3)
+            record['fasi'] = [(nome, round(d * 1000, 3)) for nome, d in record['fasi']]
+            print(f"[trace] {json.dumps(record, ensure_ascii=False)}", file=sys.stderr)
+        return False
+
+
+# Istanza unica condivisa da utils, main e server
+STRUMENTAZIONE = Strumentazione()
+fase = STRUMENTAZIONE.fase
+chiamata = STRUMENTAZIONE.chiamata
+conta = STRUMENTAZIONE.conta
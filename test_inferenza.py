@@ -0,0 +1,117 @@
+# test_inferenza.py - PARITÀ DEL PREPROCESSOR COMPILATO CON SKLEARN
+import os
+
+import joblib
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.compose import ColumnTransformer
+from sklearn.preprocessing import OneHotEncoder, StandardScaler
+
+from inferenza import PreprocessorCompilato
+
+
+def _preprocessor_salvato():
+    if not os.path.exists("scaler_preprocessor.pkl"):
+        pytest.skip("scaler_preprocessor.pkl non presente")
+    return joblib.load("scaler_preprocessor.pkl")
+
+
+def _preprocessor_addestrato():
+    """ColumnTransformer piccolo senza drop: copre anche la variante con tutte le colonne one-hot."""
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({
+        'a': rng.normal(5, 2, 200),
+        'b': rng.integers(0, 10, 200),
+        'genere': rng.choice(['pop', 'rock', 'jazz'], 200),
+        'paese': rng.choice(['IT', 'US', 'UK', 'FR'], 200),
+    })
+    preprocessor = ColumnTransformer([
+        ('num', StandardScaler(), ['a', 'b']),
+        ('cat', OneHotEncoder(sparse_output=False), ['genere', 'paese']),
+    ])
+    return preprocessor.fit(df)
+
+
+@pytest.fixture(params=['salvato', 'addestrato'])
+def preprocessor(request):
+    return _preprocessor_salvato() if request.param == 'salvato' else _preprocessor_addestrato()
+
+
+def frame_sintetico(preprocessor, n=500, seed=0):
+    """Righe casuali: numeriche attorno a media ± 3 scale, categoriche dai categories_ dell'encoder."""
+    rng = np.random.default_rng(seed)
+    colonne = {}
+    for nome, transformer, columns in preprocessor.transformers_:
+        if nome == 'remainder' or transformer == 'drop':
+            continue
+        if hasattr(transformer, 'categories_'):
+            for col, categorie in zip(columns, transformer.categories_):
+                colonne[col] = rng.choice(categorie, n)
+        else:
+            for col, media, scala in zip(columns, transformer.mean_, transformer.scale_):
+                colonne[col] = rng.uniform(media - 3 * scala, media + 3 * scala, n)
+    return pd.DataFrame(colonne)
+
+
+def _denso(X):
+    return np.asarray(X.toarray() if hasattr(X, 'toarray') else X, dtype=np.float64)
+
+
+def test_trasforma_colonne_denso(preprocessor):
+    df = frame_sintetico(preprocessor)
+    compilato = PreprocessorCompilato.da_sklearn(preprocessor)
+    np.testing.assert_array_equal(compilato.trasforma_colonne(df, sparse=False),
+                                  _denso(preprocessor.transform(df)))
+
+
+def test_trasforma_colonne_csr(preprocessor):
+    df = frame_sintetico(preprocessor)
+    compilato = PreprocessorCompilato.da_sklearn(preprocessor)
+    X = compilato.trasforma_colonne(df, sparse=True)
+    assert X.format == 'csr'
+    np.testing.assert_array_equal(X.toarray(), _denso(preprocessor.transform(df)))
+
+
+def test_trasforma_record(preprocessor):
+    df = frame_sintetico(preprocessor, n=50)
+    compilato = PreprocessorCompilato.da_sklearn(preprocessor)
+    atteso = _denso(preprocessor.transform(df))
+    for i, record in enumerate(df.to_dict('records')):
+        np.testing.assert_array_equal(compilato.trasforma_record(record)[0], atteso[i])
+
+
+def test_categoria_sconosciuta(preprocessor):
+    df = frame_sintetico(preprocessor, n=20)
+    col = next(c for c in df.columns if df[c].dtype == object)
+    df[col] = df[col].astype(object)
+    df.loc[3, col] = '__mai_vista__'
+    compilato = PreprocessorCompilato.da_sklearn(preprocessor)
+
+    with pytest.raises(ValueError, match="unknown categor"):
+        preprocessor.transform(df)
+    with pytest.raises(ValueError, match="unknown categor"):
+        compilato.trasforma_colonne(df, sparse=False)
+    with pytest.raises(ValueError, match="unknown categor"):
+        compilato.trasforma_colonne(df, sparse=True)
+    with pytest.raises(ValueError, match="unknown categor"):
+        compilato.trasforma_record(df.iloc[3].to_dict())
+
+
+def test_categorie_numeriche():
+    # [2, 10] come stringhe è ['2', '10']: non in ordine lessicografico
+    df = pd.DataFrame({
+        'a': np.linspace(0, 1, 12),
+        'tonalita': [2, 10, 7, 2, 10, 7, 2, 10, 7, 11, 1, 1],
+    })
+    preprocessor = ColumnTransformer([
+        ('num', StandardScaler(), ['a']),
+        ('cat', OneHotEncoder(sparse_output=False), ['tonalita']),
+    ]).fit(df)
+    compilato = PreprocessorCompilato.da_sklearn(preprocessor)
+    atteso = _denso(preprocessor.transform(df))
+
+    np.testing.assert_array_equal(compilato.trasforma_colonne(df, sparse=False), atteso)
+    np.testing.assert_array_equal(compilato.trasforma_colonne(df, sparse=True).toarray(), atteso)
+    for i, record in enumerate(df.to_dict('records')):
+        np.testing.assert_array_equal(compilato.trasforma_record(record)[0], atteso[i])
@@ -0,0 +1,487 @@
+#!/usr/bin/env python3
+"""
+Addestramento su CPU di preprocessor e modelli (alternativa scriptabile a spotify_ml.ipynb).
+
+Uso:
+    python train.py --budget-minuti 120 --processi 8
+    python train.py --modelli lgbm,cat --candidati 20 --output artefatti_notte/
+
+Ricostruisce scaler_preprocessor.pkl, X_columns.pkl, rf/lgbm/cat_model.pkl,
+ensemble_pesi.json e il bundle modello.bundle/ con lo stesso schema usato da
+menu, server e scoring.
+La ricerca degli iperparametri (casuale, con early stopping su un set di
+validazione) gira in un pool di processi, ciascuno a un thread; i modelli
+finali vengono riaddestrati in parallelo con i thread rimanenti.
+Oltre il budget di tempo non parte nessun nuovo candidato e quelli in corso
+si fermano all'iterazione raggiunta.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from ensemble import EnsemblePredittore, MODELLI_FILE, PESI_PATH
+from feature_pipeline import aggiungi_feature, statistiche_globali
+
+
+TARGET = 'popularity'
+# Stesso schema degli artefatti in produzione (ordine di X_columns.pkl)
+X_COLUMNS = ['genre', 'danceability', 'energy', 'key', 'loudness', 'instrumentalness', 'country',
+             'explicit', 'release_year', 'release_month', 'duration_s', 'release_age',
+             'dance_energy_product', 'energy_x_tempo', 'high_energy_fast', 'loudness_per_sec',
+             'tempo_cat', 'label_grouped']
+COLONNE_CATEGORICHE = ['genre', 'country', 'tempo_cat', 'label_grouped']
+COLONNE_NUMERICHE = [col for col in X_COLUMNS if col not in COLONNE_CATEGORICHE]
+
+MAX_ITERAZIONI = 3000       # tetto per LightGBM/CatBoost, di solito fermati prima dall'early stopping
+PAZIENZA_BOOSTING = 50      # iterazioni senza miglioramento sulla validazione
+MAX_ALBERI_RF = 600
+PASSO_ALBERI_RF = 50        # alberi aggiunti a ogni passo del Random Forest
+QUOTA_RICERCA = 0.7         # frazione del budget riservata alla ricerca
+
+# Punto di partenza: gli iperparametri del notebook (usati anche se la ricerca non conclude nulla)
+PARAMETRI_NOTEBOOK = {
+    'rf': {'max_depth': 12, 'max_features': 0.7, 'min_samples_leaf': 1},
+    'lgbm': {'learning_rate': 0.05, 'num_leaves': 40, 'subsample': 0.8, 'colsample_bytree': 0.8,
+             'min_child_samples': 20, 'reg_lambda': 0.0},
+    'cat': {'depth': 7, 'learning_rate': 0.05, 'l2_leaf_reg': 3.0},
+}
+ITERAZIONI_NOTEBOOK = {'rf': 300, 'lgbm': 300, 'cat': 300}
+
+# Spazi di ricerca: lista = scelta uniforme, ('log', a, b) = log-uniforme, ('uniforme', a, b)
+SPAZI_RICERCA = {
+    'rf': {
+        'max_depth': [8, 10, 12, 16, 20, None],
+        'max_features': [0.3, 0.5, 0.7, 1.0],
+        'min_samples_leaf': [1, 2, 5, 10, 20],
+    },
+    'lgbm': {
+        'learning_rate': ('log', 0.01, 0.2),
+        'num_leaves': [15, 31, 40, 63, 127, 255],
+        'subsample': ('uniforme', 0.6, 1.0),
+        'colsample_bytree': ('uniforme', 0.5, 1.0),
+        'min_child_samples': [5, 10, 20, 50, 100],
+        'reg_lambda': ('log', 1e-3, 10.0),
+    },
+    'cat': {
+        'depth': [4, 5, 6, 7, 8, 10],
+        'learning_rate': ('log', 0.01, 0.2),
+        'l2_leaf_reg': ('log', 1.0, 30.0),
+    },
+}
+
+# --- DATI ---
+
+def prepara_dati(path, seed=42):
+    """
+    Stessa preparazione del notebook: feature derivate da feature_pipeline,
+    split 80/20 (random_state=42), poi il 10% del training come validazione
+    per l'early stopping.
+    """
+    from sklearn.model_selection import train_test_split
+
+    df = pd.read_csv(path)
+    df['release_date'] = pd.to_datetime(df['release_date'])
+    df = aggiungi_feature(df, X_COLUMNS, statistiche_globali(df))
+
+    X = df[X_COLUMNS]
+    y = df[TARGET].to_numpy(dtype=np.float64)
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+    X_train, X_val, y_train, y_val = train_test_split(X_train, y_train, test_size=0.1, random_state=seed)
+    return X_train, X_val, X_test, y_train, y_val, y_test
+
+
+def costruisci_preprocessor():
+    from sklearn.compose import ColumnTransformer
+    from sklearn.preprocessing import StandardScaler, OneHotEncoder
+    return ColumnTransformer([
+        ('num', StandardScaler(), COLONNE_NUMERICHE),
+        ('cat', OneHotEncoder(drop='first', sparse_output=False), COLONNE_CATEGORICHE),
+    ])
+
+
+# --- CANDIDATI ---
+
+def estrai_candidato(spazio, rng):
+    parametri = {}
+    for nome, dominio in spazio.items():
+        if isinstance(dominio, tuple):
+            tipo, basso, alto = dominio
+            if tipo == 'log':
+                valore = float(np.exp(rng.uniform(np.log(basso), np.log(alto))))
+            else:
+                valore = float(rng.uniform(basso, alto))
+        else:
+            valore = dominio[rng.integers(len(dominio))]
+            valore = valore.item() if hasattr(valore, 'item') else valore
+        parametri[nome] = valore
+    return parametri
+
+
+def genera_candidati(modelli, n_per_modello, seed):
+    """Parametri del notebook + n-1 estrazioni casuali per modello, alternati tra i modelli."""
+    rng = np.random.default_rng(seed)
+    per_modello = {
+        nome: [dict(PARAMETRI_NOTEBOOK[nome])] +
+              [estrai_candidato(SPAZI_RICERCA[nome], rng) for _ in range(max(n_per_modello - 1, 0))]
+        for nome in modelli
+    }
+    candidati = []
+    for i in range(max(len(lista) for lista in per_modello.values())):
+        for nome in modelli:
+            if i < len(per_modello[nome]):
+                candidati.append((nome, per_modello[nome][i]))
+    return candidati
+
+
+# --- ADDESTRAMENTO DI UN MODELLO (NEI WORKER) ---
+
+class _ScadenzaCatBoost:
+    """Callback CatBoost: interrompe l'addestramento oltre la scadenza."""
+
+    def __init__(self, scadenza):
+        self.scadenza = scadenza
+
+    def after_iteration(self, info):
+        return time.time() < self.scadenza
+
+
+def _scadenza_lgbm(scadenza):
+    import lightgbm as lgb
+
+    def callback(env):
+        if time.time() >= scadenza:
+            raise lgb.callback.EarlyStopException(env.iteration, env.evaluation_result_list)
+    callback.order = 40  # dopo l'early stopping standard
+    return callback
+
+
+def _rmse(y, pred):
+    return float(np.sqrt(np.mean((np.asarray(pred, dtype=np.float64) - y) ** 2)))
+
+
+def _adatta_rf(parametri, X, y, X_val, y_val, n_alberi, scadenza, seed, n_thread):
+    """
+    Random Forest a passi di PASSO_ALBERI_RF alberi (warm_start): con un set
+    di validazione si ferma quando altri alberi non migliorano più l'RMSE.
+    """
+    from sklearn.ensemble import RandomForestRegressor
+    modello = RandomForestRegressor(n_estimators=0, warm_start=True, random_state=seed,
+                                    n_jobs=n_thread, **parametri)
+    somma_val = np.zeros(len(y_val)) if X_val is not None else None
+    migliore, alberi_migliori, senza_miglioramento = np.inf, 0, 0
+    interrotto = False
+
+    while modello.n_estimators < n_alberi:
+        if time.time() >= scadenza and modello.n_estimators > 0:
+            interrotto = True
+            break
+        precedenti = modello.n_estimators
+        modello.set_params(n_estimators=min(precedenti + PASSO_ALBERI_RF, n_alberi))
+        modello.fit(X, y)
+        if somma_val is None:
+            continue
+        # La predizione del forest è la media degli alberi: si sommano solo quelli nuovi
+        for albero in modello.estimators_[precedenti:]:
+            somma_val += albero.predict(X_val)
+        rmse = _rmse(y_val, somma_val / modello.n_estimators)
+        if rmse < migliore * (1 - 1e-3):
+            migliore, alberi_migliori, senza_miglioramento = rmse, modello.n_estimators, 0
+        else:
+            senza_miglioramento += 1
+            if senza_miglioramento >= 2:
+                break
+
+    if somma_val is not None and alberi_migliori and alberi_migliori < modello.n_estimators:
+        del modello.estimators_[alberi_migliori:]
+        modello.n_estimators = alberi_migliori
+    modello.set_params(warm_start=False)
+    return modello, modello.n_estimators, interrotto
+
+
+def adatta_modello(nome, parametri, X, y, X_val=None, y_val=None, iterazioni=None,
+                   scadenza=float('inf'), seed=42, n_thread=1):
+    """
+    Addestra un modello su CPU. Con X_val/y_val usa l'early stopping;
+    senza, addestra esattamente `iterazioni` alberi/iterazioni.
+    Restituisce (modello, iterazioni effettive, interrotto per il budget).
+    """
+    if nome == 'rf':
+        return _adatta_rf(parametri, X, y, X_val, y_val, iterazioni or MAX_ALBERI_RF,
+                          scadenza, seed, n_thread)
+
+    if nome == 'lgbm':
+        import lightgbm as lgb
+        modello = lgb.LGBMRegressor(n_estimators=iterazioni or MAX_ITERAZIONI, subsample_freq=1,
+                                    random_state=seed, n_jobs=n_thread, verbose=-1, **parametri)
+        callbacks = [_scadenza_lgbm(scadenza)]
+        kwargs = {}
+        if X_val is not None:
+            callbacks.append(lgb.early_stopping(PAZIENZA_BOOSTING, verbose=False))
+            kwargs['eval_set'] = [(X_val, y_val)]
+        modello.fit(X, y, callbacks=callbacks, **kwargs)
+        iterazioni_fatte = modello.best_iteration_ or modello.booster_.current_iteration()
+        return modello, iterazioni_fatte, time.time() >= scadenza
+
+    if nome == 'cat':
+        from catboost import CatBoostRegressor
+        modello = CatBoostRegressor(iterations=iterazioni or MAX_ITERAZIONI, loss_function='RMSE',
+                                    task_type='CPU', thread_count=n_thread, random_seed=seed,
+                                    verbose=0, allow_writing_files=False, **parametri)
+        kwargs = {}
+        if X_val is not None:
+            kwargs = {'eval_set': (X_val, y_val), 'early_stopping_rounds': PAZIENZA_BOOSTING,
+                      'use_best_model': True}
+        modello.fit(X, y, callbacks=[_ScadenzaCatBoost(scadenza)], **kwargs)
+        return modello, modello.tree_count_, time.time() >= scadenza
+
+    raise ValueError(f"Modello sconosciuto: {nome} (validi: {', '.join(MODELLI_FILE)})")
+
+
+_DATI_WORKER = None
+
+
+def _inizializza_worker(dati):
+    global _DATI_WORKER
+    _DATI_WORKER = dati
+
+
+def _valuta_candidato(nome, parametri, scadenza, seed):
+    X, y, X_val, y_val = (_DATI_WORKER[k] for k in ('X_ricerca', 'y_ricerca', 'X_val', 'y_val'))
+    inizio = time.perf_counter()
+    modello, iterazioni, interrotto = adatta_modello(nome, parametri, X, y, X_val, y_val,
+                                                     scadenza=scadenza, seed=seed)
+    return {
+        'modello': nome,
+        'parametri': parametri,
+        'rmse_val': _rmse(y_val, modello.predict(X_val)),
+        'iterazioni': int(iterazioni),
+        'secondi': time.perf_counter() - inizio,
+        'interrotto': bool(interrotto),
+    }
+
+
+def _addestra_finale(nome, parametri, iterazioni, scadenza, seed, n_thread, path):
+    """Riaddestra su training + validazione con le iterazioni trovate e salva su path."""
+    import joblib
+    d = _DATI_WORKER
+    X = np.vstack([d['X_train'], d['X_val']])
+    y = np.concatenate([d['y_train'], d['y_val']])
+    inizio = time.perf_counter()
+    modello, iterazioni, interrotto = adatta_modello(nome, parametri, X, y, iterazioni=iterazioni,
+                                                     scadenza=scadenza, seed=seed, n_thread=n_thread)
+    joblib.dump(modello, path)
+    pred = np.asarray(modello.predict(d['X_test']), dtype=np.float64)
+    return {
+        'modello': nome,
+        'iterazioni': int(iterazioni),
+        'secondi': time.perf_counter() - inizio,
+        'interrotto': bool(interrotto),
+        'rmse_test': _rmse(d['y_test'], pred),
+        'r2_test': float(1 - np.sum((d['y_test'] - pred) ** 2) / np.sum((d['y_test'] - d['y_test'].mean()) ** 2)),
+        'mae_test': float(np.mean(np.abs(d['y_test'] - pred))),
+    }
+
+
+# --- PIPELINE ---
+
+def ricerca_iperparametri(pool, modelli, n_candidati, scadenza, n_processi, seed):
+    """
+    Valuta i candidati nel pool, al più 2 per processo in volo.
+    Dopo la scadenza non ne parte nessun altro.
+    """
+    candidati = genera_candidati(modelli, n_candidati, seed)
+    print(f"\n🔍 Ricerca: {len(candidati)} candidati su {n_processi} processo/i")
+    risultati, in_corso = [], {}
+    prossimo, saltati = 0, 0
+
+    while prossimo < len(candidati) or in_corso:
+        while prossimo < len(candidati) and len(in_corso) < 2 * n_processi:
+            if time.time() >= scadenza:
+                saltati = len(candidati) - prossimo
+                prossimo = len(candidati)
+                break
+            nome, parametri = candidati[prossimo]
+            in_corso[pool.submit(_valuta_candidato, nome, parametri, scadenza, seed)] = nome
+            prossimo += 1
+        if not in_corso:
+            break
+        futuro = next(as_completed(in_corso))
+        nome = in_corso.pop(futuro)
+        try:
+            risultato = futuro.result()
+        except Exception as e:
+            print(f"   ⚠️  Candidato {nome} fallito: {e}")
+            continue
+        risultati.append(risultato)
+        segno = "⏱️ " if risultato['interrotto'] else "✅"
+        print(f"   {segno} {nome:5s} RMSE val {risultato['rmse_val']:7.3f}  "
+              f"{risultato['iterazioni']:5d} it.  {risultato['secondi']:6.1f}s  {risultato['parametri']}")
+
+    if saltati:
+        print(f"   ⏱️  Budget della ricerca esaurito: {saltati} candidati non valutati")
+    return risultati
+
+
+def migliori_parametri(risultati, modelli):
+    migliori = {}
+    for nome in modelli:
+        propri = [r for r in risultati if r['modello'] == nome]
+        if propri:
+            migliore = min(propri, key=lambda r: r['rmse_val'])
+            migliori[nome] = (migliore['parametri'], migliore['iterazioni'], migliore['rmse_val'])
+        else:
+            print(f"   ⚠️  Nessun candidato concluso per {nome}: parametri del notebook")
+            migliori[nome] = (dict(PARAMETRI_NOTEBOOK[nome]), ITERAZIONI_NOTEBOOK[nome], None)
+    return migliori
+
+
+def addestra(dataset="spotify_clean.csv", output=".", modelli=("rf", "lgbm", "cat"),
+             n_candidati=12, n_processi=None, budget_minuti=120.0,
+             max_righe_ricerca=200_000, seed=42):
+    import joblib
+    from sklearn.model_selection import train_test_split
+
+    inizio = time.time()
+    scadenza_finale = inizio + budget_minuti * 60
+    scadenza_ricerca = inizio + budget_minuti * 60 * QUOTA_RICERCA
+    n_processi = n_processi or os.cpu_count() or 1
+    modelli = list(modelli)
+    os.makedirs(output, exist_ok=True)
+
+    print("="*70)
+    print(f"🏋️  ADDESTRAMENTO SU CPU - {', '.join(modelli)}  (budget {budget_minuti:g} min)")
+    print("="*70)
+
+    X_train, X_val, X_test, y_train, y_val, y_test = prepara_dati(dataset, seed=seed)
+    print(f"✅ Dati: {len(X_train):,} training, {len(X_val):,} validazione, {len(X_test):,} test")
+
+    preprocessor = costruisci_preprocessor()
+    X_train_pre = preprocessor.fit_transform(X_train)
+    X_val_pre = preprocessor.transform(X_val)
+    X_test_pre = preprocessor.transform(X_test)
+    print(f"✅ Preprocessor: {X_train_pre.shape[1]} colonne di input ai modelli")
+
+    # La ricerca confronta i candidati su un sottoinsieme: il modello finale usa tutto il training
+    if len(X_train_pre) > max_righe_ricerca:
+        X_ricerca, _, y_ricerca, _ = train_test_split(X_train_pre, y_train, train_size=max_righe_ricerca,
+                                                      random_state=seed)
+    else:
+        X_ricerca, y_ricerca = X_train_pre, y_train
+
+    dati = {'X_ricerca': X_ricerca, 'y_ricerca': y_ricerca, 'X_train': X_train_pre, 'y_train': y_train,
+            'X_val': X_val_pre, 'y_val': y_val, 'X_test': X_test_pre, 'y_test': y_test}
+    provvisori = {nome: os.path.join(output, f".{MODELLI_FILE[nome]}.tmp") for nome in modelli}
+
+    with ProcessPoolExecutor(max_workers=n_processi, initializer=_inizializza_worker,
+                             initargs=(dati,)) as pool:
+        risultati = ricerca_iperparametri(pool, modelli, n_candidati, scadenza_ricerca, n_processi, seed)
+        migliori = migliori_parametri(risultati, modelli)
+
+        # Modelli finali in parallelo, ciascuno con una parte dei core
+        thread_per_modello = max(1, n_processi // len(modelli))
+        print(f"\n🏗️  Modelli finali su training + validazione ({thread_per_modello} thread ciascuno)")
+        futuri = {
+            pool.submit(_addestra_finale, nome, parametri, iterazioni, scadenza_finale, seed,
+                        thread_per_modello, provvisori[nome]): nome
+            for nome, (parametri, iterazioni, _) in migliori.items()
+        }
+        finali = {}
+        for futuro in as_completed(futuri):
+            r = futuro.result()
+            finali[r['modello']] = r
+            segno = "⏱️ " if r['interrotto'] else "✅"
+            print(f"   {segno} {r['modello']:5s} RMSE test {r['rmse_test']:7.3f}  R² {r['r2_test']:.3f}  "
+                  f"MAE {r['mae_test']:.3f}  ({r['iterazioni']} it., {r['secondi']:.1f}s)")
+
+    # Pesi dell'ensemble sullo stesso hold-out di ensemble.py (metà stima, metà valutazione)
+    ensemble = EnsemblePredittore({nome: joblib.load(path) for nome, path in provvisori.items()})
+    X_pesi, X_eval, y_pesi, y_eval = train_test_split(X_test_pre, y_test, test_size=0.5, random_state=42)
+    metodo = "stacking" if len(modelli) > 1 else "media"
+    ensemble.adatta_pesi(X_pesi, y_pesi, metodo=metodo)
+    rmse_ensemble = _rmse(y_eval, ensemble.predict(X_eval))
+    print(f"\n🧩 Pesi ensemble ({metodo}): {ensemble.pesi}  RMSE {rmse_ensemble:.3f}")
+
+    # Pubblicazione: gli artefatti vengono sostituiti solo a addestramento concluso
+    joblib.dump(preprocessor, os.path.join(output, ".scaler_preprocessor.pkl.tmp"))
+    joblib.dump(X_COLUMNS, os.path.join(output, ".X_columns.pkl.tmp"))
+    ensemble.salva_pesi(os.path.join(output, f".{PESI_PATH}.tmp"))
+    for nome in ["scaler_preprocessor.pkl", "X_columns.pkl", PESI_PATH] + [MODELLI_FILE[m] for m in modelli]:
+        os.replace(os.path.join(output, f".{nome}.tmp"), os.path.join(output, nome))
+
+    # Stessi artefatti anche come bundle versionato (formati nativi, checksum)
+    from bundle import crea_bundle, BUNDLE_PATH
+    from profilo import DatasetProfile, firma_file
+    from campionatore import CampionatoreCopula, CAMPIONATORE_PATH
+    df = pd.read_csv(dataset)
+    profilo = DatasetProfile.da_dataframe(df, sorgente=firma_file(dataset))
+    # Campionatore delle tracce sintetiche, adattato sullo stesso dataset dei modelli
+    campionatore = CampionatoreCopula.adatta(df, X_COLUMNS, sorgente=firma_file(dataset))
+    campionatore.salva(os.path.join(output, CAMPIONATORE_PATH))
+    manifest = crea_bundle(os.path.join(output, BUNDLE_PATH), preprocessor, X_COLUMNS, ensemble.modelli,
+                           profilo=profilo, pesi={'pesi': ensemble.pesi, 'intercetta': ensemble.intercetta},
+                           campionatore=campionatore)
+
+    # Un preprocessor compilato già esportato va rigenerato, altrimenti resta quello vecchio
+    from inferenza import PreprocessorCompilato, COMPILATO_PATH
+    path_compilato = os.path.join(output, COMPILATO_PATH)
+    if os.path.exists(path_compilato):
+        PreprocessorCompilato.da_sklearn(preprocessor).salva(path_compilato)
+
+    report = {
+        'data': time.strftime("%Y-%m-%dT%H:%M:%S"),
+        'dataset': dataset,
+        'righe': {'training': len(X_train), 'validazione': len(X_val), 'test': len(X_test),
+                  'ricerca': len(X_ricerca)},
+        'processi': n_processi,
+        'budget_minuti': budget_minuti,
+        'durata_s': time.time() - inizio,
+        'seed': seed,
+        'ricerca': risultati,
+        'migliori': {nome: {'parametri': p, 'iterazioni': it, 'rmse_val': r}
+                     for nome, (p, it, r) in migliori.items()},
+        'finali': finali,
+        'ensemble': {'pesi': ensemble.pesi, 'intercetta': ensemble.intercetta, 'rmse': rmse_ensemble},
+        'bundle': manifest['versione'],
+    }
+    with open(os.path.join(output, "training_report.json"), 'w') as f:
+        json.dump(report, f, indent=2)
+
+    print(f"\n🏁 Addestramento concluso in {(time.time() - inizio) / 60:.1f} min")
+    print(f"💾 Artefatti salvati in {os.path.abspath(output)} (dettagli in training_report.json)")
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Addestra preprocessor e modelli su CPU")
+    parser.add_argument("--dataset", default="spotify_clean.csv")
+    parser.add_argument("--output", default=".", metavar="CARTELLA",
+                        help="Cartella degli artefatti (default: quella corrente)")
+    parser.add_argument("--modelli", default="rf,lgbm,cat", help="Sottoinsieme di rf,lgbm,cat")
+    parser.add_argument("--candidati", type=int, default=12,
+                        help="Configurazioni provate per modello, inclusa quella del notebook (default 12)")
+    parser.add_argument("--processi", type=int, default=None,
+                        help="Processi del pool (default: numero di core)")
+    parser.add_argument("--budget-minuti", type=float, default=120.0,
+                        help=f"Tempo massimo complessivo; il {QUOTA_RICERCA * 100:.0f}%% va alla ricerca (default 120)")
+    parser.add_argument("--max-righe-ricerca", type=int, default=200_000,
+                        help="Righe di training usate per confrontare i candidati (default 200000)")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    modelli = [m.strip() for m in args.modelli.split(',') if m.strip()]
+    sconosciuti = [m for m in modelli if m not in MODELLI_FILE]
+    if sconosciuti:
+        parser.error(f"Modelli sconosciuti: {', '.join(sconosciuti)} (validi: {', '.join(MODELLI_FILE)})")
+    if not os.path.exists(args.dataset):
+        print(f"❌ Dataset non trovato: {args.dataset}")
+        sys.exit(1)
+
+    addestra(args.dataset, args.output, modelli, n_candidati=max(1, args.candidati),
+             n_processi=args.processi, budget_minuti=args.budget_minuti,
+             max_righe_ricerca=args.max_righe_ricerca, seed=args.seed)
@@ -1,14 +1,30 @@
 # utils.py - VERSIONE ADATTIVA
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
-import random
-from IPython.display import display
+
+from avvio import ArtefattoLazy
+from profilo import DatasetProfile
+from inferenza import compila
+from indice_hit import indice_hit
+from spiegazioni import spiega, fattori_principali
+from campionatore import campionatore_attivo
+from strumentazione import fase, conta, chiamata
+from rendering import RENDERER, mostra, mostra_animazione
+from feature_pipeline import (
+    aggiungi_feature, calcola_feature, dipendenze_base, statistiche_da_profilo
+)
 
 
-def get_available_columns(df):
+def get_available_columns(df, profilo=None):
     """Restituisce un dizionario con le colonne disponibili nel dataset."""
+    if profilo is not None:
+        return profilo.colonne_disponibili()
     return {
         'numerical': df.select_dtypes(include=[np.number]).columns.tolist(),
         'categorical': df.select_dtypes(include=['object', 'category']).columns.tolist(),
@@ -30,13 +46,17 @@ def get_valid_input(prompt, min_val, max_val):
             raise
 
 
-def crea_input_da_colonne_disponibili(df, user_inputs):
+def crea_input_da_colonne_disponibili(df, user_inputs, profilo=None):
     """
     Crea un dizionario di input usando solo le colonne disponibili nel dataset.
     user_inputs: dict con i valori forniti dall'utente
+    profilo: DatasetProfile opzionale, evita di ricalcolare media/mediana/moda su df
     """
+    if profilo is None:
+        profilo = DatasetProfile.da_dataframe(df)
+    
     input_dict = {}
-    available = get_available_columns(df)
+    available = profilo.colonne_disponibili()
     
     # Liste di colonne comuni che potrebbero essere presenti
     numeric_cols = [
@@ -51,28 +71,107 @@ def crea_input_da_colonne_disponibili(df, user_inputs):
     
     # Aggiungi valori numerici
     for col in numeric_cols:
-        if col in df.columns:
+        if col in profilo.colonne:
             if col in user_inputs:
                 # Usa valore fornito dall'utente
                 input_dict[col] = user_inputs[col]
             else:
-                # Usa media/mediana del dataset
-                if df[col].dtype in ['int64', 'int32', 'uint8', 'uint16']:
-                    input_dict[col] = int(df[col].median())
-                else:
-                    input_dict[col] = float(df[col].mean())
+                # Usa media/mediana del dataset (precalcolata nel profilo)
+                input_dict[col] = profilo.centrali[col]
     
     # Aggiungi colonne categoriche con valore più frequente
     for col in available['categorical']:
-        mode_val = df[col].mode()
-        if len(mode_val) > 0:
-            input_dict[col] = str(mode_val[0])
-        else:
-            input_dict[col] = 'Unknown'
+        input_dict[col] = profilo.mode.get(col, 'Unknown')
     
     return input_dict
 
 
+def valore_default(col, profilo):
+    """Valore di riempimento per una colonna: media/mediana, moda o 0."""
+    if profilo is not None:
+        if col in profilo.centrali:
+            return profilo.centrali[col]
+        if col in profilo.mode:
+            return profilo.mode[col]
+    return 0
+
+
+def tracce_da_record(records, X_columns, profilo=None):
+    """Costruisce il DataFrame di input da una lista di dict (una traccia per dict)."""
+    return prepara_tracce(pd.DataFrame.from_records(records), X_columns, profilo)
+
+
+def valida_record(records, preprocessor, profilo=None):
+    """
+    Controlla le tracce in ingresso (server) prima di accodarle: ogni traccia
+    è un dict, i campi numerici sono numeri (o null → default del profilo),
+    quelli categorici valori semplici. ValueError con traccia e campo sbagliati.
+    """
+    compilato = compila(preprocessor)
+    numeriche = set(compilato.colonne_num) | (set(profilo.numeriche) if profilo is not None else set())
+    for i, record in enumerate(records):
+        if not isinstance(record, dict):
+            raise ValueError(f"traccia {i}: serve un oggetto JSON, ricevuto {type(record).__name__}")
+        for col, valore in record.items():
+            if valore is None:
+                continue
+            if col in numeriche:
+                if not isinstance(valore, (int, float)):
+                    raise ValueError(f"traccia {i}, campo '{col}': serve un numero, ricevuto {valore!r}")
+            elif isinstance(valore, (dict, list)):
+                raise ValueError(f"traccia {i}, campo '{col}': serve un valore semplice, ricevuto {valore!r}")
+
+
+def categorie_sconosciute_a_moda(df_tracce, preprocessor, profilo=None):
+    """
+    Il OneHotEncoder salvato rifiuta categorie mai viste: quelle
+    fuori dai vocabolari dell'encoder vengono sostituite (e contate) con la moda
+    del dataset di training, se il profilo la conosce e l'encoder la accetta,
+    altrimenti con la prima categoria dell'encoder.
+    """
+    compilato = compila(preprocessor)
+    sostituite = 0
+    if compilato.ignora_sconosciute:
+        return sostituite
+    for col, vocabolario in zip(compilato.colonne_cat, compilato.vocabolari):
+        if col not in df_tracce.columns:
+            continue
+        valori = df_tracce[col].astype(str)
+        sconosciute = ~valori.isin(vocabolario).to_numpy()
+        if sconosciute.any():
+            moda = profilo.mode.get(col) if profilo is not None else None
+            valori = valori.to_numpy(dtype=object)
+            valori[sconosciute] = moda if moda is not None and moda in vocabolario else vocabolario[0]
+            df_tracce[col] = valori
+            sostituite += int(sconosciute.sum())
+    return sostituite
+
+
+def prepara_tracce(df_tracce, X_columns, profilo=None):
+    """
+    Completa df_tracce (in place) con i default del profilo per le colonne
+    assenti o nulle, poi ricalcola le feature derivate che dipendono dai
+    campi forniti. Restituisce le sole X_columns, nell'ordine del modello.
+    """
+    forniti = set(df_tracce.columns)
+    
+    with fase('preparazione'):
+        # X_columns + colonne di base delle feature derivate (es. tempo)
+        necessarie = list(X_columns) + sorted(dipendenze_base(X_columns) - set(X_columns))
+        for col in necessarie:
+            if col not in X_columns and (profilo is None or col not in profilo.colonne):
+                continue
+            if col not in df_tracce.columns:
+                df_tracce[col] = valore_default(col, profilo)
+            elif df_tracce[col].isna().any():
+                df_tracce[col] = df_tracce[col].fillna(valore_default(col, profilo))
+        
+        aggiungi_feature(df_tracce, X_columns, statistiche_da_profilo(profilo), modificate=forniti)
+        
+        # Riordina secondo X_columns
+        return df_tracce[X_columns]
+
+
 def fix_categorical_types(df_input, df_original, preprocessor):
     """
     Assicura che le colonne categoriche abbiano i tipi corretti per il preprocessor.
@@ -99,8 +198,87 @@ def fix_categorical_types(df_input, df_original, preprocessor):
     return df_input
 
 
-def predici_popolarita_interattiva(df, X_columns, preprocessor, final_system):
-    """Predice la popolarità di una traccia basandosi su input utente."""
+def costruisci_input(df, X_columns, user_inputs, profilo=None, modalita_template='casuale', rng=None):
+    """
+    Record di input del modello (dict colonna → valore) a partire dal template
+    scelto e dai valori utente, con le feature derivate ricalcolate.
+    rng: np.random.Generator per il template 'casuale' (None = non riproducibile).
+    """
+    # Template: USA SOLO COLONNE DISPONIBILI, più le colonne di base
+    # da cui derivano le feature (es. tempo)
+    colonne_base = [col for col in dipendenze_base(X_columns) if col in df.columns]
+    X_columns_available = [col for col in X_columns if col in df.columns]
+    colonne_template = sorted(set(X_columns_available) | set(colonne_base))
+    if modalita_template == 'profilo' and profilo is not None:
+        template = {col: valore_default(col, profilo) for col in colonne_template}
+    else:
+        if modalita_template == 'casuale':
+            rng = np.random.default_rng() if rng is None else rng
+            idx = rng.integers(len(df))
+        else:
+            idx = int(modalita_template) % len(df)
+        template = {col: df[col].iat[idx] for col in colonne_template}
+    
+    # Sostituisci con i valori utente
+    for col, val in user_inputs.items():
+        if col in template:
+            template[col] = val
+    
+    # Ricalcola le feature derivate che dipendono dai valori utente
+    # (stesse formule del training, via feature_pipeline)
+    derivate = calcola_feature(
+        {col: np.array([val]) for col, val in template.items()}, X_columns,
+        statistiche_da_profilo(profilo), modificate=user_inputs.keys()
+    )
+    for col, valori in derivate.items():
+        template[col] = valori[0]
+    
+    # Se X_columns ha colonne extra non nel dataset, aggiungile con 0
+    for col in X_columns:
+        template.setdefault(col, 0)
+    
+    return template
+
+
+def varia_template(template, variazioni, X_columns, profilo=None):
+    """
+    Batch colonnare di tracce uguali al template tranne le colonne in
+    `variazioni` (dict colonna → array, tutti della stessa lunghezza), con le
+    feature derivate che ne dipendono ricalcolate in modo vettoriale.
+    Le colonne costanti restano viste di un solo elemento, senza copie.
+    """
+    n = len(next(iter(variazioni.values())))
+    colonne = {col: np.broadcast_to(np.asarray([val]), (n,))
+               for col, val in template.items() if col not in variazioni}
+    colonne.update(variazioni)
+    colonne.update(calcola_feature(colonne, X_columns, statistiche_da_profilo(profilo),
+                                   modificate=variazioni.keys()))
+    return colonne
+
+
+def predici_da_input(df, X_columns, preprocessor, final_system, user_inputs, profilo=None,
+                     modalita_template='casuale', rng=None, con_template=False):
+    """
+    Nucleo della predizione interattiva, senza input né stampe: popolarità in [0, 100].
+    con_template=True → (popolarità, record di input usato), per spiegarla dopo.
+    """
+    with fase('template'):
+        template = costruisci_input(df, X_columns, user_inputs, profilo, modalita_template, rng)
+    with fase('transform'):
+        X = compila(preprocessor).trasforma_record(template)
+    with fase('predict'):
+        pred = float(np.clip(final_system.predict(X)[0], 0, 100))
+    return (pred, template) if con_template else pred
+
+
+def predici_popolarita_interattiva(df, X_columns, preprocessor, final_system, profilo=None,
+                                   modalita_template='casuale', rng=None):
+    """
+    Predice la popolarità di una traccia basandosi su input utente.
+    modalita_template: 'casuale' (riga casuale del dataset), 'profilo'
+    (media/mediana/moda del dataset) oppure l'indice di una riga fissa.
+    Con 'profilo' o una riga fissa la stessa terna dà sempre la stessa predizione.
+    """
     print("\n🎵 Predizione popolarità Spotify 🎵")
     
     # Filtra X_columns per includere solo colonne presenti nel dataset
@@ -111,7 +289,7 @@ def predici_popolarita_interattiva(df, X_columns, preprocessor, final_system):
         print(f"{missing} colonne non trovate nel dataset (verranno ignorate)")
     
     # Mostra colonne disponibili
-    available = get_available_columns(df)
+    available = get_available_columns(df, profilo)
     print(f"Dataset ha {len(available['numerical'])} colonne numeriche e {len(available['categorical'])} categoriche")
     
     # Input utente con validazione
@@ -134,13 +312,6 @@ def predici_popolarita_interattiva(df, X_columns, preprocessor, final_system):
                 "Inserisci loudness (dB, -60 a 5): ", -60, 5
             )
         
-        # Calcola feature derivate se esistono nel dataset
-        if 'danceability' in user_inputs and 'energy' in user_inputs:
-            if 'dance_energy_product' in df.columns:
-                user_inputs['dance_energy_product'] = user_inputs['danceability'] * user_inputs['energy']
-            if 'dance_energy_ratio' in df.columns:
-                user_inputs['dance_energy_ratio'] = user_inputs['danceability'] / (user_inputs['energy'] + 1e-5)
-        
     except KeyboardInterrupt:
         print("\nOperazione annullata.")
         return
@@ -149,161 +320,286 @@ def predici_popolarita_interattiva(df, X_columns, preprocessor, final_system):
         return
     
     # STRATEGIA: Usa una riga del dataset come template
-    try:
-        print("\n Creazione input basato su template del dataset...")
-        
-        # Prendi una riga casuale come template (USA SOLO COLONNE DISPONIBILI)
-        template = df.sample(1)[X_columns_available].copy().reset_index(drop=True)
-        
-        # Sostituisci con i valori utente
-        for col, val in user_inputs.items():
-            if col in template.columns:
-                template.loc[0, col] = val
-        
-        # Se X_columns ha colonne extra non nel dataset, aggiungile con 0
-        for col in X_columns:
-            if col not in template.columns:
-                template[col] = 0
-        
-        # Riordina secondo X_columns
-        template = template[X_columns]
-        
-        print(" Input creato")
-        
-        # Trasforma e predici
-        print(" Trasformazione dati...")
-        df_input_pre = preprocessor.transform(template)
+    template = None
+    with chiamata('predizione_interattiva'):
+        try:
+            print("\n Creazione input basato su template del dataset e predizione...")
         
-        print(" Predizione...")
-        pred = final_system.predict(df_input_pre)[0]
-        pred = max(0, min(100, pred))
+            # Stesso nucleo misurato da benchmark.py (percorso compilato, niente DataFrame)
+            pred, template = predici_da_input(df, X_columns, preprocessor, final_system, user_inputs,
+                                              profilo, modalita_template, rng, con_template=True)
         
-        print(f"\n Predizione popolarità stimata: {pred:.2f}/100")
+            print(f"\n Predizione popolarità stimata: {pred:.2f}/100")
+            if hasattr(final_system, 'statistiche_cache'):
+                stats = final_system.statistiche_cache()
+                print(f" Cache predizioni: {stats['hit'] + stats['hit_disco']} hit / {stats['miss']} miss")
         
-        # Feedback qualitativo
-        if pred >= 80:
-            print(" Potenziale HIT!")
-        elif pred >= 60:
-            print(" Buone possibilità di successo")
-        elif pred >= 40:
-            print(" Popolarità media")
-        else:
-            print(" Probabile bassa popolarità")
+            # Feedback qualitativo
+            if pred >= 80:
+                print(" Potenziale HIT!")
+            elif pred >= 60:
+                print(" Buone possibilità di successo")
+            elif pred >= 40:
+                print(" Popolarità media")
+            else:
+                print(" Probabile bassa popolarità")
             
-    except Exception as e:
-        print(f"\n Errore durante la predizione: {e}")
-        print("\n Suggerimenti:")
-        print("   1. Esegui: python fix_columns.py")
-        print("   2. Oppure rigenera i file .pkl da ml.ipynb")
-        import traceback
-        traceback.print_exc()
+        except Exception as e:
+            template = None
+            print(f"\n Errore durante la predizione: {e}")
+            print("\n Suggerimenti:")
+            print("   1. Esegui: python fix_columns.py")
+            print("   2. Oppure rigenera i file .pkl da ml.ipynb")
+            import traceback
+            traceback.print_exc()
+    
+    # Spiegazione solo su richiesta: costa molto più di una predizione (soprattutto se in cache)
+    if template is not None and input("\nMostrare i fattori principali della predizione? (s/N): ").strip().lower() == 's':
+        spiega_predizione(template, X_columns, preprocessor, final_system)
+
+
+def spiega_predizione(template, X_columns, preprocessor, final_system, k=5):
+    """Stampa i k fattori principali di una predizione; un errore qui non tocca la predizione già mostrata."""
+    with chiamata('spiegazione_interattiva'):
+        try:
+            contributi = spiega_batch(pd.DataFrame([template]), X_columns, preprocessor, final_system)
+            riga = contributi.iloc[0]
+            print(f"\n Fattori principali (valore medio del modello {riga['valore_base']:.1f}):")
+            for col, valore in fattori_principali(riga, k):
+                print(f"   {col:<22} {valore:+7.2f}")
+        except Exception as e:
+            print(f"\n Spiegazione non disponibile: {e}")
 
 
-def paesi_hit(df, soglia_hit=80):
-    """Mostra i top 10 paesi con più hit."""
+def paesi_hit(df, soglia_hit=80, chiavi=('country',)):
+    """
+    Mostra i top 10 paesi con più hit.
+    chiavi: raggruppamento alternativo o aggiuntivo (es. ('country', 'genre')).
+    """
     if 'popularity' not in df.columns:
         print(" Colonna 'popularity' non trovata nel dataset")
         return
     
-    if 'country' not in df.columns:
-        print(" Colonna 'country' non trovata nel dataset")
+    mancanti = [col for col in chiavi if col not in df.columns]
+    if mancanti:
+        print(f" Colonne {mancanti} non trovate nel dataset")
         # Prova con altre colonne simili
         possible_cols = [col for col in df.columns if 'country' in col.lower() or 'nation' in col.lower()]
-        if possible_cols:
+        if 'country' in mancanti and possible_cols:
             print(f" Trovate colonne alternative: {possible_cols}")
         return
     
-    hits = df[df['popularity'] >= soglia_hit]
+    # Indice per gruppo costruito alla prima chiamata: le soglie successive non riscandiscono il dataset
+    with fase('indice_hit'):
+        top_paesi = indice_hit(df, chiavi).top_k(soglia_hit, k=10)
     
-    if len(hits) == 0:
+    if len(top_paesi) == 0:
         print(f"  Nessuna traccia trovata con popolarità >= {soglia_hit}")
         max_pop = df['popularity'].max()
         print(f" Popolarità massima nel dataset: {max_pop:.2f}")
         return
     
-    top_paesi = hits['country'].value_counts().head(10)
+    if len(chiavi) > 1:
+        top_paesi.index = [' / '.join(map(str, gruppo)) for gruppo in top_paesi.index]
+    nome_gruppi = "Paesi" if tuple(chiavi) == ('country',) else ' + '.join(chiavi)
     
-    print(f"\n Top 10 Paesi con più hit (pop >= {soglia_hit}):")
+    print(f"\n Top 10 {nome_gruppi} con più hit (pop >= {soglia_hit}):")
     for i, (paese, count) in enumerate(top_paesi.items(), 1):
-        print(f"  {i:2d}. {paese:20s}: {count:4d} tracce")
-    
-    # Grafico
-    plt.figure(figsize=(10, 6))
-    sns.barplot(x=top_paesi.values, y=top_paesi.index, palette='viridis')
-    plt.title(f"Top 10 Paesi per hit Spotify (pop >= {soglia_hit})")
-    plt.xlabel("Numero di hit")
-    plt.ylabel("Paese")
-    plt.tight_layout()
-    plt.show()
+        print(f"  {i:2d}. {str(paese):20s}: {count:4d} tracce")
+    
+    # Grafico (stack grafico importato solo qui: avvio rapido senza plot)
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    
+    with fase('grafico'):
+        plt.figure(figsize=(10, 6))
+        sns.barplot(x=top_paesi.values, y=top_paesi.index, palette='viridis')
+        plt.title(f"Top 10 {nome_gruppi} per hit Spotify (pop >= {soglia_hit})")
+        plt.xlabel("Numero di hit")
+        plt.ylabel("Paese" if nome_gruppi == "Paesi" else nome_gruppi)
+        plt.tight_layout()
+    mostra(plt.gcf(), f"paesi_hit_{soglia_hit}")
 
 
-def genera_traccia_casuale(df, X_columns):
-    """Genera una traccia con valori casuali basati sul dataset - USA TEMPLATE."""
-    
+_TIPI_INTERI = [np.int32, np.int64, np.uint8, np.uint16, np.uint32]
+_TIPI_NUMERICI = [np.float32, np.float64] + _TIPI_INTERI
+BLOCCO_GENERAZIONE = 100_000  # righe per flusso casuale indipendente
+
+
+def calcola_limiti_numerici(df, colonne):
+    """Precalcola min/max delle colonne numeriche, una sola volta per tutte le tracce."""
+    limiti = {}
+    for col in colonne:
+        if col in df.columns and df[col].dtype in _TIPI_NUMERICI:
+            limiti[col] = (df[col].min(), df[col].max())
+    return limiti
+
+
+def genera_tracce_batch(df, X_columns, n, profilo=None, rng=None, campionatore=None, n_processi=1):
+    """
+    Genera N tracce casuali in un unico DataFrame.
+    Con un campionatore (campionatore.py; None = quello attivo, False = nessuno)
+    le colonne di base vengono estratte congiuntamente e le feature derivate
+    ricalcolate. Senza: le righe template vengono campionate in blocco e le
+    colonne numeriche sostituite con estrazioni uniformi indipendenti tra i
+    limiti del profilo.
+    Oltre BLOCCO_GENERAZIONE righe ogni blocco ha il suo flusso casuale
+    (rng.spawn) e i blocchi possono andare su n_processi processi: a parità di
+    seed le tracce sono le stesse con qualsiasi numero di processi.
+    """
+    with fase('generazione'):
+        rng = np.random.default_rng() if rng is None else rng
+        if campionatore is None:
+            campionatore = campionatore_attivo()
+        if n <= BLOCCO_GENERAZIONE:
+            return _genera_blocco(df, X_columns, n, profilo, rng, campionatore)
+
+        blocchi = [min(BLOCCO_GENERAZIONE, n - da) for da in range(0, n, BLOCCO_GENERAZIONE)]
+        flussi = rng.spawn(len(blocchi))
+        if isinstance(campionatore, ArtefattoLazy):
+            campionatore = campionatore.carica()
+        if n_processi <= 1:
+            parti = [_genera_blocco(df, X_columns, m, profilo, flusso, campionatore)
+                     for m, flusso in zip(blocchi, flussi)]
+        else:
+            # Il dataset serve ai worker solo senza campionatore
+            with ProcessPoolExecutor(max_workers=n_processi, initializer=_inizializza_generatore,
+                                     initargs=(None if campionatore else df, X_columns, profilo,
+                                               campionatore)) as pool:
+                parti = list(pool.map(_genera_nel_worker, blocchi, flussi))
+        return pd.concat(parti, ignore_index=True)
+
+
+_GENERATORE_WORKER = {}
+
+
+def _inizializza_generatore(df, X_columns, profilo, campionatore):
+    _GENERATORE_WORKER.update(df=df, X_columns=X_columns, profilo=profilo, campionatore=campionatore)
+
+
+def _genera_nel_worker(n, rng):
+    w = _GENERATORE_WORKER
+    return _genera_blocco(w['df'], w['X_columns'], n, w['profilo'], rng, w['campionatore'])
+
+
+def _genera_blocco(df, X_columns, n, profilo, rng, campionatore):
+    if campionatore:
+        return prepara_tracce(campionatore.campiona(n, rng), X_columns, profilo)
+    return _genera_tracce_batch(df, X_columns, n, profilo, rng)
+
+
+def _genera_tracce_batch(df, X_columns, n, profilo, rng):
     # Filtra X_columns per includere solo colonne presenti nel dataset
     X_columns_available = [col for col in X_columns if col in df.columns]
     
-    # STRATEGIA: Prendi una riga esistente e modifica solo i valori numerici
-    template = df.sample(1)[X_columns_available].copy().reset_index(drop=True)
+    if profilo is not None:
+        limiti = profilo.limiti
+    else:
+        limiti = calcola_limiti_numerici(df, X_columns_available)
+    
+    # STRATEGIA: Prendi N righe esistenti e modifica solo i valori numerici
+    idx = rng.integers(0, len(df), size=n)
+    tracce = df[X_columns_available].iloc[idx].reset_index(drop=True)
     
-    # Modifica solo le colonne numeriche
-    for col in template.columns:
-        if template[col].dtype in [np.float32, np.float64, np.int32, np.int64, 
-                                    np.uint8, np.uint16, np.uint32]:
-            col_min = df[col].min() if col in df.columns else 0
-            col_max = df[col].max() if col in df.columns else 1
+    # Modifica solo le colonne numeriche, una colonna intera alla volta
+    for col in tracce.columns:
+        if tracce[col].dtype in _TIPI_NUMERICI:
+            col_min, col_max = limiti.get(col, (0, 1))
             
-            if template[col].dtype in [np.int32, np.int64, np.uint8, np.uint16, np.uint32]:
-                template.loc[0, col] = random.randint(int(col_min), int(col_max))
+            if tracce[col].dtype in _TIPI_INTERI:
+                valori = rng.integers(int(col_min), int(col_max), size=n, endpoint=True)
             else:
-                template.loc[0, col] = random.uniform(col_min, col_max)
+                valori = rng.uniform(col_min, col_max, size=n)
+            tracce[col] = valori.astype(tracce[col].dtype)
     
     # Aggiungi colonne mancanti con 0 se necessario
     for col in X_columns:
-        if col not in template.columns:
-            template[col] = 0
+        if col not in tracce.columns:
+            tracce[col] = 0
     
     # Riordina secondo X_columns
-    template = template[X_columns]
-    
-    return template
+    return tracce[X_columns]
+
+
+def genera_traccia_casuale(df, X_columns, profilo=None, rng=None):
+    """Genera una traccia con valori casuali basati sul dataset - USA TEMPLATE."""
+    return genera_tracce_batch(df, X_columns, 1, profilo=profilo, rng=rng)
+
+
+def predici_batch(df_tracce, preprocessor, final_system):
+    """Una sola transform e una sola predict per tutto il batch, predizioni in [0, 100]."""
+    with fase('transform'):
+        df_tracce_pre = preprocessor.transform(df_tracce)
+    with fase('predict'):
+        preds = final_system.predict(df_tracce_pre)
+    conta('tracce_predette', len(df_tracce))
+    return np.clip(preds, 0, 100)
+
+
+def spiega_batch(df_tracce, X_columns, preprocessor, final_system, dimensione_blocco=10_000):
+    """
+    Contributi di ogni feature alla predizione di ogni traccia (DataFrame
+    tracce × X_columns + valore_base), con i percorsi nativi dei modelli ad alberi.
+    """
+    with fase('spiegazione'):
+        contributi = spiega(df_tracce, X_columns, preprocessor, final_system, dimensione_blocco)
+    conta('tracce_spiegate', len(df_tracce))
+    return contributi
 
 
-def generatore_hit(df, X_columns, preprocessor, final_system, n=1):
-    """Genera N tracce casuali e predice la loro popolarità."""
-    if n < 1 or n > 100:
-        print("  Genera tra 1 e 100 tracce")
+def _predici_tollerante(df_tracce, preprocessor, final_system, max_predict=256):
+    """
+    predici_batch su tutto il blocco; se fallisce, lo divide a metà finché le
+    tracce non valide restano isolate (NaN), con poche predict in più.
+    Oltre max_predict tentativi (errore non legato alle singole tracce) i
+    blocchi ancora da dividere vengono scartati interi.
+    Restituisce (predizioni, primo errore incontrato o None).
+    """
+    preds = np.full(len(df_tracce), np.nan)
+    errore = None
+    blocchi = [(0, len(df_tracce))]
+    tentativi = 0
+    while blocchi:
+        inizio, fine = blocchi.pop()
+        if tentativi >= max_predict:
+            continue
+        tentativi += 1
+        try:
+            preds[inizio:fine] = predici_batch(df_tracce.iloc[inizio:fine], preprocessor, final_system)
+        except Exception as e:
+            errore = errore or e
+            if fine - inizio > 1:
+                meta = (inizio + fine) // 2
+                blocchi += [(meta, fine), (inizio, meta)]
+    return preds, errore
+
+
+def generatore_hit(df, X_columns, preprocessor, final_system, n=1, profilo=None, rng=None, n_processi=1):
+    """Genera N tracce casuali e predice la loro popolarità in un unico batch."""
+    if n < 1:
+        print("  Genera almeno 1 traccia")
         return
     
     print(f"\n Generazione di {n} tracce casuali...")
     
-    tracce = []
-    preds = []
-    errors = 0
-    
-    for i in range(n):
-        try:
-            df_traccia = genera_traccia_casuale(df, X_columns)
-            df_traccia_pre = preprocessor.transform(df_traccia)
-            pred = final_system.predict(df_traccia_pre)[0]
-            pred = max(0, min(100, pred))
-            preds.append(pred)
-            tracce.append(df_traccia)
-        except Exception as e:
-            errors += 1
-            if errors <= 3:  # Mostra solo i primi 3 errori
-                print(f"⚠️  Errore traccia {i+1}: {e}")
-            continue
-    
-    if not tracce:
+    try:
+        df_tracce = genera_tracce_batch(df, X_columns, n, profilo=profilo, rng=rng, n_processi=n_processi)
+    except Exception as e:
+        print(f"⚠️  Errore durante la generazione: {e}")
         print(" Nessuna traccia generata con successo")
         return
     
-    success_rate = len(tracce) / n * 100
-    print(f"\n {len(tracce)}/{n} tracce generate con successo ({success_rate:.1f}%)")
+    # Una traccia non valida scarta solo se stessa, non l'intero batch
+    preds, errore = _predici_tollerante(df_tracce, preprocessor, final_system)
+    valide = ~np.isnan(preds)
+    if not valide.all():
+        print(f"⚠️  {int((~valide).sum())} tracce scartate per errore nella predizione: {errore}")
+        df_tracce, preds = df_tracce[valide].reset_index(drop=True), preds[valide]
+    if len(preds) == 0:
+        print(" Nessuna traccia generata con successo")
+        return
     
-    if errors > 0:
-        print(f"  {errors} errori durante la generazione")
+    print(f"\n {len(preds)}/{n} tracce generate con successo")
     
     # Statistiche
     print(f"\nStatistiche popolarità:")
@@ -313,71 +609,102 @@ def generatore_hit(df, X_columns, preprocessor, final_system, n=1):
     print(f"  • Dev.Std:  {np.std(preds):.2f}")
     
     # Conta hit potenziali
-    hits = sum(1 for p in preds if p >= 80)
+    hits = int((preds >= 80).sum())
     print(f"  • Hit potenziali (≥80): {hits} ({hits/len(preds)*100:.1f}%)")
     
     # Mostra solo le prime tracce
-    df_preds = pd.concat(tracce, ignore_index=True)
-    df_preds['predicted_popularity'] = preds
+    display_limit = min(10, len(df_tracce))
+    df_preds = df_tracce.head(display_limit).copy()
+    df_preds['predicted_popularity'] = preds[:display_limit]
     
-    display_limit = min(10, len(df_preds))
     print(f"\n Prime {display_limit} tracce:")
-    display(df_preds.head(display_limit)[['predicted_popularity'] + df_preds.columns[:5].tolist()])
-    
-    # Grafico
-    plt.figure(figsize=(10, 6))
-    sns.histplot(preds, bins=20, kde=True, color='orange', edgecolor='black')
-    plt.axvline(np.mean(preds), color='red', linestyle='--', linewidth=2, label=f'Media: {np.mean(preds):.2f}')
-    plt.axvline(80, color='green', linestyle=':', linewidth=2, label='Soglia Hit (80)')
-    plt.title(f"Distribuzione Popolarità di {len(preds)} Tracce Generate")
-    plt.xlabel("Popolarità stimata")
-    plt.ylabel("Conteggio")
-    plt.legend()
-    plt.grid(axis='y', alpha=0.3)
-    plt.tight_layout()
-    plt.show()
+    from IPython.display import display
+    display(df_preds[['predicted_popularity'] + df_preds.columns[:5].tolist()])
+    
+    # Grafico (la KDE su milioni di punti è lenta: solo per batch piccoli)
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    
+    with fase('grafico'):
+        plt.figure(figsize=(10, 6))
+        sns.histplot(preds, bins=20, kde=len(preds) <= 10_000, color='orange', edgecolor='black')
+        plt.axvline(np.mean(preds), color='red', linestyle='--', linewidth=2, label=f'Media: {np.mean(preds):.2f}')
+        plt.axvline(80, color='green', linestyle=':', linewidth=2, label='Soglia Hit (80)')
+        plt.title(f"Distribuzione Popolarità di {len(preds)} Tracce Generate")
+        plt.xlabel("Popolarità stimata")
+        plt.ylabel("Conteggio")
+        plt.legend()
+        plt.grid(axis='y', alpha=0.3)
+        plt.tight_layout()
+    mostra(plt.gcf(), f"generatore_hit_{len(preds)}")
     
 
 
-from matplotlib.animation import FuncAnimation
+def produci_tracce(coda, stop, df, X_columns, preprocessor, final_system, n_tracce=None,
+                   profilo=None, dimensione_batch=256, rng=None):
+    """
+    Produttore: genera e valuta le tracce a batch (una transform e una predict
+    per batch) e le mette in coda una per volta come (pred, energy, danceability).
+    n_tracce=None → continua finché stop non viene impostato.
+    La coda è limitata: se il consumatore è lento, il produttore aspetta.
+    """
+    rng = np.random.default_rng() if rng is None else rng
+    prodotte = 0
+    try:
+        while not stop.is_set() and (n_tracce is None or prodotte < n_tracce):
+            n = dimensione_batch if n_tracce is None else min(dimensione_batch, n_tracce - prodotte)
+            df_tracce = genera_tracce_batch(df, X_columns, n, profilo=profilo, rng=rng)
+            preds = predici_batch(df_tracce, preprocessor, final_system)
+            energy = df_tracce['energy'].to_numpy() if 'energy' in df_tracce.columns else np.full(n, 0.5)
+            dance = df_tracce['danceability'].to_numpy() if 'danceability' in df_tracce.columns else np.full(n, 0.5)
+            for traccia in zip(preds.tolist(), energy.tolist(), dance.tolist()):
+                while not stop.is_set():
+                    try:
+                        coda.put(traccia, timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+            prodotte += n
+    except Exception as e:
+        coda.put(e)
+        return
+    coda.put(None)  # fine della produzione
 
-def visualizza_predizioni_animate(df, X_columns, preprocessor, final_system, n_tracce=50):
+
+def visualizza_predizioni_animate(df, X_columns, preprocessor, final_system, n_tracce=50, profilo=None,
+                                  dimensione_batch=256, finestra=100, rng=None):
     """
     Genera tracce casuali, predice la popolarità e crea un'animazione 
     che mostra le predizioni in tempo reale.
+    Le tracce arrivano da un thread produttore attraverso una coda: il primo
+    frame compare subito. n_tracce=None → monitor continuo (fino alla chiusura
+    della finestra) del flusso di predizioni, con il throughput del modello.
     """
-    print(f"\n Generazione di {n_tracce} tracce e visualizzazione animata...")
-    
-    # --- GENERA TRACCE E PREDIZIONI ---
-    tracce_data = []
-    
-    for i in range(n_tracce):
-        try:
-            df_traccia = genera_traccia_casuale(df, X_columns)
-            df_traccia_pre = preprocessor.transform(df_traccia)
-            pred = final_system.predict(df_traccia_pre)[0]
-            pred = max(0, min(100, pred))
-            
-            # Estrai alcune feature per la visualizzazione
-            energy = df_traccia['energy'].iloc[0] if 'energy' in df_traccia.columns else 0.5
-            danceability = df_traccia['danceability'].iloc[0] if 'danceability' in df_traccia.columns else 0.5
-            
-            tracce_data.append({
-                'pred': pred,
-                'energy': energy,
-                'danceability': danceability,
-                'index': i
-            })
-        except Exception:
-            continue
-    
-    if not tracce_data:
-        print(" Errore nella generazione delle tracce")
-        return
-    
-    print(f" {len(tracce_data)} tracce generate con successo!")
+    live = n_tracce is None
+    if live and RENDERER.headless:
+        print(" Il monitor continuo richiede una finestra: in modalità headless uso 100 tracce")
+        n_tracce, live = 100, False
+    if live:
+        print(f"\n Monitor continuo delle predizioni (chiudi la finestra per terminare)...")
+    else:
+        print(f"\n Generazione di {n_tracce} tracce e visualizzazione animata...")
+    
+    # --- PRODUTTORE IN BACKGROUND ---
+    coda = queue.Queue(maxsize=4 * dimensione_batch)
+    stop = threading.Event()
+    # Il produttore ha un flusso figlio tutto suo: un Generator non va condiviso tra thread
+    flusso = (np.random.default_rng() if rng is None else rng).spawn(1)[0]
+    produttore = threading.Thread(
+        target=produci_tracce, name="produttore-tracce", daemon=True,
+        args=(coda, stop, df, X_columns, preprocessor, final_system, n_tracce, profilo, dimensione_batch, flusso),
+    )
+    inizio = time.perf_counter()
+    produttore.start()
     
     # --- SETUP ANIMAZIONE ---
+    import matplotlib.pyplot as plt
+    from matplotlib.animation import FuncAnimation
+    
     fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(12, 8))
     
     # Grafico 1: Barra di popolarità che cresce
@@ -397,10 +724,13 @@ def visualizza_predizioni_animate(df, X_columns, preprocessor, final_system, n_t
     text_info = ax1.text(50, 0.7, '', ha='center', va='center', fontsize=10, 
                          bbox=dict(boxstyle='round', facecolor='wheat', alpha=0.5))
     
-    # Grafico 2: Storia delle predizioni (linea che si forma)
-    ax2.set_xlim(0, n_tracce)
+    # Grafico 2: Storia delle predizioni (linea che si forma).
+    # In modalità continua: finestra scorrevole sulle ultime `finestra` tracce,
+    # con assi fissi (compatibile con il blitting)
+    ampiezza_asse = finestra if live else n_tracce
+    ax2.set_xlim(0, ampiezza_asse)
     ax2.set_ylim(0, 100)
-    ax2.set_xlabel('Traccia #', fontsize=12)
+    ax2.set_xlabel(f'Ultime {finestra} tracce' if live else 'Traccia #', fontsize=12)
     ax2.set_ylabel('Popolarità', fontsize=12)
     ax2.set_title(' Andamento Predizioni', fontsize=12, fontweight='bold')
     ax2.grid(True, alpha=0.3)
@@ -410,19 +740,44 @@ def visualizza_predizioni_animate(df, X_columns, preprocessor, final_system, n_t
     scatter_hits = ax2.scatter([], [], c='red', s=100, marker='*', zorder=5, label='Hit!')
     ax2.legend()
     
-    # Dati per l'animazione
-    x_data, y_data = [], []
-    hit_x, hit_y = [], []
+    # Stato del consumatore: storico (limitato in modalità continua) e aggregati
+    storico = deque(maxlen=finestra if live else None)
+    stats = {'n': 0, 'somma': 0.0, 'hit': 0, 'min': 100.0, 'max': 0.0, 'fine': False, 'errore': None}
+    
+    def consuma(massimo, attesa=None):
+        """Preleva fino a `massimo` tracce dalla coda (attesa=None: senza bloccare)."""
+        ultima = None
+        for i in range(massimo):
+            if stats['fine']:
+                break
+            try:
+                elemento = coda.get(timeout=attesa) if (attesa and i == 0) else coda.get_nowait()
+            except queue.Empty:
+                break
+            if elemento is None or isinstance(elemento, Exception):
+                stats['fine'] = True
+                stats['errore'] = elemento
+                break
+            pred = elemento[0]
+            storico.append(pred)
+            stats['n'] += 1
+            stats['somma'] += pred
+            stats['hit'] += pred >= 80
+            stats['min'] = min(stats['min'], pred)
+            stats['max'] = max(stats['max'], pred)
+            ultima = elemento
+        return ultima
     
     # --- FUNZIONE DI AGGIORNAMENTO ---
+    # Con blit vengono ridisegnati solo gli artisti restituiti, non l'intera figura
     def update(frame):
-        if frame >= len(tracce_data):
-            return bar, line, scatter_hits, text_info
+        # Una traccia per frame; in modalità continua tutto ciò che è arrivato.
+        # Nel salvataggio headless ogni frame aspetta la propria traccia
+        ultima = consuma(coda.maxsize if live else 1, attesa=30 if RENDERER.headless else None)
+        if ultima is None:
+            return bar[0], line, scatter_hits, text_info
         
-        traccia = tracce_data[frame]
-        pred = traccia['pred']
-        energy = traccia['energy']
-        dance = traccia['danceability']
+        pred, energy, dance = ultima
         
         # Aggiorna barra di popolarità
         bar[0].set_width(pred)
@@ -442,40 +797,68 @@ def visualizza_predizioni_animate(df, X_columns, preprocessor, final_system, n_t
             emoji = '💤'
         
         # Aggiorna testo
-        text_info.set_text(f'{emoji} Traccia #{frame+1}\nPop: {pred:.1f} | Energy: {energy:.2f} | Dance: {dance:.2f}')
+        testo = f'{emoji} Traccia #{stats["n"]}\nPop: {pred:.1f} | Energy: {energy:.2f} | Dance: {dance:.2f}'
+        if live:
+            testo += f'\n{stats["n"] / (time.perf_counter() - inizio):,.0f} tracce/s'
+        text_info.set_text(testo)
         
         # Aggiorna linea storico
-        x_data.append(frame)
-        y_data.append(pred)
+        y_data = np.fromiter(storico, dtype=np.float64, count=len(storico))
+        x_data = np.arange(len(y_data))
         line.set_data(x_data, y_data)
         
         # Segna gli hit
-        if pred >= 80:
-            hit_x.append(frame)
-            hit_y.append(pred)
-            scatter_hits.set_offsets(np.c_[hit_x, hit_y])
+        hit = y_data >= 80
+        scatter_hits.set_offsets(np.c_[x_data[hit], y_data[hit]])
         
-        return bar, line, scatter_hits, text_info
+        return bar[0], line, scatter_hits, text_info
+    
+    def init():
+        # Senza init_func FuncAnimation userebbe update(0), consumando una traccia
+        return bar[0], line, scatter_hits, text_info
     
     # --- CREA E MOSTRA ANIMAZIONE ---
-    ani = FuncAnimation(fig, update, frames=len(tracce_data), interval=100, 
-                       blit=False, repeat=False)
+    # frames=None: frame indefiniti (monitor), con save_count a limitare la cache dei frame;
+    # con range(n_tracce) la lunghezza è già nota e save_count verrebbe ignorato (con warning)
+    frames = {'frames': None, 'save_count': finestra} if live else {'frames': range(n_tracce)}
+    ani = FuncAnimation(fig, update, init_func=init, interval=100, blit=True, repeat=False, **frames)
     
     plt.tight_layout()
-    plt.show()
-    
-    # --- STATISTICHE FINALI ---
-    preds = [t['pred'] for t in tracce_data]
-    hits = sum(1 for p in preds if p >= 80)
     
-    print(f"\n STATISTICHE FINALI:")
-    print(f"   • Tracce analizzate: {len(tracce_data)}")
-    print(f"   • Popolarità media: {np.mean(preds):.2f}")
-    print(f"   • Hit potenziali (≥80): {hits} ({hits/len(preds)*100:.1f}%)")
-    print(f"   • Range: {np.min(preds):.1f} - {np.max(preds):.1f}")
+    def concludi():
+        stop.set()
+        # Finestra chiusa prima della fine: conteggia anche le tracce già prodotte
+        if not live:
+            produttore.join()
+            consuma(coda.qsize() + 1)
+        
+        if stats['errore'] is not None:
+            print(f" Errore nella generazione delle tracce: {stats['errore']}")
+        
+        # --- STATISTICHE FINALI ---
+        if stats['n'] == 0:
+            print(" Errore nella generazione delle tracce")
+            return
+        
+        print(f"\n STATISTICHE FINALI:")
+        print(f"   • Tracce analizzate: {stats['n']}")
+        print(f"   • Popolarità media: {stats['somma'] / stats['n']:.2f}")
+        print(f"   • Hit potenziali (≥80): {stats['hit']} ({stats['hit'] / stats['n'] * 100:.1f}%)")
+        print(f"   • Range: {stats['min']:.1f} - {stats['max']:.1f}")
+        if live:
+            print(f"   • Throughput: {stats['n'] / (time.perf_counter() - inizio):,.0f} tracce/s")
+    
+    mostra_animazione(ani, fig, "predizioni_animate", fps=10)
+    if RENDERER.headless:
+        # Il salvataggio consuma le tracce frame per frame in background: le
+        # statistiche vanno in coda dopo di lui, senza bloccare il menu
+        # (main attende il thread di rendering solo all'uscita)
+        RENDERER.accoda(concludi)
+        return
+    concludi()
 
 
-def visualizza_onda_sonora_da_predizione(df, X_columns, preprocessor, final_system):
+def visualizza_onda_sonora_da_predizione(df, X_columns, preprocessor, final_system, profilo=None, rng=None):
     """
     Genera una traccia casuale, predice la popolarità e crea un'onda sonora
     la cui ampiezza e frequenza sono influenzate dalla predizione.
@@ -484,10 +867,8 @@ def visualizza_onda_sonora_da_predizione(df, X_columns, preprocessor, final_syst
     
     # --- GENERA TRACCIA E PREDICI ---
     try:
-        df_traccia = genera_traccia_casuale(df, X_columns)
-        df_traccia_pre = preprocessor.transform(df_traccia)
-        pred = final_system.predict(df_traccia_pre)[0]
-        pred = max(0, min(100, pred))
+        df_traccia = genera_traccia_casuale(df, X_columns, profilo=profilo, rng=rng)
+        pred = predici_batch(df_traccia, preprocessor, final_system)[0]
         
         # Estrai feature
         energy = df_traccia['energy'].iloc[0] if 'energy' in df_traccia.columns else 0.5
@@ -523,6 +904,9 @@ def visualizza_onda_sonora_da_predizione(df, X_columns, preprocessor, final_syst
     print(f"   • Armoniche: {n_armoniche} (da danceability)")
     
     # --- SETUP GRAFICO ---
+    import matplotlib.pyplot as plt
+    from matplotlib.animation import FuncAnimation
+    
     fig, ax = plt.subplots(figsize=(12, 6))
     t = np.linspace(0, 4 * np.pi, 300)
     line, = ax.plot(t, np.sin(t), color='red', linewidth=2)
@@ -550,23 +934,24 @@ def visualizza_onda_sonora_da_predizione(df, X_columns, preprocessor, final_syst
            ha='center', va='top', fontsize=10,
            bbox=dict(boxstyle='round', facecolor='white', alpha=0.8))
     
+    # --- ONDA PRECALCOLATA ---
+    # Tutti i frame in un'unica matrice (frame × punti): armoniche con ampiezza
+    # decrescente sommate in modo vettoriale, nessun calcolo durante l'animazione
+    n_frame = 150
+    armoniche = np.arange(1, n_armoniche + 1)[:, None, None]
+    fasi = velocita * np.arange(n_frame)[None, :, None]
+    onde = (ampiezza / armoniche * np.sin(frequenza * armoniche * t[None, None, :] + fasi)).sum(axis=0)
+    
     # --- FUNZIONE ANIMAZIONE ---
     def update(frame):
-        # Crea onda complessa con armoniche
-        onda = np.zeros_like(t)
-        for i in range(1, n_armoniche + 1):
-            # Ogni armonica con ampiezza decrescente
-            amp_armonica = ampiezza / i
-            onda += amp_armonica * np.sin(frequenza * i * t + velocita * frame)
-        
-        line.set_ydata(onda)
+        line.set_ydata(onde[frame])
         return line,
     
     # --- CREA ANIMAZIONE ---
-    ani = FuncAnimation(fig, update, frames=150, interval=50, blit=True)
+    ani = FuncAnimation(fig, update, frames=n_frame, interval=50, blit=True)
     
     plt.tight_layout()
-    plt.show()
+    mostra_animazione(ani, fig, "onda_sonora", fps=20)
     
     # Feedback finale
     if pred >= 80: